@@ -1,8 +1,9 @@
 # ai_interface.py - AI-Powered Natural Language Terminal
 import re
 import json
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Iterator
 from terminal import PythonTerminal
+from stream_output import write_stream
 
 class AITerminalInterface:
     """AI-driven terminal that interprets natural language commands"""
@@ -319,6 +320,11 @@ class AITerminalInterface:
         output, return_code = self.terminal.execute_command(command)
         return output, return_code, interpretation
     
+    def stream_natural_language(self, natural_language: str) -> Tuple[Iterator[str], str]:
+        """Interpret natural language and return an output chunk iterator and the interpretation"""
+        command, interpretation = self.interpret_command(natural_language)
+        return self.terminal.execute_command_stream(command), interpretation
+    
     def get_suggestions(self, partial_input: str) -> List[str]:
         """Get natural language suggestions based on partial input"""
         suggestions = []
@@ -427,19 +433,15 @@ class AITerminalCLI:
                 
                 # Execute command
                 if self.use_ai:
-                    output, return_code, interpretation = self.ai_terminal.execute_natural_language(user_input)
+                    chunks, interpretation = self.ai_terminal.stream_natural_language(user_input)
                     if interpretation != "No AI interpretation found, executing as-is":
                         print(f"✓ {interpretation}")
-                    if output and output != "EXIT_TERMINAL":
-                        print(output)
-                    if output == "EXIT_TERMINAL":
-                        break
                 else:
-                    output, return_code = self.ai_terminal.terminal.execute_command(user_input)
-                    if output and output != "EXIT_TERMINAL":
-                        print(output)
-                    if output == "EXIT_TERMINAL":
-                        break
+                    chunks = self.ai_terminal.terminal.execute_command_stream(user_input)
+                
+                write_stream(chunks)
+                if self.ai_terminal.terminal.exit_requested:
+                    break
             
             except KeyboardInterrupt:
                 print("\n^C")
@@ -0,0 +1,121 @@
+# batch_interface.py - Non-interactive Script Execution
+"""Run command lines from scripts, a string or stdin through one terminal.
+
+Nothing is prompted for or written to the readline history: command
+output goes straight to stdout and, once each script finishes, a summary
+of its failures and elapsed time goes to stderr. Blank lines and lines
+starting with '#' are skipped.
+"""
+import sys
+import time
+from typing import Iterable, List, Optional, TextIO, Tuple
+
+from stream_output import write_stream
+from terminal import PythonTerminal
+
+# Failures listed individually in a script summary
+MAX_LISTED_FAILURES = 20
+
+
+class ScriptResult:
+    """Outcome of running one script"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.commands = 0
+        self.failures: List[Tuple[int, str, int]] = []  # (line number, command, return code)
+        self.elapsed = 0.0
+        self.exited = False
+
+    def summary(self) -> str:
+        lines = [f"{self.name}: {self.commands} commands, {len(self.failures)} failed in {self.elapsed:.2f}s"]
+        for number, command, code in self.failures[:MAX_LISTED_FAILURES]:
+            lines.append(f"  line {number}: {command} (exit {code})")
+        if len(self.failures) > MAX_LISTED_FAILURES:
+            lines.append(f"  ... and {len(self.failures) - MAX_LISTED_FAILURES} more")
+        return '\n'.join(lines)
+
+
+class BatchInterface:
+    """Runs scripts one after another in a single terminal session"""
+
+    def __init__(self, terminal: Optional[PythonTerminal] = None, stop_on_error: bool = False,
+                 output: Optional[TextIO] = None):
+        self.terminal = terminal or PythonTerminal()
+        self.terminal.record_history = False
+        self.stop_on_error = stop_on_error
+        self.output = output or sys.stdout
+
+    def run_lines(self, lines: Iterable[str], name: str) -> ScriptResult:
+        """Run each command line in turn, collecting the failures"""
+        result = ScriptResult(name)
+        start = time.perf_counter()
+
+        for number, line in enumerate(lines, 1):
+            command = line.strip()
+            if not command or command.startswith('#'):
+                continue
+
+            result.commands += 1
+            chunks = self.terminal.execute_command_stream(command)
+            write_stream(chunks, self.output, flush=False)
+            if self.terminal.exit_requested:
+                result.exited = True
+                break
+
+            code = self.terminal.last_return_code
+            if code != 0:
+                result.failures.append((number, command, code))
+                if self.stop_on_error:
+                    break
+
+        self.output.flush()
+        result.elapsed = time.perf_counter() - start
+        return result
+
+    def run_file(self, path: str) -> ScriptResult:
+        """Run a script file, or stdin when path is '-'"""
+        if path == '-':
+            return self.run_lines(sys.stdin, '<stdin>')
+        with open(path, encoding='utf-8', errors='replace') as script:
+            return self.run_lines(script, path)
+
+
+def main(scripts: List[str], command: Optional[str] = None, stop_on_error: bool = False,
+         timeout: Optional[float] = None) -> int:
+    """Run a -c command or the given scripts (stdin if none); 1 if anything failed"""
+    terminal = PythonTerminal() if timeout is None else PythonTerminal(command_timeout=timeout or None)
+    batch = BatchInterface(terminal, stop_on_error=stop_on_error)
+
+    results = []
+    failed = False
+    start = time.perf_counter()
+    if command is not None:
+        results.append(batch.run_lines(command.splitlines(), '-c'))
+    else:
+        for path in scripts or ['-']:
+            try:
+                result = batch.run_file(path)
+            except OSError as e:
+                print(f"{path}: {e.strerror}", file=sys.stderr)
+                failed = True
+                if stop_on_error:
+                    break
+                continue
+            results.append(result)
+            if result.exited or (stop_on_error and result.failures):
+                break
+
+    for result in results:
+        print(result.summary(), file=sys.stderr)
+        failed = failed or bool(result.failures)
+    if len(results) > 1:
+        total = sum(result.commands for result in results)
+        failures = sum(len(result.failures) for result in results)
+        print(f"total: {total} commands, {failures} failed in {time.perf_counter() - start:.2f}s",
+              file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,57 @@
+# bench_dispatch.py - Command Dispatch Benchmark
+"""Measure the per-command overhead of dispatching builtins.
+
+Each command line is run many times through execute_command, once with
+the compiled-command cache and once with it disabled, so the difference
+is the cost of tokenizing, parsing and resolving aliases on every call.
+
+Usage: python bench_dispatch.py [--runs 20000]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from terminal import PythonTerminal
+
+COMMANDS = [
+    'pwd',
+    'echo hello world',
+    'echo "quoted argument" with several more words && pwd',
+    'greet',  # alias -> hi -> echo hello
+]
+
+
+def time_command(terminal: PythonTerminal, command: str, runs: int) -> float:
+    """Mean microseconds per execute_command call"""
+    terminal.execute_command(command)  # Warm up
+    begin = time.perf_counter()
+    for _ in range(runs):
+        terminal.execute_command(command)
+    return (time.perf_counter() - begin) / runs * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Builtin dispatch overhead per command")
+    parser.add_argument('--runs', type=int, default=20000, help="calls per command")
+    args = parser.parse_args()
+
+    terminal = PythonTerminal()
+    terminal.execute_command('alias hi="echo hello"')
+    terminal.execute_command('alias greet=hi')
+
+    print(f"{'command':<56} {'uncached':>10} {'cached':>10}")
+    for command in COMMANDS:
+        terminal.compiled_lines.maxsize = 0
+        terminal.compiled_lines.clear()
+        uncached = time_command(terminal, command, args.runs)
+        terminal.compiled_lines.maxsize = 256
+        cached = time_command(terminal, command, args.runs)
+        print(f"{command:<56} {uncached:>8.1f}us {cached:>8.1f}us")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
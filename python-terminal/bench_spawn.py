@@ -0,0 +1,93 @@
+# bench_spawn.py - Spawn Latency Benchmark
+"""Compare command spawn latency with and without the spawn server.
+
+The benchmark grows this process to several resident set sizes and, at
+each size, times starting and waiting for a trivial command by forking
+this process (subprocess.Popen) and through the pre-started spawn server.
+
+Python 3.10+ on Linux may spawn with vfork(), whose cost does not grow
+with RSS; ``--fork`` passes a preexec_fn to the direct spawns, which forces
+the full fork() that older interpreters and preexec hooks use.
+
+Usage: python bench_spawn.py [--sizes 0,256,1024] [--runs 200] [--command true] [--fork]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import psutil
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from spawn_server import SpawnServer
+
+PAGE_SIZE = 4096
+
+
+def grow(ballast: list, target_mb: int):
+    """Allocate and touch memory until RSS reaches target_mb"""
+    process = psutil.Process()
+    while process.memory_info().rss < target_mb * 1024 * 1024:
+        block = bytearray(64 * 1024 * 1024)
+        for offset in range(0, len(block), PAGE_SIZE):
+            block[offset] = 1
+        ballast.append(block)
+
+
+def time_spawns(start, runs: int) -> list:
+    """Latencies in milliseconds of start() followed by wait()"""
+    latencies = []
+    for _ in range(runs):
+        begin = time.perf_counter()
+        start().wait()
+        latencies.append((time.perf_counter() - begin) * 1000)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Spawn latency at various RSS sizes")
+    parser.add_argument('--sizes', default='0,256,1024', help="comma-separated RSS sizes in MB")
+    parser.add_argument('--runs', type=int, default=200, help="spawns per measurement")
+    parser.add_argument('--command', default='true', help="command to spawn")
+    parser.add_argument('--fork', action='store_true', help="force fork() for direct spawns")
+    args = parser.parse_args()
+
+    if not SpawnServer.available():
+        print("The spawn server needs a POSIX system")
+        return 1
+
+    argv = args.command.split()
+    spawner = SpawnServer().start()
+    ballast = []
+    preexec = (lambda: None) if args.fork else None
+
+    def direct():
+        return subprocess.Popen(argv, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                start_new_session=True, preexec_fn=preexec)
+
+    def via_server():
+        return spawner.popen(argv, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                             start_new_session=True)
+
+    print(f"{'RSS (MB)':>9} {'fork median':>12} {'fork p95':>9} {'server median':>14} {'server p95':>11}")
+    try:
+        for size in (int(size) for size in args.sizes.split(',')):
+            grow(ballast, size)
+            rss = psutil.Process().memory_info().rss // (1024 * 1024)
+            results = []
+            for start in (direct, via_server):
+                time_spawns(start, 5)  # Warm up
+                latencies = sorted(time_spawns(start, args.runs))
+                results.append((statistics.median(latencies), latencies[int(len(latencies) * 0.95) - 1]))
+            (fork_median, fork_p95), (server_median, server_p95) = results
+            print(f"{rss:>9} {fork_median:>10.2f}ms {fork_p95:>7.2f}ms {server_median:>12.2f}ms {server_p95:>9.2f}ms")
+    finally:
+        spawner.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
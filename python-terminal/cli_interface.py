@@ -3,12 +3,14 @@ import readline
 import sys
 import os
 from terminal import PythonTerminal
+from stream_output import write_stream
+import history_store
 
 class CLIInterface:
     """Command Line Interface for the Python Terminal"""
     
     def __init__(self):
-        self.terminal = PythonTerminal()
+        self.terminal = PythonTerminal(history_path=history_store.default_path())
         self.setup_readline()
         
     def setup_readline(self):
@@ -18,14 +20,16 @@ class CLIInterface:
             readline.set_completer(self.completer)
             readline.parse_and_bind("tab: complete")
             
-            # Load command history
-            try:
-                readline.read_history_file(".terminal_history")
-            except FileNotFoundError:
-                pass
-            
-            # Set history length
+            # Load command history from the terminal's history database;
+            # Ctrl+R searches it incrementally
             readline.set_history_length(1000)
+            readline.clear_history()
+            for command in self.terminal.history.commands():
+                readline.add_history(command)
+            if 'libedit' in (readline.__doc__ or ''):
+                readline.parse_and_bind("bind ^R em-inc-search-prev")
+            else:
+                readline.parse_and_bind(r'"\C-r": reverse-search-history')
             
         except ImportError:
             print("Warning: readline not available, no tab completion or history")
@@ -42,12 +46,7 @@ class CLIInterface:
             # Command completion (first word)
             if not parts or (len(parts) == 1 and not line.endswith(' ')):
                 # Complete command names
-                commands = list(self.terminal.builtin_commands.keys())
-                commands.extend(['python', 'git', 'npm', 'pip', 'node', 'java', 'gcc'])
-                
-                for cmd in commands:
-                    if cmd.startswith(text):
-                        self.completions.append(cmd)
+                self.completions = self.terminal.complete_command(text)
             
             else:
                 # File/directory completion
@@ -104,22 +103,11 @@ class CLIInterface:
                     if not command:
                         continue
                     
-                    # Execute command
-                    output, return_code = self.terminal.execute_command(command)
-                    
-                    # Handle special exit case
-                    if output == "EXIT_TERMINAL":
+                    # Execute command, printing output as it arrives; the
+                    # terminal saves it to the history database
+                    write_stream(self.terminal.execute_command_stream(command))
+                    if self.terminal.exit_requested:
                         break
-                    
-                    # Print output
-                    if output:
-                        print(output)
-                    
-                    # Save command to history
-                    try:
-                        readline.write_history_file(".terminal_history")
-                    except:
-                        pass
                 
                 except KeyboardInterrupt:
                     print("\n^C")
@@ -129,11 +117,7 @@ class CLIInterface:
                     break
         
         finally:
-            # Save history on exit
-            try:
-                readline.write_history_file(".terminal_history")
-            except:
-                pass
+            self.terminal.close()
 
 def main():
     """Entry point for CLI interface"""
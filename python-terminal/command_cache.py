@@ -0,0 +1,48 @@
+# command_cache.py - Compiled Command Cache
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+
+class LRUCache:
+    """A bounded mapping that evicts the least recently used entry
+
+    Safe to share between threads. ``hits`` and ``misses`` count lookups,
+    for the benchmarks and for tuning ``maxsize``.
+    """
+
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """The cached value for key, or None"""
+        with self.lock:
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any):
+        """Cache a value, evicting the oldest entry beyond maxsize"""
+        if self.maxsize <= 0:
+            return
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        """Drop every entry"""
+        with self.lock:
+            self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
@@ -0,0 +1,106 @@
+# command_hash.py - Executable Lookup Table
+import os
+import stat
+import threading
+from typing import Dict, List, Optional, Tuple
+
+
+class CommandHash:
+    """Remembers where the executables on PATH live, like the shell's hash table
+
+    Each PATH directory is listed once and its contents reused until the
+    directory's mtime changes (a command was installed or removed) or PATH
+    itself changes, so resolving a command costs one stat per directory
+    instead of an exec attempt per directory.
+    """
+
+    def __init__(self):
+        self.path: Optional[str] = None
+        self.directories: List[str] = []
+        # directory -> (mtime_ns, {command name: full path})
+        self.listings: Dict[str, Tuple[int, Dict[str, str]]] = {}
+        self.hits: Dict[str, int] = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _scan(directory: str) -> Dict[str, str]:
+        """Executables in one directory, by command name"""
+        names = {}
+        extensions = [ext.lower() for ext in os.environ.get('PATHEXT', '.EXE;.BAT;.CMD').split(';')] \
+            if os.name == 'nt' else None
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if not entry.is_file():
+                            continue
+                        if extensions is not None:
+                            base, ext = os.path.splitext(entry.name)
+                            if ext.lower() in extensions:
+                                names.setdefault(base, entry.path)
+                                names[entry.name] = entry.path
+                        elif entry.stat().st_mode & (stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH):
+                            names[entry.name] = entry.path
+                    except OSError:
+                        continue
+        except OSError:
+            pass
+        return names
+
+    def _refresh(self, path: str):
+        """Drop listings made stale by a PATH change or a directory change"""
+        if path != self.path:
+            self.path = path
+            self.directories = list(dict.fromkeys(d for d in path.split(os.pathsep) if d))
+            self.listings = {}
+            self.hits = {}
+
+        for directory in self.directories:
+            try:
+                mtime = os.stat(directory).st_mtime_ns
+            except OSError:
+                mtime = -1
+            cached = self.listings.get(directory)
+            if cached is None or cached[0] != mtime:
+                self.listings[directory] = (mtime, self._scan(directory) if mtime >= 0 else {})
+
+    def lookup(self, name: str, path: str) -> Optional[str]:
+        """Full path of the executable that runs for name, or None"""
+        if os.sep in name or (os.altsep and os.altsep in name):
+            return name
+        with self.lock:
+            self._refresh(path)
+            for directory in self.directories:
+                found = self.listings[directory][1].get(name)
+                if found is not None:
+                    self.hits[name] = self.hits.get(name, 0) + 1
+                    return found
+        return None
+
+    def commands(self, prefix: str, path: str) -> List[str]:
+        """Names of all executables on path starting with prefix"""
+        with self.lock:
+            self._refresh(path)
+            names = set()
+            for directory in self.directories:
+                names.update(name for name in self.listings[directory][1] if name.startswith(prefix))
+        return sorted(names)
+
+    def remembered(self, path: str) -> List[Tuple[int, str]]:
+        """(hits, full path) of every command looked up since the last reset"""
+        with self.lock:
+            self._refresh(path)
+            table = []
+            for name, hits in sorted(self.hits.items()):
+                for directory in self.directories:
+                    found = self.listings[directory][1].get(name)
+                    if found is not None:
+                        table.append((hits, found))
+                        break
+        return table
+
+    def clear(self):
+        """Forget all remembered commands and directory listings"""
+        with self.lock:
+            self.listings = {}
+            self.hits = {}
@@ -0,0 +1,343 @@
+# command_parser.py - Command Line Parser
+import shlex
+from typing import List, Optional, Tuple
+
+
+class Operator(str):
+    """A control operator token such as '|' or '&&'
+
+    Operators are kept distinct from words so that a quoted "|" is passed
+    to a command as an argument instead of splitting the line.
+    """
+
+
+# Characters that start an operator when they appear unquoted
+OPERATOR_CHARS = '|;&'
+
+# Characters that start a redirection; an unquoted 0, 1 or 2 directly
+# before one names the file descriptor ('2>', '2>&1')
+REDIRECT_CHARS = '<>'
+
+# Operators that join pipelines into and-or lists, operators that end an
+# and-or list, and the two-character operators the tokenizer must prefer
+# over their one-character prefix
+AND_OR_OPERATORS = ('&&', '||')
+LIST_TERMINATORS = (';', '&')
+DOUBLE_OPERATORS = ('&&', '||')
+
+
+class Word(str):
+    """A word with unquoted glob or brace characters, to be expanded at run time
+
+    ``pattern`` is the word with its quoted characters backslash-escaped,
+    the form glob_expand works on.
+    """
+
+    def __new__(cls, text: str, pattern: str):
+        word = super().__new__(cls, text)
+        word.pattern = pattern
+        return word
+
+
+# Characters that make an unquoted word a glob or brace pattern, and the
+# characters that must be escaped when quoted so they match literally
+EXPANSION_CHARS = '*?[{'
+PATTERN_SPECIAL = '*?[]{},\\'
+
+
+class Redirect:
+    """An I/O redirection: '<', '>' or '>>' a file, or '>&' another descriptor
+
+    ``fd`` is the redirected descriptor (0 for '<', 1 for '>' unless a
+    number precedes the operator) and ``target`` the file name, or the
+    descriptor number for '>&'.
+    """
+
+    def __init__(self, fd: int, mode: str, target: str):
+        self.fd = fd
+        self.mode = mode
+        self.target = target
+
+    @classmethod
+    def from_operator(cls, operator: str, target: str = None) -> 'Redirect':
+        """Build a redirection from an operator token such as '2>>' or '2>&1'"""
+        number = operator[0] if operator[0].isdigit() else ''
+        mode = operator[len(number):]
+        if mode.startswith('>&'):
+            mode, target = '>&', mode[2:]
+        fd = int(number) if number else (0 if mode == '<' else 1)
+        return cls(fd, mode, target)
+
+    @property
+    def needs_target(self) -> bool:
+        return self.mode != '>&'
+
+    @property
+    def text(self) -> str:
+        default_fd = 0 if self.mode == '<' else 1
+        prefix = '' if self.fd == default_fd else str(self.fd)
+        if self.mode == '>&':
+            return f"{prefix}>&{self.target}"
+        return f"{prefix}{self.mode} {shlex.quote(self.target)}"
+
+    def __repr__(self):
+        return f"Redirect({self.fd!r}, {self.mode!r}, {self.target!r})"
+
+
+def is_redirect(token: str) -> bool:
+    """True for redirection operator tokens"""
+    return isinstance(token, Operator) and any(char in token for char in REDIRECT_CHARS)
+
+
+class SimpleCommand:
+    """A single command: its argument vector and redirections
+
+    ``expanded``, ``alias_chain`` and ``builtin`` describe how the command
+    dispatches once the terminal has resolved its aliases: the argument
+    vector that actually runs, the aliases expanded to get there, and
+    whether it names a builtin.
+    """
+
+    def __init__(self, argv: List[str], redirects: Optional[List[Redirect]] = None):
+        self.argv = argv
+        self.redirects = redirects or []
+        self.expanded = argv
+        self.alias_chain: List[str] = []
+        self.builtin = False
+
+    @property
+    def text(self) -> str:
+        """Shell-quoted source form of the command"""
+        words = [shlex.quote(arg) for arg in self.argv]
+        words.extend(redirect.text for redirect in self.redirects)
+        return ' '.join(words)
+
+    def __repr__(self):
+        if self.redirects:
+            return f"SimpleCommand({self.argv!r}, {self.redirects!r})"
+        return f"SimpleCommand({self.argv!r})"
+
+
+class Pipeline:
+    """One or more commands connected with '|'"""
+
+    def __init__(self, commands: List[SimpleCommand]):
+        self.commands = commands
+
+    @property
+    def stages(self) -> List[Tuple[List[str], bool, List[Redirect]]]:
+        """(argv, is_builtin, redirects) for each command, after alias resolution"""
+        return [(command.expanded, command.builtin, command.redirects) for command in self.commands]
+
+    @property
+    def text(self) -> str:
+        """Shell-quoted source form of the pipeline, for status reports"""
+        return ' | '.join(command.text for command in self.commands)
+
+    def __repr__(self):
+        return f"Pipeline({self.commands!r})"
+
+
+class AndOrList:
+    """Pipelines joined with '&&' and '||'
+
+    Each item pairs a pipeline with the operator that connects it to the
+    previous one; the first item's operator is ';'. A list terminated by
+    '&' runs in the background.
+    """
+
+    def __init__(self, items: List[Tuple[str, Pipeline]], background: bool = False):
+        self.items = items
+        self.background = background
+
+    @property
+    def text(self) -> str:
+        """Source form of the list, for job listings"""
+        parts = [self.items[0][1].text]
+        for connector, pipeline in self.items[1:]:
+            parts.append(f"{connector} {pipeline.text}")
+        return ' '.join(parts)
+
+    def __repr__(self):
+        return f"AndOrList({self.items!r}, background={self.background!r})"
+
+
+class CommandList:
+    """And-or lists sequenced with ';' or '&'"""
+
+    def __init__(self, lists: List[AndOrList]):
+        self.lists = lists
+
+    def __repr__(self):
+        return f"CommandList({self.lists!r})"
+
+
+def tokenize(line: str) -> List[str]:
+    """Split a command line into words and operators using POSIX quoting rules"""
+    tokens = []
+    word = []
+    pattern = []    # The word with quoted pattern characters escaped
+    in_word = False
+    quoted = False  # Whether the current word contains quoting
+    magic = False   # Whether the word has unquoted expansion characters
+    i = 0
+    length = len(line)
+
+    def literal(text: str):
+        word.append(text)
+        pattern.extend('\\' + char if char in PATTERN_SPECIAL else char for char in text)
+
+    def finish() -> str:
+        text = ''.join(word)
+        return Word(text, ''.join(pattern)) if magic else text
+
+    while i < length:
+        char = line[i]
+
+        if char == "'":
+            # Single quotes: everything literal up to the closing quote
+            end = line.find("'", i + 1)
+            if end < 0:
+                raise ValueError("No closing quotation")
+            literal(line[i + 1:end])
+            in_word = quoted = True
+            i = end + 1
+            continue
+
+        if char == '"':
+            # Double quotes: backslash only escapes \, " $ and `
+            i += 1
+            while True:
+                if i >= length:
+                    raise ValueError("No closing quotation")
+                char = line[i]
+                if char == '"':
+                    break
+                if char == '\\' and i + 1 < length and line[i + 1] in '\\"$`':
+                    i += 1
+                    char = line[i]
+                literal(char)
+                i += 1
+            in_word = quoted = True
+            i += 1
+            continue
+
+        if char == '\\':
+            if i + 1 >= length:
+                raise ValueError("No escaped character")
+            literal(line[i + 1])
+            in_word = quoted = True
+            i += 2
+            continue
+
+        if char in REDIRECT_CHARS:
+            operator = ''
+            if in_word:
+                text = ''.join(word)
+                if not quoted and text in ('0', '1', '2'):
+                    operator = text
+                elif not quoted and text.isdigit():
+                    raise ValueError(f"{text}{char}: only file descriptors 0, 1 and 2 can be redirected")
+                else:
+                    tokens.append(finish())
+                word = []
+                pattern = []
+                in_word = quoted = magic = False
+            operator += char
+            i += 1
+            if char == '>' and line[i:i + 1] == '>':
+                operator += '>'
+                i += 1
+            elif char == '>' and line[i:i + 1] == '&' and line[i + 1:i + 2] in ('0', '1', '2'):
+                operator += line[i:i + 2]
+                i += 2
+            tokens.append(Operator(operator))
+            continue
+
+        pair = line[i:i + 2]
+        if char.isspace() or char in OPERATOR_CHARS or pair in DOUBLE_OPERATORS:
+            if in_word:
+                tokens.append(finish())
+                word = []
+                pattern = []
+                in_word = quoted = magic = False
+            if pair in DOUBLE_OPERATORS:
+                tokens.append(Operator(pair))
+                i += 2
+                continue
+            if char in OPERATOR_CHARS:
+                tokens.append(Operator(char))
+            i += 1
+            continue
+
+        word.append(char)
+        pattern.append(char)
+        magic = magic or char in EXPANSION_CHARS
+        in_word = True
+        i += 1
+
+    if in_word:
+        tokens.append(finish())
+
+    return tokens
+
+
+def parse(line: str) -> CommandList:
+    """Parse a command line into and-or lists of pipelines of simple commands"""
+    lists = []
+    items = []
+    commands = []
+    argv = []
+    redirects = []
+    connector = ';'
+    tokens = iter(tokenize(line))
+
+    for token in tokens:
+        if not isinstance(token, Operator):
+            argv.append(token)
+            continue
+
+        if is_redirect(token):
+            redirect = Redirect.from_operator(token)
+            if redirect.needs_target:
+                target = next(tokens, None)
+                if target is None or isinstance(target, Operator):
+                    raise ValueError(f"syntax error near unexpected token '{target or 'newline'}'")
+                redirect.target = target
+            redirects.append(redirect)
+            continue
+
+        if not argv:
+            # A trailing ';' after a complete list is allowed
+            if token == ';' and lists and not items and not commands:
+                continue
+            raise ValueError(f"syntax error near unexpected token '{token}'")
+
+        commands.append(SimpleCommand(argv, redirects))
+        argv = []
+        redirects = []
+        if token in AND_OR_OPERATORS:
+            items.append((connector, Pipeline(commands)))
+            commands = []
+            connector = str(token)
+        elif token in LIST_TERMINATORS:
+            items.append((connector, Pipeline(commands)))
+            lists.append(AndOrList(items, background=(token == '&')))
+            items = []
+            commands = []
+            connector = ';'
+
+    if argv:
+        commands.append(SimpleCommand(argv, redirects))
+    elif redirects:
+        raise ValueError("syntax error: redirection without a command")
+    elif commands:
+        raise ValueError("syntax error: unexpected end of command after '|'")
+    elif items:
+        raise ValueError(f"syntax error: unexpected end of command after '{connector}'")
+
+    if commands:
+        items.append((connector, Pipeline(commands)))
+        lists.append(AndOrList(items))
+
+    return CommandList(lists)
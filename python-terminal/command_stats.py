@@ -0,0 +1,130 @@
+# command_stats.py - Command Timing and Resource Statistics
+import sys
+import threading
+from collections import deque
+from typing import Dict, List, Optional
+
+# Upper bounds (ms) of the wall-time histogram buckets; the last bucket is open
+BUCKET_BOUNDS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000]
+
+
+class ResourceUsage:
+    """Wall time and CPU/memory use of one command
+
+    ``user`` and ``sys`` add up the CPU seconds of the command's child
+    processes (from wait4) and of the terminal thread running it; ``maxrss``
+    is the largest child's peak resident set size in kilobytes.
+    """
+
+    def __init__(self):
+        self.wall = 0.0
+        self.user = 0.0
+        self.sys = 0.0
+        self.maxrss = 0
+
+    def add_child(self, user: float, system: float, maxrss: int):
+        """Account for a reaped child's ru_utime, ru_stime and ru_maxrss"""
+        self.user += user
+        self.sys += system
+        # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+        if sys.platform == 'darwin':
+            maxrss //= 1024
+        self.maxrss = max(self.maxrss, maxrss)
+
+
+class CommandTimings:
+    """Rolling window of ResourceUsage samples for one command"""
+
+    def __init__(self, window: int):
+        self.samples = deque(maxlen=window)
+        self.buckets = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.total_wall = 0.0
+
+    @staticmethod
+    def bucket(wall: float) -> int:
+        ms = wall * 1000
+        for index, bound in enumerate(BUCKET_BOUNDS):
+            if ms < bound:
+                return index
+        return len(BUCKET_BOUNDS)
+
+    def add(self, usage: ResourceUsage):
+        if len(self.samples) == self.samples.maxlen:
+            self.buckets[self.bucket(self.samples[0].wall)] -= 1
+        self.samples.append(usage)
+        self.buckets[self.bucket(usage.wall)] += 1
+        self.count += 1
+        self.total_wall += usage.wall
+
+    def percentile(self, fraction: float) -> float:
+        walls = sorted(sample.wall for sample in self.samples)
+        return walls[min(len(walls) - 1, int(len(walls) * fraction))] if walls else 0.0
+
+
+class CommandStats:
+    """Per-command timing statistics of a terminal session
+
+    Every command keeps its last ``window`` samples, so percentiles and
+    histograms follow recent behaviour while ``count`` and ``total_wall``
+    cover the whole session.
+    """
+
+    def __init__(self, window: int = 1000):
+        self.window = window
+        self.commands: Dict[str, CommandTimings] = {}
+        self.lock = threading.Lock()
+
+    def record(self, command: str, usage: ResourceUsage):
+        with self.lock:
+            timings = self.commands.get(command)
+            if timings is None:
+                timings = self.commands[command] = CommandTimings(self.window)
+            timings.add(usage)
+
+    def reset(self):
+        with self.lock:
+            self.commands.clear()
+
+    @staticmethod
+    def format_seconds(seconds: float) -> str:
+        return f"{seconds * 1000:.1f}ms" if seconds < 1 else f"{seconds:.2f}s"
+
+    def summary(self) -> str:
+        """One line per command, the commands taking the most time first"""
+        with self.lock:
+            rows = sorted(self.commands.items(), key=lambda item: item[1].total_wall, reverse=True)
+            if not rows:
+                return "No commands recorded"
+
+            fmt = self.format_seconds
+            lines = [f"{'COMMAND':<20} {'COUNT':>6} {'TOTAL':>9} {'MEAN':>9} {'P50':>9} "
+                     f"{'P95':>9} {'MAX':>9} {'USER':>9} {'SYS':>9} {'MAXRSS':>9}"]
+            for command, timings in rows:
+                samples = timings.samples
+                user = sum(sample.user for sample in samples) / len(samples)
+                system = sum(sample.sys for sample in samples) / len(samples)
+                maxrss = max(sample.maxrss for sample in samples)
+                lines.append(
+                    f"{command[:20]:<20} {timings.count:>6} {fmt(timings.total_wall):>9} "
+                    f"{fmt(timings.total_wall / timings.count):>9} {fmt(timings.percentile(0.5)):>9} "
+                    f"{fmt(timings.percentile(0.95)):>9} {fmt(max(s.wall for s in samples)):>9} "
+                    f"{fmt(user):>9} {fmt(system):>9} {str(maxrss) + 'K':>9}")
+            return '\n'.join(lines)
+
+    def histogram(self, command: str) -> Optional[str]:
+        """Wall-time histogram of one command's recent runs, or None if unknown"""
+        with self.lock:
+            timings = self.commands.get(command)
+            if timings is None:
+                return None
+
+            labels = [f"<{BUCKET_BOUNDS[0]}ms"]
+            labels += [f"{low}-{high}ms" for low, high in zip(BUCKET_BOUNDS, BUCKET_BOUNDS[1:])]
+            labels.append(f">={BUCKET_BOUNDS[-1]}ms")
+            peak = max(timings.buckets) or 1
+            lines: List[str] = [f"{command}: {len(timings.samples)} recent of {timings.count} runs"]
+            for label, count in zip(labels, timings.buckets):
+                if count:
+                    lines.append(f"  {label:>13} {'#' * max(1, count * 40 // peak):<40} {count}")
+            return '\n'.join(lines)
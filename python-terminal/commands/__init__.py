@@ -0,0 +1,131 @@
+# commands/__init__.py - Builtin Command Registry
+"""Lookup tables for builtin commands, loaded on first use.
+
+A terminal class declares its builtins as a class-level mapping from
+command name to a target: either the name of one of its own methods
+('cmd_cd') or a 'module:function' reference for commands that live in
+this package (such as the psutil-based monitoring commands). Targets are
+imported only when the command first runs, and each terminal gets a
+``CommandTable`` view over the shared mapping instead of a dict of bound
+methods.
+
+Third-party builtins register through the ``python_terminal.commands``
+entry point group (or ``register()``); an entry point's name is the
+command name and it must load a ``function(terminal, args)`` returning
+the output, or an (output, return code) pair. Output that is an error
+message should be an ``ErrorText``, which goes to the command's stderr.
+"""
+import importlib
+import threading
+import types
+from collections.abc import Mapping
+from typing import Callable, Dict, Iterator, Optional
+
+ENTRY_POINT_GROUP = 'python_terminal.commands'
+
+# Loaded targets, keyed by their 'module:function' reference
+_functions: Dict[str, Callable] = {}
+
+# Plugin command name -> entry point, or a function registered directly
+_plugins: Optional[Dict[str, object]] = None
+_lock = threading.Lock()
+
+
+class ErrorText(str):
+    """Builtin output that is a diagnostic, written to stderr instead of stdout"""
+    __slots__ = ()
+
+
+def _entry_points():
+    """Entry points in the plugin group, on any supported Python"""
+    try:
+        from importlib import metadata
+    except ImportError:  # Python 3.7
+        try:
+            import importlib_metadata as metadata
+        except ImportError:
+            return []
+    entry_points = metadata.entry_points()
+    if hasattr(entry_points, 'select'):
+        return entry_points.select(group=ENTRY_POINT_GROUP)
+    return entry_points.get(ENTRY_POINT_GROUP, [])
+
+
+def plugins() -> Dict[str, object]:
+    """Plugin commands by name; entry points are discovered once per process"""
+    global _plugins
+    if _plugins is None:
+        with _lock:
+            if _plugins is None:
+                found = {}
+                try:
+                    for entry_point in _entry_points():
+                        found.setdefault(entry_point.name, entry_point)
+                except Exception:
+                    pass  # A broken installation must not break the terminal
+                _plugins = found
+    return _plugins
+
+
+def register(name: str, function: Callable):
+    """Add a plugin command without an entry point"""
+    plugins()[name] = function
+
+
+def _load(target: str) -> Callable:
+    """Import a 'module:function' target, caching the result"""
+    function = _functions.get(target)
+    if function is None:
+        module_name, _, attribute = target.partition(':')
+        function = getattr(importlib.import_module(module_name), attribute)
+        _functions[target] = function
+    return function
+
+
+def _load_plugin(name: str) -> Callable:
+    """The function behind a plugin command, loading its entry point once"""
+    plugin = plugins()[name]
+    if hasattr(plugin, 'load'):
+        plugin = plugin.load()
+        plugins()[name] = plugin
+    return plugin
+
+
+class CommandTable(Mapping):
+    """A terminal's read-only view of a class-level command mapping
+
+    Looking up a name returns a callable bound to the terminal, importing
+    the command's module the first time it is needed.
+    """
+
+    def __init__(self, terminal, targets: Dict[str, str], include_plugins: bool = False):
+        self.terminal = terminal
+        self.targets = targets
+        self.include_plugins = include_plugins
+
+    def __getitem__(self, name: str) -> Callable:
+        target = self.targets.get(name)
+        if target is None:
+            if self.include_plugins and name in plugins():
+                return types.MethodType(_load_plugin(name), self.terminal)
+            raise KeyError(name)
+        if ':' in target:
+            return types.MethodType(_load(target), self.terminal)
+        return getattr(self.terminal, target)
+
+    def __contains__(self, name: object) -> bool:
+        return name in self.targets or (self.include_plugins and name in plugins())
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self.targets
+        if self.include_plugins:
+            yield from (name for name in plugins() if name not in self.targets)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def plugin_names(self):
+        """Names of the plugin commands visible through this table"""
+        if not self.include_plugins:
+            return []
+        return sorted(name for name in plugins() if name not in self.targets)
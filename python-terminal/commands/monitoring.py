@@ -0,0 +1,173 @@
+# commands/monitoring.py - System Monitoring Commands
+"""Process and resource builtins: ps, kill, top, df and free.
+
+Kept out of terminal.py so that psutil is imported only when one of these
+commands first runs.
+"""
+import signal
+from typing import List, Tuple, Union
+
+import psutil
+
+from commands import ErrorText
+
+
+def cmd_ps(terminal, args: List[str]) -> str:
+    """List running processes"""
+    try:
+        results = ["PID   NAME                     CPU%   MEM%"]
+        results.append("-" * 45)
+
+        for proc in psutil.process_iter(['pid', 'name', 'cpu_percent', 'memory_percent']):
+            try:
+                info = proc.info
+                results.append(f"{info['pid']:<5} {info['name']:<20} {info['cpu_percent']:<6.1f} {info['memory_percent']:<6.1f}")
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+
+        return '\n'.join(results)
+    except Exception as e:
+        return ErrorText(f"Error listing processes: {str(e)}")
+
+
+def cmd_kill(terminal, args: List[str]) -> Union[str, Tuple[str, int]]:
+    """Signal a process by PID or a background job by %job"""
+    usage = "Usage: kill [-STOP|-CONT|-TERM|-KILL] <pid|%job>"
+    action = 'TERM'
+    if args and args[0].startswith('-'):
+        action = args[0][1:].upper()
+        args = args[1:]
+    if not args or action not in ('STOP', 'CONT', 'TERM', 'KILL'):
+        return ErrorText(usage), 1
+
+    if args[0].startswith('%'):
+        try:
+            job = terminal.jobs.get(args[0])
+        except ValueError as e:
+            return ErrorText(f"kill: {str(e)}"), 1
+
+        if action == 'STOP':
+            if not job.stop():
+                return ErrorText(f"kill: {args[0]}: no running process to stop"), 1
+        elif action == 'CONT':
+            job.resume()
+        elif action == 'KILL':
+            job.terminate(signal.SIGKILL)
+        else:
+            job.terminate()
+        return f"[{job.id}] {job.command}: sent SIG{action}"
+
+    try:
+        pid = int(args[0])
+        proc = psutil.Process(pid)
+        if action == 'STOP':
+            proc.suspend()
+        elif action == 'CONT':
+            proc.resume()
+        elif action == 'KILL':
+            proc.kill()
+        else:
+            proc.terminate()
+        return f"Process {pid} terminated" if action == 'TERM' else f"Process {pid}: sent SIG{action}"
+    except ValueError:
+        return ErrorText("Invalid PID: must be a number"), 1
+    except psutil.NoSuchProcess:
+        return ErrorText(f"No such process: {args[0]}"), 1
+    except psutil.AccessDenied:
+        return ErrorText(f"Access denied: cannot kill process {args[0]}"), 1
+    except Exception as e:
+        return ErrorText(f"Error killing process: {str(e)}"), 1
+
+
+def cmd_top(terminal, args: List[str]) -> str:
+    """Display system resource usage"""
+    try:
+        # CPU usage
+        cpu_percent = psutil.cpu_percent(interval=1)
+
+        # Memory usage
+        memory = psutil.virtual_memory()
+
+        # Disk usage
+        disk = psutil.disk_usage('/')
+
+        results = [
+            "System Resource Usage",
+            "=" * 30,
+            f"CPU Usage: {cpu_percent}%",
+            f"Memory Usage: {memory.percent}% ({memory.used // (1024**3):.1f}GB / {memory.total // (1024**3):.1f}GB)",
+            f"Disk Usage: {disk.percent}% ({disk.used // (1024**3):.1f}GB / {disk.total // (1024**3):.1f}GB)",
+            "",
+            "Top Processes by CPU:",
+            "PID   NAME                     CPU%   MEM%",
+            "-" * 45
+        ]
+
+        # Get top CPU processes
+        processes = []
+        for proc in psutil.process_iter(['pid', 'name', 'cpu_percent', 'memory_percent']):
+            try:
+                processes.append(proc.info)
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+
+        # Sort by CPU usage
+        processes.sort(key=lambda x: x['cpu_percent'] or 0, reverse=True)
+
+        for proc in processes[:10]:  # Top 10
+            results.append(f"{proc['pid']:<5} {proc['name']:<20} {proc['cpu_percent'] or 0:<6.1f} {proc['memory_percent'] or 0:<6.1f}")
+
+        return '\n'.join(results)
+    except Exception as e:
+        return ErrorText(f"Error getting system info: {str(e)}")
+
+
+def cmd_df(terminal, args: List[str]) -> str:
+    """Display filesystem disk space usage"""
+    try:
+        results = ["Filesystem Usage", "=" * 30]
+
+        # Get all disk partitions
+        partitions = psutil.disk_partitions()
+
+        for partition in partitions:
+            try:
+                usage = psutil.disk_usage(partition.mountpoint)
+                results.append(f"Device: {partition.device}")
+                results.append(f"  Mountpoint: {partition.mountpoint}")
+                results.append(f"  File system: {partition.fstype}")
+                results.append(f"  Total: {usage.total // (1024**3):.1f}GB")
+                results.append(f"  Used: {usage.used // (1024**3):.1f}GB ({usage.percent}%)")
+                results.append(f"  Free: {usage.free // (1024**3):.1f}GB")
+                results.append("")
+            except PermissionError:
+                results.append(f"Permission denied: {partition.device}")
+                results.append("")
+
+        return '\n'.join(results)
+    except Exception as e:
+        return ErrorText(f"Error getting disk info: {str(e)}")
+
+
+def cmd_free(terminal, args: List[str]) -> str:
+    """Display memory usage"""
+    try:
+        memory = psutil.virtual_memory()
+        swap = psutil.swap_memory()
+
+        results = [
+            "Memory Usage Information",
+            "=" * 30,
+            f"Total RAM: {memory.total // (1024**3):.1f}GB",
+            f"Available RAM: {memory.available // (1024**3):.1f}GB",
+            f"Used RAM: {memory.used // (1024**3):.1f}GB ({memory.percent}%)",
+            f"Free RAM: {memory.free // (1024**3):.1f}GB",
+            "",
+            f"Total Swap: {swap.total // (1024**3):.1f}GB",
+            f"Used Swap: {swap.used // (1024**3):.1f}GB ({swap.percent}%)",
+            f"Free Swap: {swap.free // (1024**3):.1f}GB"
+        ]
+
+        return '\n'.join(results)
+    except Exception as e:
+        return ErrorText(f"Error getting memory info: {str(e)}")
@@ -0,0 +1,72 @@
+# environment.py - Per-session Environment Overlay
+"""Copy-on-write environment variables for a terminal session.
+
+An ``Environment`` reads through to a base mapping (``os.environ`` by
+default) and records only the session's own changes: the variables it
+set and the ones it unset. Sessions therefore cost nothing until they
+change a variable, never see each other's changes, and never modify
+the process environment.
+"""
+import os
+from collections.abc import MutableMapping
+from typing import Dict, Iterator, Mapping, Optional, Set
+
+
+class Environment(MutableMapping):
+    """A session's view of the environment: base variables plus overrides"""
+
+    def __init__(self, base: Optional[Mapping[str, str]] = None):
+        self.base = os.environ if base is None else base
+        self.overrides: Dict[str, str] = {}
+        self.removed: Set[str] = set()
+
+    @staticmethod
+    def _key(name: str) -> str:
+        # Variable names are case-insensitive on Windows, as in os.environ
+        return name.upper() if os.name == 'nt' else name
+
+    def __getitem__(self, name: str) -> str:
+        key = self._key(name)
+        if key in self.overrides:
+            return self.overrides[key]
+        if key in self.removed:
+            raise KeyError(name)
+        return self.base[key]
+
+    def __setitem__(self, name: str, value: str):
+        key = self._key(name)
+        self.overrides[key] = value
+        self.removed.discard(key)
+
+    def __delitem__(self, name: str):
+        key = self._key(name)
+        if key not in self:
+            raise KeyError(name)
+        self.overrides.pop(key, None)
+        if key in self.base:
+            self.removed.add(key)
+
+    def __contains__(self, name: object) -> bool:
+        if not isinstance(name, str):
+            return False
+        key = self._key(name)
+        return key in self.overrides or (key not in self.removed and key in self.base)
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self.overrides
+        for key in list(self.base):
+            if key not in self.overrides and key not in self.removed:
+                yield key
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def is_modified(self) -> bool:
+        """True if the session has set or unset any variable"""
+        return bool(self.overrides or self.removed)
+
+    def child_env(self) -> Optional[Dict[str, str]]:
+        """The env= for a child process: None (inherit ours) when nothing was changed"""
+        if not self.is_modified():
+            return None
+        return dict(self)
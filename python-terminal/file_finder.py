@@ -0,0 +1,554 @@
+# file_finder.py - Expressions and Directory Walking for find
+"""The engine behind the ``find`` builtin.
+
+A find command line is compiled once into a tree of small predicate
+functions: tests such as ``-name``, ``-type``, ``-size``, ``-mtime`` and
+``-newer``, actions such as ``-print``, ``-prune`` and ``-delete``, and
+the ``!``, ``-a``, ``-o`` and parentheses that combine them.
+
+``-exec`` and ``-execdir`` run a command for each match, or with the
+``+`` form once for as many matches as fit in the argument space left
+by ARG_MAX and the environment. Batches may run several at a time
+(``-jobs N``); their output still comes in the order they were formed.
+
+The walk is depth first in name order, so its output is the same on
+every run. Directories are read with ``os.scandir`` by a pool of
+threads that lists subdirectories (and lstats their entries when the
+expression needs it) ahead of the walk, while this thread evaluates
+entries as their listings arrive and yields the output straight away.
+"""
+import collections
+import fnmatch
+import itertools
+import os
+import re
+import stat
+import struct
+import subprocess
+import time
+from typing import Callable, Iterator, List, Mapping, Optional, Tuple
+
+from commands import ErrorText
+
+# Threads listing directories, and how many listings may be read ahead;
+# with a single CPU the threads only contend, so directories are listed inline
+WORKERS = min(8, os.cpu_count() or 1)
+MAX_PREFETCH = 256
+
+# -type letters and the file types they select
+TYPES = {'f': stat.S_IFREG, 'd': stat.S_IFDIR, 'l': stat.S_IFLNK, 'p': stat.S_IFIFO,
+         's': stat.S_IFSOCK, 'b': stat.S_IFBLK, 'c': stat.S_IFCHR}
+
+# -size suffixes; without one the unit is 512-byte blocks
+SIZE_UNITS = {'c': 1, 'w': 2, 'b': 512, 'k': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+# Argument space kept free below ARG_MAX, as GNU find does, and the space
+# assumed where the system cannot tell (Windows allows 32767 characters)
+ARG_HEADROOM = 2048
+DEFAULT_ARG_SPACE = 32 * 1024
+POINTER_SIZE = struct.calcsize('P')
+
+
+class FindItem:
+    """A file met during the walk"""
+    __slots__ = ('path', 'full_path', 'name', 'depth', 'entry', '_stat', 'pruned', 'directory', 'listing')
+
+    def __init__(self, path: str, full_path: str, name: str, depth: int, entry: Optional[os.DirEntry] = None):
+        self.path = path            # As printed: the starting point joined with the names below it
+        self.full_path = full_path  # As opened
+        self.name = name
+        self.depth = depth
+        self.entry = entry
+        self._stat = None
+        self.pruned = False
+        self.directory = False  # A directory the walk will descend into
+        self.listing = None     # Future of its entries, once requested
+
+    def lstat(self) -> os.stat_result:
+        if self._stat is None:
+            self._stat = self.entry.stat(follow_symlinks=False) if self.entry is not None \
+                else os.lstat(self.full_path)
+        return self._stat
+
+    def file_type(self) -> int:
+        """The S_IFMT bits, from the directory entry when that knows them"""
+        entry = self.entry
+        if entry is not None and self._stat is None:
+            if entry.is_symlink():
+                return stat.S_IFLNK
+            if entry.is_dir(follow_symlinks=False):
+                return stat.S_IFDIR
+            if entry.is_file(follow_symlinks=False):
+                return stat.S_IFREG
+        return stat.S_IFMT(self.lstat().st_mode)
+
+    def is_dir(self) -> bool:
+        return self.file_type() == stat.S_IFDIR
+
+
+# A compiled expression: decides for an item, appending any output lines
+Predicate = Callable[[FindItem, List[str]], bool]
+
+# Runs argv in a directory (None: the current one), returning its output and status
+Runner = Callable[[List[str], Optional[str]], Tuple[str, int]]
+
+
+def _argument_size(argument: str) -> int:
+    """Bytes an argument takes in a new process: the string, its NUL and its pointer"""
+    return len(os.fsencode(argument)) + 1 + POINTER_SIZE
+
+
+def argument_space(env: Optional[Mapping[str, str]] = None) -> int:
+    """Bytes of arguments a child started with env (default: ours) may be given"""
+    try:
+        arg_max = os.sysconf('SC_ARG_MAX')
+    except (AttributeError, ValueError, OSError):
+        return DEFAULT_ARG_SPACE
+    if arg_max <= 0:
+        return DEFAULT_ARG_SPACE
+    env = os.environ if env is None else env
+    used = sum(_argument_size(f"{name}={value}") for name, value in env.items())
+    return max(arg_max - used - ARG_HEADROOM, DEFAULT_ARG_SPACE // 8)
+
+
+def run_command(argv: List[str], cwd: Optional[str] = None) -> Tuple[str, int]:
+    """Run a command to completion, returning its combined output and exit status"""
+    try:
+        completed = subprocess.run(argv, cwd=cwd, stdin=subprocess.DEVNULL,
+                                   stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    except OSError as e:
+        return f"find: '{argv[0]}': {e.strerror}\n", 127
+    return completed.stdout.decode('utf-8', errors='replace'), completed.returncode
+
+
+def _output_lines(text: str) -> List[str]:
+    """A command's output as newline-terminated lines"""
+    lines = text.splitlines(keepends=True)
+    if lines and not lines[-1].endswith('\n'):
+        lines[-1] += '\n'
+    return lines
+
+
+class Exec:
+    """An -exec or -execdir action
+
+    With ';' the command runs once per item, and the action is true when
+    it exits with status 0. With '+' items are gathered into a batch that
+    runs once the next one would not fit in the argument space (or, for
+    -execdir, once the walk leaves the directory); the action is always
+    true, and a failed batch makes find's status 1.
+    """
+
+    def __init__(self, finder: 'Finder', template: List[str], in_directory: bool, batched: bool):
+        self.finder = finder
+        self.template = template
+        self.in_directory = in_directory
+        self.batched = batched
+        self.batch: List[str] = []
+        self.batch_size = sum(_argument_size(word) for word in template)
+        self.directory: Optional[str] = None
+
+    def _target(self, item: FindItem) -> Tuple[Optional[str], str]:
+        """(directory to run in, argument naming the item)"""
+        if not self.in_directory:
+            return None, item.path
+        directory, name = os.path.split(item.full_path)
+        if not name:
+            return directory, directory  # The root directory
+        return directory, './' + name
+
+    def __call__(self, item: FindItem, out: List[str]) -> bool:
+        directory, argument = self._target(item)
+        if not self.batched:
+            argv = [word.replace('{}', argument) for word in self.template]
+            return self.finder._execute(argv, directory, out) == 0
+        size = _argument_size(argument)
+        if self.batch and (directory != self.directory or self.batch_size + size > self.finder.arg_space):
+            self.flush(out)
+        self.batch.append(argument)
+        self.batch_size += size
+        self.directory = directory
+        return True
+
+    def flush(self, out: List[str]):
+        """Run the batch gathered so far"""
+        if self.batch:
+            self.finder._execute_batch(self.template + self.batch, self.directory, out)
+            self.batch = []
+            self.batch_size = sum(_argument_size(word) for word in self.template)
+
+
+def _compare(spec: str, option: str) -> Callable[[int], bool]:
+    """Numeric test for '+N' (more than N), '-N' (less than N) or 'N' (exactly N)"""
+    match = re.fullmatch(r'([+-]?)(\d+)', spec)
+    if match is None:
+        raise ValueError(f"find: invalid argument '{spec}' to '{option}'")
+    sign, number = match.group(1), int(match.group(2))
+    if sign == '+':
+        return lambda value: value > number
+    if sign == '-':
+        return lambda value: value < number
+    return lambda value: value == number
+
+
+class Finder:
+    """One find command: starting points, options and a compiled expression
+
+    Raises ValueError with a find-style message for a bad command line.
+    ``resolve`` turns a path as given into one that can be opened, and
+    ``execute`` runs the commands of -exec and -execdir, whose '+'
+    batches are kept within ``arg_space`` bytes of arguments.
+    """
+
+    def __init__(self, args: List[str], resolve: Callable[[str], str] = os.path.abspath,
+                 execute: Runner = run_command, arg_space: Optional[int] = None):
+        self.resolve = resolve
+        self.execute = execute
+        self.arg_space = argument_space() if arg_space is None else arg_space
+        self.jobs = 1             # '+' batches run at a time
+        self.batches: List[Exec] = []
+        self.pending = collections.deque()  # Futures of running batches, oldest first
+        self.executor = None  # Runs '+' batches when -jobs allows several at once
+        self.now = time.time()
+        self.maxdepth: Optional[int] = None
+        self.mindepth = 0
+        self.depth_first = False  # Directories after their contents, for -delete
+        self.needs_stat = False   # Whether the listing threads should lstat entries
+        self.has_action = False
+        self.status = 0
+        self.prefetched = set()   # Futures of listings submitted ahead and not yet taken
+
+        index = 0
+        while index < len(args) and not (args[index].startswith('-') or args[index] in ('(', '!', ')')):
+            index += 1
+        self.paths = args[:index] or ['.']
+        self.tokens = args[index:]
+        self.position = 0
+
+        if self.tokens:
+            expression = self._parse_or()
+            if self.position < len(self.tokens):
+                raise ValueError(f"find: unexpected '{self.tokens[self.position]}'")
+        else:
+            expression = lambda item, out: True
+        if not self.has_action:
+            test = expression
+            expression = lambda item, out: test(item, out) and self._print(item, out)
+        self.expression = expression
+
+    # Parsing
+
+    def _peek(self) -> Optional[str]:
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def _next(self) -> str:
+        token = self.tokens[self.position]
+        self.position += 1
+        return token
+
+    def _argument(self, option: str) -> str:
+        if self.position >= len(self.tokens):
+            raise ValueError(f"find: missing argument to '{option}'")
+        return self._next()
+
+    def _parse_or(self) -> Predicate:
+        left = self._parse_and()
+        while self._peek() in ('-o', '-or'):
+            self._next()
+            right = self._parse_and()
+            left = (lambda a, b: lambda item, out: a(item, out) or b(item, out))(left, right)
+        return left
+
+    def _parse_and(self) -> Predicate:
+        left = self._parse_not()
+        while self._peek() is not None and self._peek() not in ('-o', '-or', ')'):
+            if self._peek() in ('-a', '-and'):
+                self._next()
+            right = self._parse_not()
+            left = (lambda a, b: lambda item, out: a(item, out) and b(item, out))(left, right)
+        return left
+
+    def _parse_not(self) -> Predicate:
+        token = self._peek()
+        if token in ('!', '-not'):
+            self._next()
+            operand = self._parse_not()
+            return lambda item, out: not operand(item, out)
+        if token == '(':
+            self._next()
+            inner = self._parse_or()
+            if self._peek() != ')':
+                raise ValueError("find: missing ')'")
+            self._next()
+            return inner
+        if token is None or token == ')':
+            raise ValueError("find: expected an expression")
+        return self._parse_primary(self._next())
+
+    def _parse_primary(self, option: str) -> Predicate:
+        if option in ('-name', '-iname'):
+            regex = re.compile(fnmatch.translate(self._argument(option)), re.IGNORECASE if option == '-iname' else 0)
+            return lambda item, out: regex.match(item.name) is not None
+        if option in ('-path', '-wholename', '-ipath'):
+            regex = re.compile(fnmatch.translate(self._argument(option)), re.IGNORECASE if option == '-ipath' else 0)
+            return lambda item, out: regex.match(item.path) is not None
+        if option == '-type':
+            return self._type(self._argument(option))
+        if option == '-size':
+            return self._size(self._argument(option))
+        if option in ('-mtime', '-mmin'):
+            test = _compare(self._argument(option), option)
+            period = 86400 if option == '-mtime' else 60
+            self.needs_stat = True
+            return lambda item, out: test(int((self.now - item.lstat().st_mtime) // period))
+        if option == '-newer':
+            reference = self._argument(option)
+            try:
+                newer_than = os.stat(self.resolve(reference)).st_mtime_ns
+            except OSError as e:
+                raise ValueError(f"find: '{reference}': {e.strerror}")
+            self.needs_stat = True
+            return lambda item, out: item.lstat().st_mtime_ns > newer_than
+        if option in ('-maxdepth', '-mindepth'):
+            value = self._argument(option)
+            if not value.isdigit():
+                raise ValueError(f"find: invalid argument '{value}' to '{option}'")
+            if option == '-maxdepth':
+                self.maxdepth = int(value)
+            else:
+                self.mindepth = int(value)
+            return lambda item, out: True
+        if option == '-depth':
+            self.depth_first = True
+            return lambda item, out: True
+        if option == '-print':
+            self.has_action = True
+            return self._print
+        if option == '-prune':
+            return self._prune
+        if option == '-delete':
+            self.has_action = True
+            self.depth_first = True
+            return self._delete
+        if option in ('-exec', '-execdir'):
+            return self._exec(option)
+        if option == '-jobs':
+            value = self._argument(option)
+            if not value.isdigit() or int(value) < 1:
+                raise ValueError(f"find: invalid argument '{value}' to '{option}'")
+            self.jobs = int(value)
+            return lambda item, out: True
+        if option in ('-true', '-false'):
+            return lambda item, out: option == '-true'
+        raise ValueError(f"find: unknown predicate '{option}'")
+
+    def _type(self, letters: str) -> Predicate:
+        types = set()
+        for letter in letters.split(','):
+            if letter not in TYPES:
+                raise ValueError(f"find: unknown argument to -type: {letter}")
+            types.add(TYPES[letter])
+        if not types <= {stat.S_IFREG, stat.S_IFDIR, stat.S_IFLNK}:
+            self.needs_stat = True
+        return lambda item, out: item.file_type() in types
+
+    def _size(self, spec: str) -> Predicate:
+        match = re.fullmatch(r'([+-]?\d+)([cwbkMG]?)', spec)
+        if match is None:
+            raise ValueError(f"find: invalid -size type in '{spec}'")
+        test = _compare(match.group(1), '-size')
+        unit = SIZE_UNITS[match.group(2) or 'b']
+        self.needs_stat = True
+        # Sizes round up to whole units, as in GNU find
+        return lambda item, out: test(-(-item.lstat().st_size // unit))
+
+    def _exec(self, option: str) -> Predicate:
+        """-exec COMMAND ;  or  -exec COMMAND {} +"""
+        template = []
+        while True:
+            if self.position >= len(self.tokens):
+                raise ValueError(f"find: missing argument to '{option}'")
+            token = self._next()
+            if token == ';':
+                batched = False
+                break
+            if token == '+' and template and template[-1] == '{}':
+                template.pop()
+                batched = True
+                break
+            template.append(token)
+        if not template:
+            raise ValueError(f"find: missing argument to '{option}'")
+        if batched and any('{}' in word for word in template):
+            raise ValueError(f"find: only one instance of {{}} is supported with {option} ... +")
+        self.has_action = True
+        action = Exec(self, template, option == '-execdir', batched)
+        if batched:
+            self.batches.append(action)
+        return action
+
+    # Actions
+
+    @staticmethod
+    def _print(item: FindItem, out: List[str]) -> bool:
+        out.append(item.path + '\n')
+        return True
+
+    @staticmethod
+    def _prune(item: FindItem, out: List[str]) -> bool:
+        item.pruned = True
+        return True
+
+    def _delete(self, item: FindItem, out: List[str]) -> bool:
+        try:
+            if item.is_dir():
+                os.rmdir(item.full_path)
+            else:
+                os.unlink(item.full_path)
+            return True
+        except OSError as e:
+            out.append(ErrorText(f"find: cannot delete '{item.path}': {e.strerror}\n"))
+            self.status = 1
+            return False
+
+    def _execute(self, argv: List[str], directory: Optional[str], out: List[str]) -> int:
+        output, status = self.execute(argv, directory)
+        out.extend(_output_lines(output))
+        return status
+
+    def _execute_batch(self, argv: List[str], directory: Optional[str], out: List[str]):
+        """Run a '+' batch, or start it on the pool when batches run in parallel"""
+        if self.jobs == 1:
+            if self._execute(argv, directory, out) != 0:
+                self.status = 1
+            return
+        if self.executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            self.executor = ThreadPoolExecutor(self.jobs, thread_name_prefix='find-exec')
+        while len(self.pending) >= self.jobs:
+            self._finish_batch(out)
+        self.pending.append(self.executor.submit(self.execute, argv, directory))
+
+    def _finish_batch(self, out: List[str]):
+        """Wait for the oldest running batch and add its output"""
+        output, status = self.pending.popleft().result()
+        out.extend(_output_lines(output))
+        if status != 0:
+            self.status = 1
+
+    # Walking
+
+    def _list(self, item: FindItem) -> Tuple[List[FindItem], Optional[str]]:
+        """The entries of a directory in name order, or an error message; runs on the pool"""
+        try:
+            with os.scandir(item.full_path) as entries:
+                entries = sorted(entries, key=lambda entry: entry.name)
+        except OSError as e:
+            return [], ErrorText(f"find: '{item.path}': {e.strerror}\n")
+        prefix = item.path if item.path.endswith('/') else item.path + '/'
+        depth = item.depth + 1
+        descend = self.maxdepth is None or depth < self.maxdepth
+        children = []
+        for entry in entries:
+            child = FindItem(prefix + entry.name, entry.path, entry.name, depth, entry)
+            try:
+                child.directory = descend and entry.is_dir(follow_symlinks=False)
+                if self.needs_stat and WORKERS > 1:
+                    child.lstat()
+            except OSError:
+                pass  # Reported if the expression needs it
+            children.append(child)
+        return children, None
+
+    def _children(self, item: FindItem, pool) -> Iterator[str]:
+        """A directory's entries; subdirectories are listed ahead on the pool
+
+        Yields any error reading the directory and returns the entries.
+        """
+        if pool is None:
+            children, error = self._list(item)
+        else:
+            listing = item.listing or pool.submit(self._list, item)
+            self.prefetched.discard(listing)
+            item.listing = None
+            children, error = listing.result()
+        if error:
+            self.status = 1
+            yield error
+        if pool is None:
+            return children
+        for child in children:
+            if child.directory and len(self.prefetched) < MAX_PREFETCH:
+                child.listing = pool.submit(self._list, child)
+                self.prefetched.add(child.listing)
+        return children
+
+    def run(self) -> Iterator[str]:
+        """Walk every starting point, yielding output lines; returns the exit status"""
+        pool = None
+        if WORKERS > 1:
+            from concurrent.futures import ThreadPoolExecutor
+            pool = ThreadPoolExecutor(WORKERS, thread_name_prefix='find')
+        roots = []
+        for path in self.paths:
+            root = FindItem(path, self.resolve(path), os.path.basename(path.rstrip('/')) or path, 0)
+            try:
+                root.directory = (self.maxdepth is None or self.maxdepth > 0) and root.is_dir()
+            except OSError as e:
+                self.status = 1
+                yield ErrorText(f"find: '{path}': {e.strerror}\n")
+                continue
+            roots.append(root)
+
+        expression = self.expression
+        mindepth = self.mindepth
+        out: List[str] = []
+        # Iterators over the entries still to visit in each open directory,
+        # and (with -depth) the directories to evaluate once they are done
+        stack: List[object] = [iter(roots)]
+        try:
+            while stack:
+                top = stack[-1]
+                if isinstance(top, FindItem):
+                    stack.pop()
+                    item = top
+                else:
+                    item = next(top, None)
+                    if item is None:
+                        stack.pop()
+                        continue
+                    if item.directory and self.depth_first:
+                        # Contents first, the directory itself when they are done
+                        stack.append(item)
+                        children = yield from self._children(item, pool)
+                        stack.append(iter(children))
+                        continue
+
+                if item.depth >= mindepth:
+                    try:
+                        expression(item, out)
+                    except OSError as e:
+                        out.append(ErrorText(f"find: '{item.path}': {e.strerror}\n"))
+                        self.status = 1
+                    if out:
+                        yield from out
+                        out.clear()
+                if item.directory and not self.depth_first and not item.pruned:
+                    children = yield from self._children(item, pool)
+                    stack.append(iter(children))
+
+            for action in self.batches:
+                action.flush(out)
+            while self.pending:
+                self._finish_batch(out)
+            yield from out
+        finally:
+            # Closed early: work that has not started never will (by hand, as
+            # shutdown's cancel_futures needs Python 3.9)
+            for future in itertools.chain(self.prefetched, self.pending):
+                future.cancel()
+            if pool is not None:
+                pool.shutdown(wait=False)
+            if self.executor is not None:
+                self.executor.shutdown(wait=False)
+        return self.status
@@ -0,0 +1,95 @@
+# file_watch.py - Waiting for Files to Change
+"""Block until one of a set of files is written to, for ``tail -f``.
+
+On Linux the files are watched with inotify, so a follower sleeps in
+``select`` until the kernel reports a change and costs nothing while the
+files are idle. Elsewhere, or when inotify is unavailable, ``wait``
+simply sleeps for the poll interval and the caller checks the files.
+"""
+import os
+import select
+import sys
+import time
+from typing import Iterable, Optional
+
+IN_MODIFY = 0x002
+IN_ATTRIB = 0x004
+IN_DELETE_SELF = 0x400
+IN_MOVE_SELF = 0x800
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+# libc with inotify, loaded by _load_libc on first use
+_libc = None
+_libc_loaded = False
+
+
+def _load_libc():
+    """libc if it has inotify, else None; ctypes is only imported here"""
+    global _libc, _libc_loaded
+    if not _libc_loaded:
+        if sys.platform.startswith('linux'):
+            try:
+                import ctypes
+                libc = ctypes.CDLL(None, use_errno=True)
+                libc.inotify_init1
+                _libc = libc
+            except (OSError, AttributeError):
+                pass
+        _libc_loaded = True
+    return _libc
+
+
+def inotify_supported() -> bool:
+    """True if files can be watched with inotify"""
+    return _load_libc() is not None
+
+
+class FileWatcher:
+    """Waits for changes to any of the given files"""
+
+    def __init__(self, paths: Iterable[str], poll_interval: float = 0.5):
+        self.poll_interval = poll_interval
+        self.fd: Optional[int] = None
+        if _load_libc() is not None:
+            self.fd = self._watch(list(paths))
+
+    @staticmethod
+    def _watch(paths) -> Optional[int]:
+        """An inotify descriptor watching every path, or None to fall back to polling"""
+        fd = _libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            return None
+        mask = IN_MODIFY | IN_ATTRIB | IN_DELETE_SELF | IN_MOVE_SELF
+        for path in paths:
+            if _libc.inotify_add_watch(fd, os.fsencode(path), mask) < 0:
+                os.close(fd)
+                return None
+        return fd
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Wait up to timeout seconds (None: no limit); False if the files certainly did not change"""
+        if self.fd is None:
+            time.sleep(self.poll_interval if timeout is None else min(timeout, self.poll_interval))
+            return True
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return False
+        # Drain the queued events; the caller rereads the files anyway
+        try:
+            while os.read(self.fd, 4096):
+                pass
+        except BlockingIOError:
+            pass
+        return True
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def __enter__(self) -> 'FileWatcher':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,314 @@
+# glob_expand.py - Brace and Glob Expansion
+"""Shell-style brace expansion and pathname globbing.
+
+Patterns come from the command parser with quoted characters backslash
+escaped, so ``"*".py`` arrives as ``\\*.py`` and is matched literally.
+A ``Globber`` lists each directory with a single ``os.scandir`` pass and
+keeps the listing for the rest of the command, so several patterns over
+the same large directory scan it only once.
+"""
+import os
+import re
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+GLOB_CHARS = '*?['
+
+
+def _split_escapes(pattern: str) -> Iterator[Tuple[str, bool]]:
+    """Yield (char, escaped) pairs of a backslash-escaped pattern"""
+    i = 0
+    while i < len(pattern):
+        if pattern[i] == '\\' and i + 1 < len(pattern):
+            yield pattern[i + 1], True
+            i += 2
+        else:
+            yield pattern[i], False
+            i += 1
+
+
+def unescape(pattern: str) -> str:
+    """Remove pattern escapes, giving the literal word"""
+    return ''.join(char for char, _ in _split_escapes(pattern))
+
+
+def has_magic(pattern: str) -> bool:
+    """True if the pattern contains unescaped glob characters"""
+    return any(char in GLOB_CHARS and not escaped for char, escaped in _split_escapes(pattern))
+
+
+class _Sequence:
+    """Items of a {1..5} or {a..e} sequence expression, made only when iterated"""
+
+    def __init__(self, start: int, end: int, form: Callable[[int], str]):
+        self.step = 1 if end >= start else -1
+        self.start = start
+        self.end = end
+        self.form = form
+        self.size = (end - start) // self.step + 1
+
+    def __iter__(self) -> Iterator[str]:
+        return map(self.form, range(self.start, self.end + self.step, self.step))
+
+
+def _brace_range(body: str) -> Optional[_Sequence]:
+    """Items of a {1..5} or {a..e} sequence expression, or None"""
+    match = re.fullmatch(r'(-?\d+)\.\.(-?\d+)|([A-Za-z])\.\.([A-Za-z])', body)
+    if match is None:
+        return None
+    if match.group(1) is not None:
+        start, end = int(match.group(1)), int(match.group(2))
+        form = str
+    else:
+        start, end = ord(match.group(3)), ord(match.group(4))
+        form = chr
+    return _Sequence(start, end, form)
+
+
+def _first_group(pattern: str) -> Optional[Tuple[int, int, Union[List[str], _Sequence]]]:
+    """(start, end, items) of the first brace group that expands, or None
+
+    Braces without a top-level comma or a sequence are skipped. An
+    unbalanced brace ends the search, since nothing after it can expand.
+    """
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == '\\':
+            i += 2
+            continue
+        if char != '{':
+            i += 1
+            continue
+
+        # Find the matching brace and the top-level commas
+        depth = 0
+        commas = []
+        j = i
+        while j < len(pattern):
+            if pattern[j] == '\\':
+                j += 2
+                continue
+            if pattern[j] == '{':
+                depth += 1
+            elif pattern[j] == '}':
+                depth -= 1
+                if depth == 0:
+                    break
+            elif pattern[j] == ',' and depth == 1:
+                commas.append(j)
+            j += 1
+        if j >= len(pattern):
+            return None
+
+        if commas:
+            bounds = [i] + commas + [j]
+            return i, j, [pattern[start + 1:end] for start, end in zip(bounds, bounds[1:])]
+        items = _brace_range(pattern[i + 1:j])
+        if items is not None:
+            return i, j, items
+        i += 1
+    return None
+
+
+def _word_count(pattern: str, limit: int, counts: Dict[str, int]) -> int:
+    """Words pattern expands to, counted without expanding; stops early past limit"""
+    if pattern in counts:
+        return counts[pattern]
+    group = _first_group(pattern)
+    if group is None:
+        return 1
+    _, end, items = group
+    suffix = pattern[end + 1:]
+    if isinstance(items, _Sequence):
+        # Sequence items hold no braces, so each expands with the suffix alone
+        total = items.size * _word_count(suffix, limit, counts)
+    else:
+        total = 0
+        for item in items:
+            total += _word_count(item + suffix, limit, counts)
+            if total > limit:
+                break
+    counts[pattern] = total
+    return total
+
+
+def _expand(pattern: str) -> List[str]:
+    group = _first_group(pattern)
+    if group is None:
+        return [pattern]
+    start, end, items = group
+    prefix, suffix = pattern[:start], pattern[end + 1:]
+    return [prefix + tail for item in items for tail in _expand(item + suffix)]
+
+
+def expand_braces(pattern: str, limit: int = 100000) -> List[str]:
+    """Expand {a,b} alternatives and {1..3} sequences, left to right
+
+    Braces without a top-level comma or a sequence are kept literally.
+    Raises ValueError, before expanding anything, when the expansion
+    would exceed limit words.
+    """
+    if _word_count(pattern, limit, {}) > limit:
+        raise ValueError(f"brace expansion of {unescape(pattern)} exceeds {limit} words")
+    return _expand(pattern)
+
+
+def _compile(component: str) -> Callable[[str], bool]:
+    """Matcher for one path component; '*' and '?' do not match a leading dot"""
+    chars = list(_split_escapes(component))
+    hidden_ok = bool(chars) and chars[0][0] == '.'
+
+    # Fast paths for '*', '*suffix' and 'prefix*'
+    stars = [index for index, (char, escaped) in enumerate(chars) if char in GLOB_CHARS and not escaped]
+    if stars and len(stars) == 1 and chars[stars[0]][0] == '*':
+        prefix = ''.join(char for char, _ in chars[:stars[0]])
+        suffix = ''.join(char for char, _ in chars[stars[0] + 1:])
+        min_length = len(prefix) + len(suffix)
+        return lambda name: (len(name) >= min_length and name.startswith(prefix) and name.endswith(suffix)
+                             and (hidden_ok or not name.startswith('.')))
+
+    regex = []
+    i = 0
+    while i < len(chars):
+        char, escaped = chars[i]
+        if escaped:
+            regex.append(re.escape(char))
+        elif char == '*':
+            regex.append('.*')
+        elif char == '?':
+            regex.append('.')
+        elif char == '[':
+            # Character class up to the next unescaped ']' (a leading ']' is literal)
+            j = i + 1
+            if j < len(chars) and chars[j] in (('!', False), ('^', False)):
+                j += 1
+            if j < len(chars) and chars[j] == (']', False):
+                j += 1
+            while j < len(chars) and chars[j] != (']', False):
+                j += 1
+            if j >= len(chars):
+                regex.append(re.escape('['))
+            else:
+                members = chars[i + 1:j]
+                negate = bool(members) and members[0] in (('!', False), ('^', False))
+                if negate:
+                    members = members[1:]
+                body = ''.join(re.escape(char) if escaped or char in '\\^]' else char
+                               for char, escaped in members)
+                regex.append(f"[{'^' if negate else ''}{body}]")
+                i = j
+        else:
+            regex.append(re.escape(char))
+        i += 1
+
+    compiled = re.compile(''.join(regex), re.DOTALL)
+    if hidden_ok:
+        return lambda name: compiled.fullmatch(name) is not None
+    return lambda name: not name.startswith('.') and compiled.fullmatch(name) is not None
+
+
+class Globber:
+    """Expands words for one command, reusing directory listings
+
+    ``limit`` bounds the number of words a single pattern may produce;
+    ValueError is raised beyond it.
+    """
+
+    def __init__(self, cwd: str, limit: int = 100000):
+        self.cwd = cwd
+        self.limit = limit
+        # Filesystem path -> [(name, is_dir, is_symlink)]
+        self.listings: Dict[str, List[Tuple[str, bool, bool]]] = {}
+
+    def _list(self, base: str) -> List[Tuple[str, bool, bool]]:
+        path = os.path.join(self.cwd, base) if base else self.cwd
+        listing = self.listings.get(path)
+        if listing is None:
+            listing = []
+            try:
+                with os.scandir(path) as entries:
+                    for entry in entries:
+                        try:
+                            listing.append((entry.name, entry.is_dir(), entry.is_symlink()))
+                        except OSError:
+                            listing.append((entry.name, False, False))
+            except OSError:
+                pass
+            self.listings[path] = listing
+        return listing
+
+    @staticmethod
+    def _join(base: str, name: str) -> str:
+        if not base:
+            return name
+        return base + name if base.endswith('/') else base + '/' + name
+
+    def _walk(self, base: str, include_files: bool) -> Iterator[str]:
+        """Everything below base that '**' matches, without hidden or symlinked directories"""
+        for name, is_dir, is_symlink in self._list(base):
+            if name.startswith('.'):
+                continue
+            path = self._join(base, name)
+            if is_dir or include_files:
+                yield path
+            if is_dir and not is_symlink:
+                yield from self._walk(path, include_files)
+
+    def _check(self, paths: List[str], pattern: str):
+        if len(paths) > self.limit:
+            raise ValueError(f"{unescape(pattern)}: too many matches (limit {self.limit})")
+
+    def glob(self, pattern: str) -> List[str]:
+        """Sorted paths matching a single (brace-free) pattern"""
+        paths = ['/'] if pattern.startswith('/') else ['']
+        directories_only = pattern.endswith('/')
+        components = [component for component in pattern.split('/') if component]
+        literal_after_magic = False
+        matched = False
+
+        for index, component in enumerate(components):
+            is_last = index == len(components) - 1
+            if component == '**':
+                found = []
+                for base in paths:
+                    if not is_last:
+                        found.append(base)
+                    found.extend(self._walk(base, include_files=is_last and not directories_only))
+                    self._check(found, pattern)
+                paths = found
+                matched = True
+                continue
+
+            if not has_magic(component):
+                literal = unescape(component)
+                paths = [self._join(base, literal) for base in paths]
+                literal_after_magic = literal_after_magic or matched
+                continue
+
+            matches = _compile(component)
+            need_dir = not is_last or directories_only
+            found = []
+            for base in paths:
+                for name, is_dir, _ in self._list(base):
+                    if (is_dir or not need_dir) and matches(name):
+                        found.append(self._join(base, name))
+                self._check(found, pattern)
+            paths = found
+            matched = True
+
+        if literal_after_magic:
+            paths = [path for path in paths if os.path.lexists(os.path.join(self.cwd, path))]
+        if directories_only:
+            paths = [path if path.endswith('/') else path + '/' for path in paths]
+        return sorted(paths)
+
+    def expand(self, pattern: str) -> List[str]:
+        """Words for one pattern: braces first, then globs; unmatched globs stay literal"""
+        words = []
+        for item in expand_braces(pattern, self.limit):
+            if has_magic(item):
+                words.extend(self.glob(item) or [unescape(item)])
+            else:
+                words.append(unescape(item))
+            self._check(words, pattern)
+        return words
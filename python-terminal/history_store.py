@@ -0,0 +1,237 @@
+# history_store.py - Persistent Command History
+"""Command history kept in a ring buffer and, optionally, an SQLite database.
+
+The most recent entries live in memory for ``history`` and arrow-key
+navigation. With a database path every entry is also written to SQLite,
+together with its start time, working directory, exit code and duration,
+and indexed with FTS5 for search. The database can be shared by many
+terminals (WAL mode), so history survives restarts. Each entry records
+its owner, and a history only loads and searches its own owner's
+entries, so sessions sharing a database never see each other's commands;
+entries are numbered from 1 for each owner, so their numbers do not
+reveal how much other sessions ran either.
+Without FTS5 support, searches fall back to LIKE.
+"""
+import os
+import re
+import threading
+import time
+from collections import deque
+from typing import List, NamedTuple, Optional
+
+
+def default_path() -> str:
+    """History database of the interactive interfaces: $TERMINAL_HISTORY or ~/.terminal_history.db"""
+    return os.environ.get('TERMINAL_HISTORY') or os.path.expanduser('~/.terminal_history.db')
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS history (
+    id INTEGER PRIMARY KEY,
+    command TEXT NOT NULL,
+    timestamp REAL NOT NULL,
+    cwd TEXT,
+    exit_code INTEGER,
+    duration REAL,
+    owner TEXT,
+    number INTEGER
+);
+"""
+
+OWNER_INDEX = "CREATE INDEX IF NOT EXISTS history_owner ON history(owner, id)"
+
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS history_fts USING fts5(command, content='history', content_rowid='id');
+CREATE TRIGGER IF NOT EXISTS history_fts_insert AFTER INSERT ON history BEGIN
+    INSERT INTO history_fts(rowid, command) VALUES (new.id, new.command);
+END;
+CREATE TRIGGER IF NOT EXISTS history_fts_delete AFTER DELETE ON history BEGIN
+    INSERT INTO history_fts(history_fts, rowid, command) VALUES ('delete', old.id, old.command);
+END;
+"""
+
+
+class HistoryEntry(NamedTuple):
+    """One executed command line"""
+    number: int
+    command: str
+    timestamp: float
+    cwd: Optional[str]
+    exit_code: Optional[int]
+    duration: Optional[float]
+
+    def to_dict(self) -> dict:
+        return {
+            'number': self.number,
+            'command': self.command,
+            'timestamp': self.timestamp,
+            'cwd': self.cwd,
+            'returnCode': self.exit_code,
+            'duration': self.duration,
+        }
+
+
+class CommandHistory:
+    """The recent commands of a session, optionally persisted to SQLite
+
+    ``capacity`` entries are kept in memory; older ones are dropped from
+    the buffer in O(1) but stay in the database. Entries are stored and
+    read under ``owner`` (None for the local user's own terminals). If
+    the database cannot be opened or written, the history carries on in
+    memory only.
+    """
+
+    # The HistoryEntry fields of a row of history h
+    COLUMNS = "h.number, h.command, h.timestamp, h.cwd, h.exit_code, h.duration"
+
+    def __init__(self, path: Optional[str] = None, capacity: int = 1000, owner: Optional[str] = None):
+        self.path = path
+        self.owner = owner
+        self.entries = deque(maxlen=capacity)
+        self.lock = threading.Lock()
+        self.connection = None  # sqlite3.Connection; sqlite3 is only imported for a database
+        self.fts = False
+        self.next_number = 1
+        if path is not None:
+            self._open(path)
+
+    def _open(self, path: str):
+        import sqlite3
+        try:
+            connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(SCHEMA)
+            columns = {row[1] for row in connection.execute("PRAGMA table_info(history)")}
+            if 'owner' not in columns:
+                connection.execute("ALTER TABLE history ADD COLUMN owner TEXT")  # Databases from before owners
+            if 'number' not in columns:
+                connection.execute("ALTER TABLE history ADD COLUMN number INTEGER")
+                self._number_entries(connection)
+            connection.execute(OWNER_INDEX)
+            try:
+                connection.executescript(FTS_SCHEMA)
+                self.fts = True
+            except sqlite3.OperationalError:
+                pass  # SQLite built without FTS5
+            rows = connection.execute(
+                f"SELECT {self.COLUMNS} FROM history h "
+                f"WHERE owner IS ? ORDER BY id DESC LIMIT ?", (self.owner, self.entries.maxlen)).fetchall()
+        except sqlite3.Error:
+            return
+        self.connection = connection
+        self.entries.extend(HistoryEntry(*row) for row in reversed(rows))
+        if rows:
+            self.next_number = rows[0][0] + 1
+
+    @staticmethod
+    def _number_entries(connection):
+        """Number the entries of a database from before numbers, from 1 per owner in id order"""
+        counts = {}
+        numbers = []
+        for entry_id, owner in connection.execute("SELECT id, owner FROM history ORDER BY id"):
+            counts[owner] = counts.get(owner, 0) + 1
+            numbers.append((counts[owner], entry_id))
+        connection.execute("BEGIN")
+        connection.executemany("UPDATE history SET number = ? WHERE id = ?", numbers)
+        connection.execute("COMMIT")
+
+    def add(self, command: str, cwd: Optional[str] = None, exit_code: Optional[int] = None,
+            duration: Optional[float] = None, timestamp: Optional[float] = None) -> HistoryEntry:
+        """Record a finished command line"""
+        if timestamp is None:
+            timestamp = time.time()
+        with self.lock:
+            number = self.next_number
+            if self.connection is not None:
+                import sqlite3
+                try:
+                    # Numbered after the owner's latest entry, which other
+                    # terminals of the same owner may have added
+                    entry_id = self.connection.execute(
+                        "INSERT INTO history (command, timestamp, cwd, exit_code, duration, owner, number) "
+                        "VALUES (?, ?, ?, ?, ?, ?, COALESCE("
+                        "(SELECT number FROM history WHERE owner IS ? ORDER BY id DESC LIMIT 1), 0) + 1)",
+                        (command, timestamp, cwd, exit_code, duration, self.owner, self.owner)).lastrowid
+                    number = self.connection.execute(
+                        "SELECT number FROM history WHERE id = ?", (entry_id,)).fetchone()[0]
+                except sqlite3.Error:
+                    pass  # Keep the entry in memory
+            entry = HistoryEntry(number, command, timestamp, cwd, exit_code, duration)
+            self.entries.append(entry)
+            self.next_number = number + 1
+            return entry
+
+    def recent(self, count: Optional[int] = None) -> List[HistoryEntry]:
+        """The last count entries in memory, oldest first"""
+        with self.lock:
+            entries = list(self.entries)
+        return entries if count is None else entries[-count:] if count > 0 else []
+
+    def commands(self) -> List[str]:
+        return [entry.command for entry in self.recent()]
+
+    def newest(self, limit: int = 50, offset: int = 0) -> List[HistoryEntry]:
+        """Entries newest first, skipping offset; from the database when there is one"""
+        if self.connection is None:
+            entries = self.recent()
+            end = max(len(entries) - offset, 0)
+            return entries[max(end - limit, 0):end][::-1]
+
+        import sqlite3
+        with self.lock:
+            try:
+                rows = self.connection.execute(
+                    f"SELECT {self.COLUMNS} FROM history h WHERE h.owner IS ? ORDER BY h.id DESC LIMIT ? OFFSET ?",
+                    (self.owner, limit, offset)).fetchall()
+            except sqlite3.Error:
+                return []
+        return [HistoryEntry(*row) for row in rows]
+
+    @staticmethod
+    def _match_query(term: str) -> Optional[str]:
+        """FTS5 query matching every word of term as a prefix, or None if it has no words"""
+        words = re.findall(r'\w+', term)
+        if not words:
+            return None
+        return ' '.join(f'"{word}"*' for word in words)
+
+    def search(self, term: str, limit: int = 50, offset: int = 0) -> List[HistoryEntry]:
+        """Matching entries, newest first
+
+        The database, when there is one, is searched with FTS: every word
+        of term must start a word of the command, in any order. Otherwise
+        term is matched as a substring of the commands in memory.
+        """
+        if self.connection is None:
+            needle = term.lower()
+            matches = [entry for entry in reversed(self.recent()) if needle in entry.command.lower()]
+            return matches[offset:offset + limit]
+
+        import sqlite3
+        columns = self.COLUMNS
+        query = self._match_query(term) if self.fts else None
+        with self.lock:
+            try:
+                if query is not None:
+                    rows = self.connection.execute(
+                        f"SELECT {columns} FROM history_fts JOIN history h ON h.id = history_fts.rowid "
+                        f"WHERE history_fts MATCH ? AND h.owner IS ? ORDER BY h.id DESC LIMIT ? OFFSET ?",
+                        (query, self.owner, limit, offset)).fetchall()
+                else:
+                    pattern = '%' + term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+                    rows = self.connection.execute(
+                        f"SELECT {columns} FROM history h WHERE h.command LIKE ? ESCAPE '\\' AND h.owner IS ? "
+                        f"ORDER BY h.id DESC LIMIT ? OFFSET ?", (pattern, self.owner, limit, offset)).fetchall()
+            except sqlite3.Error:
+                return []
+        return [HistoryEntry(*row) for row in rows]
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def close(self):
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
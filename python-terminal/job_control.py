@@ -0,0 +1,220 @@
+# job_control.py - Background Job Table
+import os
+import signal
+import subprocess
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Iterator, List, Optional
+
+
+def signal_process_group(process, signum: int):
+    """Send a signal to a child's process group, or to the child alone off POSIX
+
+    Children are started as process group leaders, so this reaches any
+    grandchildren too. Groups whose members have all exited are ignored.
+    """
+    try:
+        if os.name == 'posix':
+            os.killpg(process.pid, signum)
+        elif process.returncode is None:
+            process.send_signal(signum)
+    except (ProcessLookupError, PermissionError, OSError):
+        pass
+
+
+class OutputBuffer:
+    """Bounded buffer holding the most recent output of a background job
+
+    When the buffer is full the oldest text is discarded, so a chatty job
+    costs at most ``max_chars`` characters of memory however long it runs.
+    """
+
+    def __init__(self, max_chars: int):
+        self.max_chars = max_chars
+        self.chunks = deque()
+        self.size = 0
+        self.discarded = 0
+        self.lock = threading.Lock()
+        self.ready = threading.Condition(self.lock)
+
+    def write(self, text: str):
+        """Append text, discarding the oldest output beyond the limit"""
+        with self.lock:
+            self.chunks.append(text)
+            self.size += len(text)
+            while self.size > self.max_chars:
+                overflow = self.size - self.max_chars
+                oldest = self.chunks[0]
+                if len(oldest) <= overflow:
+                    self.chunks.popleft()
+                    self.size -= len(oldest)
+                    self.discarded += len(oldest)
+                else:
+                    self.chunks[0] = oldest[overflow:]
+                    self.size -= overflow
+                    self.discarded += overflow
+            self.ready.notify_all()
+
+    def read(self) -> str:
+        """Return and clear the buffered output"""
+        with self.lock:
+            text = ''.join(self.chunks)
+            if self.discarded:
+                text = f"[... {self.discarded} characters of earlier output discarded]\n" + text
+            self.chunks.clear()
+            self.size = 0
+            self.discarded = 0
+            return text
+
+    def wait(self, timeout: Optional[float] = None):
+        """Block until more output is written or the timeout expires"""
+        with self.lock:
+            if not self.chunks:
+                self.ready.wait(timeout)
+
+    def notify(self):
+        """Wake up readers waiting for output"""
+        with self.lock:
+            self.ready.notify_all()
+
+
+class Job:
+    """A command list running in the background of a terminal session"""
+
+    def __init__(self, job_id: int, command: str, buffer_size: int):
+        self.id = job_id
+        self.command = command
+        self.output = OutputBuffer(buffer_size)
+        self.processes: List[subprocess.Popen] = []
+        self.return_code: Optional[int] = None
+        self.stopped = False
+        self.cancelled = threading.Event()  # Set when killed, for builtins that run until then
+        self.started = time.time()
+        self.finished = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def state(self) -> str:
+        """Job state as shown by the jobs builtin"""
+        if self.finished.is_set():
+            return "Done" if self.return_code == 0 else f"Exit {self.return_code}"
+        return "Stopped" if self.stopped else "Running"
+
+    def signal(self, signum: int) -> int:
+        """Send a signal to every running process of the job; returns how many were running"""
+        running = 0
+        for process in list(self.processes):
+            if process.poll() is None:
+                signal_process_group(process, signum)
+                running += 1
+        return running
+
+    def stop(self) -> bool:
+        """Suspend the job's processes (kill -STOP %job); False if none are running
+
+        Builtins run in the job's thread and cannot be suspended, so a job
+        only counts as stopped once an external process was.
+        """
+        if hasattr(signal, 'SIGSTOP') and self.signal(signal.SIGSTOP):
+            self.stopped = True
+        return self.stopped
+
+    def resume(self):
+        """Continue a stopped job"""
+        if hasattr(signal, 'SIGCONT'):
+            self.signal(signal.SIGCONT)
+        self.stopped = False
+
+    def terminate(self, signum: Optional[int] = None):
+        """Terminate the job's processes (SIGTERM by default), and its builtins that check cancelled"""
+        self.cancelled.set()
+        self.resume()
+        self.signal(signal.SIGTERM if signum is None else signum)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Wait for the job to finish; return True if it did"""
+        return self.finished.wait(timeout)
+
+    def follow(self) -> Iterator[str]:
+        """Yield the job's buffered output, then live output until it finishes"""
+        while True:
+            done = self.finished.is_set()
+            text = self.output.read()
+            if text:
+                yield text
+            if done:
+                return
+            self.output.wait(0.5)
+
+    def _run(self, chunks: Iterator[str]):
+        """Thread body: copy the command's output into the buffer"""
+        status = 1
+        try:
+            while True:
+                try:
+                    self.output.write(next(chunks))
+                except StopIteration as stop:
+                    status = stop.value or 0
+                    break
+        except Exception as e:
+            self.output.write(f"Error in background job: {str(e)}\n")
+        finally:
+            self.return_code = status
+            self.finished.set()
+            self.output.notify()
+
+
+class JobTable:
+    """Background jobs of one terminal session, keyed by job number"""
+
+    def __init__(self, buffer_size: int = 1024 * 1024):
+        self.buffer_size = buffer_size
+        self.jobs: Dict[int, Job] = {}
+        self.lock = threading.Lock()
+
+    def start(self, command: str, runner: Callable[[Job], Iterator[str]]) -> Job:
+        """Start ``runner(job)`` in a background thread and register the job"""
+        with self.lock:
+            job_id = max(self.jobs, default=0) + 1
+            job = Job(job_id, command, self.buffer_size)
+            self.jobs[job_id] = job
+
+        job.thread = threading.Thread(target=job._run, args=(runner(job),), daemon=True)
+        job.thread.start()
+        return job
+
+    def get(self, spec: Optional[str] = None) -> Job:
+        """Look up a job by spec ('%1', '1', '%+', '%%'), defaulting to the latest"""
+        with self.lock:
+            if not self.jobs:
+                raise ValueError("no current job")
+            if spec in (None, '%', '%%', '%+'):
+                return self.jobs[max(self.jobs)]
+            try:
+                return self.jobs[int(spec.lstrip('%'))]
+            except (ValueError, KeyError):
+                raise ValueError(f"{spec}: no such job")
+
+    def remove(self, job: Job):
+        """Forget a job"""
+        with self.lock:
+            self.jobs.pop(job.id, None)
+
+    def current(self) -> Optional[Job]:
+        """The job running on the calling thread, if any"""
+        thread = threading.current_thread()
+        with self.lock:
+            return next((job for job in self.jobs.values() if job.thread is thread), None)
+
+    def finished(self) -> List[Job]:
+        """Jobs that have completed, in job number order"""
+        with self.lock:
+            return [job for _, job in sorted(self.jobs.items()) if job.finished.is_set()]
+
+    def __iter__(self):
+        with self.lock:
+            return iter([job for _, job in sorted(self.jobs.items())])
+
+    def __len__(self):
+        return len(self.jobs)
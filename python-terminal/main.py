@@ -13,13 +13,54 @@ Examples:
   python main.py web          # Launch web interface
   python main.py ai           # Launch AI-powered terminal
   python main.py web --port 8080 --host 0.0.0.0  # Custom web server settings
+  python main.py run script.txt   # Run a script of commands
+  python main.py -c "ls; pwd"     # Run a command line
+  cat script.txt | python main.py run   # Run commands read from stdin
         """
     )
     
     parser.add_argument(
         'interface',
-        choices=['cli', 'web', 'ai'],
-        help='Interface type to launch'
+        nargs='?',
+        choices=['cli', 'web', 'ai', 'run'],
+        help='Interface type to launch, or run to execute scripts'
+    )
+    
+    parser.add_argument(
+        'scripts',
+        nargs='*',
+        help='Scripts for run mode (default: read commands from stdin)'
+    )
+    
+    parser.add_argument(
+        '--ulimit',
+        metavar='OPTIONS',
+        help='Resource limits for web sessions, as ulimit options (e.g. "-t 60 -v 1048576")'
+    )
+    
+    parser.add_argument(
+        '--nice',
+        type=int,
+        help='Niceness increment for commands of web sessions'
+    )
+    
+    parser.add_argument(
+        '-c',
+        dest='command',
+        metavar='COMMAND',
+        help='Run a command line without the interactive interface'
+    )
+    
+    parser.add_argument(
+        '-e', '--stop-on-error',
+        action='store_true',
+        help='Stop run mode at the first failing command'
+    )
+    
+    parser.add_argument(
+        '--timeout',
+        type=float,
+        help='Time limit in seconds for each command in run mode (0 for none)'
     )
     
     parser.add_argument(
@@ -41,10 +82,21 @@ Examples:
         help='Enable debug mode for web interface'
     )
     
-    args = parser.parse_args()
+    args = parser.parse_intermixed_args()
+    if args.command is not None and args.interface not in (None, 'run'):
+        parser.error("-c cannot be combined with the cli, web or ai interface")
+    if args.interface is None and args.command is None:
+        parser.error("an interface or -c COMMAND is required")
+    if args.scripts and args.interface != 'run':
+        parser.error("scripts can only be given to run")
     
     try:
-        if args.interface == 'cli':
+        if args.command is not None or args.interface == 'run':
+            from batch_interface import main as batch_main
+            sys.exit(batch_main(args.scripts, command=args.command,
+                                stop_on_error=args.stop_on_error, timeout=args.timeout))
+        
+        elif args.interface == 'cli':
             print("Launching CLI Terminal...")
             from cli_interface import main as cli_main
             cli_main()
@@ -52,7 +104,16 @@ Examples:
         elif args.interface == 'web':
             print("Launching Web Terminal...")
             from web_interface import run_web_server
-            run_web_server(host=args.host, port=args.port, debug=args.debug)
+            from process_limits import ProcessLimits, parse_ulimit
+            limits = ProcessLimits(nice=args.nice or None)
+            if args.ulimit:
+                try:
+                    limits, _, rest = parse_ulimit(args.ulimit.split(), limits)
+                except ValueError as e:
+                    parser.error(f"--ulimit: {e}")
+                if rest:
+                    parser.error(f"--ulimit: unexpected {' '.join(rest)}")
+            run_web_server(host=args.host, port=args.port, debug=args.debug, limits=limits)
         
         elif args.interface == 'ai':
             print("Launching AI-Powered Terminal...")
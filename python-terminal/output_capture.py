@@ -0,0 +1,108 @@
+# output_capture.py - Bounded Output Capture
+from typing import Iterator, List, Optional
+
+# Most output written to a spill file; anything after it is only counted
+DEFAULT_MAX_SPILL_BYTES = 256 * 1024 * 1024
+
+# Characters read back from the spill file at a time
+READ_CHUNK = 64 * 1024
+
+
+class CapturedOutput:
+    """Collects command output in memory up to a byte limit
+
+    Output beyond ``max_bytes`` is not kept in memory: the whole output,
+    up to ``max_spill_bytes``, is written to an anonymous temporary file
+    instead. ``getvalue()`` returns the in-memory head followed by a
+    truncation note, and ``full_output()`` reads the saved output back.
+    The file is deleted by ``close()``.
+    """
+
+    def __init__(self, max_bytes: Optional[int] = None, max_spill_bytes: int = DEFAULT_MAX_SPILL_BYTES):
+        self.max_bytes = max_bytes
+        self.max_spill_bytes = max_spill_bytes
+        self.chunks: List[str] = []
+        self.size = 0
+        self.total = 0
+        self.spilled = 0
+        self.spill_file = None
+
+    @staticmethod
+    def _byte_length(text: str) -> int:
+        return len(text) if text.isascii() else len(text.encode('utf-8', 'replace'))
+
+    def _spill(self, text: str, length: int):
+        """Write a chunk to the spill file, as far as the spill limit allows"""
+        room = self.max_spill_bytes - self.spilled
+        if room <= 0:
+            return
+        if length > room:
+            text = text.encode('utf-8', 'replace')[:room].decode('utf-8', 'ignore')
+            length = self._byte_length(text)
+        self.spill_file.write(text)
+        self.spilled += length
+
+    def write(self, text: str):
+        """Add a chunk of output"""
+        length = self._byte_length(text)
+        self.total += length
+
+        if self.spill_file is not None:
+            self._spill(text, length)
+            return
+
+        if self.max_bytes is None or self.size + length <= self.max_bytes:
+            self.chunks.append(text)
+            self.size += length
+            return
+
+        # Over the limit: keep what fits in memory, move everything to disk
+        import tempfile
+        self.spill_file = tempfile.TemporaryFile('w+', encoding='utf-8', errors='replace', prefix='terminal-output-')
+        for chunk in self.chunks:
+            self._spill(chunk, self._byte_length(chunk))
+        self._spill(text, length)
+
+        room = self.max_bytes - self.size
+        if room > 0:
+            head = text.encode('utf-8', 'replace')[:room].decode('utf-8', 'ignore')
+            self.chunks.append(head)
+            self.size += self._byte_length(head)
+
+    @property
+    def truncated(self) -> bool:
+        """Whether the output outgrew the in-memory limit"""
+        return self.spill_file is not None
+
+    def full_output(self) -> Iterator[str]:
+        """The output as written, read back from the spill file if there is one
+
+        Output past ``max_spill_bytes`` is missing.
+        """
+        if self.spill_file is None:
+            yield from self.chunks
+            return
+        if self.spill_file.closed:
+            raise ValueError("captured output was closed")
+        self.spill_file.flush()
+        self.spill_file.seek(0)
+        while True:
+            text = self.spill_file.read(READ_CHUNK)
+            if not text:
+                break
+            yield text
+        self.spill_file.seek(0, 2)
+
+    def close(self):
+        """Close and delete the spill file"""
+        if self.spill_file is not None and not self.spill_file.closed:
+            self.spill_file.close()
+
+    def getvalue(self) -> str:
+        """The captured output, with a truncation note if it was spilled"""
+        output = ''.join(self.chunks)
+        if self.spill_file is not None:
+            if not output.endswith('\n'):
+                output += '\n'
+            output += f"[output truncated at {self.size} of {self.total} bytes]\n"
+        return output
@@ -0,0 +1,209 @@
+# process_limits.py - Resource Limits and Priority for External Commands
+"""CPU time, address space and open-file limits, plus CPU and I/O priority.
+
+A ``ProcessLimits`` is applied in the child between fork and exec, so it
+only ever affects the command being started, never the terminal. Hard
+limits are lowered along with soft ones, so a command cannot raise them
+back. Fields left as None keep whatever the terminal itself has.
+"""
+import os
+import sys
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# ulimit option -> (ProcessLimits field, resource name, multiplier, description)
+RLIMITS = {
+    't': ('cpu', 'RLIMIT_CPU', 1, 'cpu time (seconds)'),
+    'v': ('address_space', 'RLIMIT_AS', 1024, 'virtual memory (kbytes)'),
+    'n': ('open_files', 'RLIMIT_NOFILE', 1, 'open files'),
+}
+
+IO_CLASSES = {'none': 0, 'realtime': 1, 'best-effort': 2, 'idle': 3}
+
+# ioprio_set has no libc wrapper; syscall numbers by machine
+_IOPRIO_SET = {'x86_64': 251, 'i386': 289, 'i686': 289, 'aarch64': 30, 'riscv64': 30}
+_IOPRIO_WHO_PROCESS = 1
+_IOPRIO_CLASS_SHIFT = 13
+
+# libc's syscall() and ctypes.get_errno, loaded by _load_syscall on first use
+_syscall = None
+_get_errno = None
+_syscall_loaded = False
+
+
+def _machine() -> str:
+    return os.uname().machine if hasattr(os, 'uname') else ''
+
+
+def _load_syscall():
+    """libc's syscall(), or None where ioprio_set is unavailable
+
+    ctypes is only imported here, so that importing this module stays
+    cheap; preexec_fn() calls this in the parent, never between fork
+    and exec.
+    """
+    global _syscall, _get_errno, _syscall_loaded
+    if not _syscall_loaded:
+        if sys.platform.startswith('linux') and _machine() in _IOPRIO_SET:
+            try:
+                import ctypes
+                _syscall = ctypes.CDLL(None, use_errno=True).syscall
+                _get_errno = ctypes.get_errno
+            except (OSError, AttributeError):
+                pass
+        _syscall_loaded = True
+    return _syscall
+
+
+def io_priority_supported() -> bool:
+    """True if I/O priorities can be set on this system"""
+    return _load_syscall() is not None
+
+
+def set_io_priority(io_class: int, level: int, pid: int = 0):
+    """ioprio_set(2) for a process (0 for the calling one)"""
+    syscall = _load_syscall()
+    if syscall is None:
+        raise OSError("I/O priority is not supported on this system")
+    value = (io_class << _IOPRIO_CLASS_SHIFT) | (level if io_class in (1, 2) else 0)
+    if syscall(_IOPRIO_SET[_machine()], _IOPRIO_WHO_PROCESS, pid, value) != 0:
+        errno = _get_errno()
+        raise OSError(errno, os.strerror(errno))
+
+
+def parse_io_priority(text: str) -> Tuple[int, int]:
+    """(class, level) from 'idle', 'best-effort[:LEVEL]' or 'realtime[:LEVEL]'"""
+    name, _, level = text.partition(':')
+    if name not in IO_CLASSES:
+        raise ValueError(f"unknown I/O class: {name}")
+    level_value = int(level) if level else 4
+    if not 0 <= level_value <= 7:
+        raise ValueError(f"I/O level must be 0-7: {level}")
+    return IO_CLASSES[name], level_value
+
+
+class ProcessLimits:
+    """Limits and priorities for the external commands of a session"""
+
+    FIELDS = ('cpu', 'address_space', 'open_files', 'nice', 'io_class', 'io_level')
+
+    def __init__(self, cpu: Optional[int] = None, address_space: Optional[int] = None,
+                 open_files: Optional[int] = None, nice: Optional[int] = None,
+                 io_class: Optional[int] = None, io_level: Optional[int] = None):
+        self.cpu = cpu                      # RLIMIT_CPU, seconds
+        self.address_space = address_space  # RLIMIT_AS, bytes
+        self.open_files = open_files        # RLIMIT_NOFILE
+        self.nice = nice                    # Niceness increment
+        self.io_class = io_class            # IO_CLASSES value
+        self.io_level = io_level            # 0 (highest) to 7
+
+    def copy(self, **changes) -> 'ProcessLimits':
+        values = self.to_dict()
+        values.update(changes)
+        return ProcessLimits(**values)
+
+    def to_dict(self) -> Dict[str, Optional[int]]:
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    @classmethod
+    def from_dict(cls, values: Dict[str, Optional[int]]) -> 'ProcessLimits':
+        return cls(**{field: values.get(field) for field in cls.FIELDS})
+
+    def is_default(self) -> bool:
+        return all(getattr(self, field) is None for field in self.FIELDS)
+
+    def apply(self):
+        """Apply the limits to the calling process; runs in the child before exec"""
+        if resource is not None:
+            for field, name, _, _ in RLIMITS.values():
+                value = getattr(self, field)
+                if value is None:
+                    continue
+                limit = getattr(resource, name)
+                _, hard = resource.getrlimit(limit)
+                if hard != resource.RLIM_INFINITY:
+                    value = min(value, hard)
+                resource.setrlimit(limit, (value, value))
+        if self.nice:
+            os.nice(self.nice)
+        if self.io_class is not None and _load_syscall() is not None:
+            set_io_priority(self.io_class, self.io_level or 0)
+
+    def _io_rank(self) -> int:
+        """Position in I/O priority order; higher ranks are served later"""
+        if self.io_class == IO_CLASSES['realtime']:
+            return self.io_level or 0
+        if self.io_class == IO_CLASSES['idle']:
+            return 16
+        return 8 + (4 if self.io_level is None else self.io_level)
+
+    def exceeds(self, ceiling: 'ProcessLimits') -> Optional[str]:
+        """Name of the first setting looser than ceiling allows, or None"""
+        for option, (field, _, _, description) in RLIMITS.items():
+            limit = getattr(ceiling, field)
+            value = getattr(self, field)
+            if limit is not None and (value is None or value > limit):
+                return f"{description} (-{option})"
+        if ceiling.nice is not None and (self.nice or 0) < ceiling.nice:
+            return "CPU priority"
+        if ceiling.io_class is not None and self._io_rank() < ceiling._io_rank():
+            return "I/O priority"
+        return None
+
+    def preexec_fn(self):
+        """Popen's preexec_fn for these limits, or None when there is nothing to apply"""
+        if self.is_default():
+            return None
+        if self.io_class is not None:
+            _load_syscall()  # Import ctypes now, not in the child
+        return self.apply
+
+
+def current_rlimit(option: str) -> Optional[int]:
+    """The terminal's own soft limit for a ulimit option in its unit, None if unlimited"""
+    if resource is None:
+        return None
+    _, name, multiplier, _ = RLIMITS[option]
+    soft, _ = resource.getrlimit(getattr(resource, name))
+    return None if soft == resource.RLIM_INFINITY else soft // multiplier
+
+
+def parse_ulimit(args: List[str], limits: ProcessLimits) -> Tuple[ProcessLimits, List[str], List[str]]:
+    """Apply leading ulimit options ('-t 60', '-v unlimited') to a copy of limits
+
+    Returns the new limits, the options given without a value (queries)
+    and the remaining words, the command to run. Raises ValueError for
+    unknown options and bad values.
+    """
+    changes = {}
+    queries = []
+    index = 0
+    while index < len(args) and args[index].startswith('-') and len(args[index]) > 1:
+        option = args[index][1:]
+        if option == '-':
+            index += 1
+            break
+        if option == 'a':
+            queries.extend(RLIMITS)
+            index += 1
+            continue
+        if option not in RLIMITS:
+            raise ValueError(f"invalid option: -{option}")
+        field, _, multiplier, _ = RLIMITS[option]
+        index += 1
+        if index >= len(args) or args[index].startswith('-'):
+            queries.append(option)
+            continue
+        value = args[index]
+        if value == 'unlimited':
+            changes[field] = None
+        elif value.isdigit():
+            changes[field] = int(value) * multiplier
+        else:
+            raise ValueError(f"invalid limit: {value}")
+        index += 1
+    return limits.copy(**changes), queries, args[index:]
@@ -1,6 +1,10 @@
 import unittest
 import sys
+import json
 import os
+import subprocess
+import tempfile
+import time
 
 # Add the project root to Python path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
@@ -76,6 +80,616 @@ def run_basic_tests():
     
     return True
 
+def check(description, passed, detail=''):
+    """Print one test result; returns whether it passed"""
+    if passed:
+        print(f"✓ {description}: OK")
+    else:
+        print(f"✗ {description}: {detail}")
+    return passed
+
+def run_pipeline_tests():
+    """Pipelines whose builtin stage stops reading early finish promptly"""
+    print("\nRunning pipeline tests...")
+    if os.name != 'posix':
+        print("⚠ Pipeline tests need yes and seq; skipped")
+        return True
+    
+    from terminal import PythonTerminal
+    terminal = PythonTerminal(command_timeout=10)
+    results = []
+    for command, expected in [
+        ('yes | head -n 2', 'y\ny'),
+        ('seq 1 1000000 | grep -l 5', '(standard input)'),
+        ('yes | cat | head -n 1', 'y'),
+    ]:
+        started = time.perf_counter()
+        output, code = terminal.execute_command(command)
+        elapsed = time.perf_counter() - started
+        results.append(check(command, output == expected and code == 0 and elapsed < 5,
+                             f"{output!r}, status {code}, {elapsed:.1f}s"))
+    # A builtin's error reaches the terminal, not the next stage
+    output, code = terminal.execute_command('cat missing | wc -l')
+    results.append(check('cat missing | wc -l counts no lines',
+                         output.splitlines()[-1:] == ['0'] and 'missing' in output, repr(output)))
+    output, code = terminal.execute_command('cat missing 2>&1 | wc -l')
+    results.append(check('cat missing 2>&1 | wc -l counts the error', output.strip() == '1', repr(output)))
+    return all(results)
+
+def run_builtin_stderr_tests():
+    """Builtin errors go to stderr, so 2> redirects them and pipes do not carry them"""
+    print("\nRunning builtin stderr tests...")
+    from terminal import PythonTerminal
+    terminal = PythonTerminal()
+    results = []
+    with tempfile.TemporaryDirectory() as root:
+        terminal.execute_command(f'cd {root}')
+        output, code = terminal.execute_command('ls nope 2>/dev/null')
+        results.append(check('ls nope 2>/dev/null', output == '' and code == 1, f"{output!r}, status {code}"))
+        output, code = terminal.execute_command('ls nope 2> errors.txt')
+        with open(os.path.join(root, 'errors.txt')) as f:
+            written = f.read()
+        results.append(check('ls nope 2> file', output == '' and 'nope' in written and code == 1,
+                             f"{output!r}, {written!r}, status {code}"))
+        output, code = terminal.execute_command('ls nope > all.txt 2>&1')
+        with open(os.path.join(root, 'all.txt')) as f:
+            written = f.read()
+        results.append(check('ls nope > file 2>&1', output == '' and 'nope' in written and code == 1,
+                             f"{output!r}, {written!r}, status {code}"))
+        output, code = terminal.execute_command('echo x 3> y')
+        results.append(check('echo x 3> y is a parse error',
+                             'parsing error' in output and code != 0 and not os.path.exists(os.path.join(root, 'y')),
+                             f"{output!r}, status {code}"))
+    terminal.close()
+    return all(results)
+
+def run_exit_tests():
+    """exit ends the command line and is reported to every front end, wherever it appears"""
+    print("\nRunning exit tests...")
+    import io
+    from terminal import PythonTerminal
+    from batch_interface import BatchInterface
+    import web_interface
+    results = []
+    terminal = PythonTerminal()
+    output, _ = terminal.execute_command('echo a; exit; echo b')
+    results.append(check('exit after other commands', output == 'a' and terminal.exit_requested,
+                         f"{output!r}, exit_requested {terminal.exit_requested}"))
+    terminal.execute_command('exit &')
+    terminal.execute_command('wait')
+    results.append(check('exit in a background job keeps the session', not terminal.exit_requested))
+    terminal.close()
+    
+    out = io.StringIO()
+    result = BatchInterface(output=out).run_lines(['echo a && exit', 'echo b'], 'script')
+    results.append(check('batch script stops at exit', result.exited and out.getvalue() == 'a\n', repr(out.getvalue())))
+    
+    client = web_interface.app.test_client()
+    client.get('/')
+    data = client.post('/execute', json={'command': 'echo a; exit'}).get_json()
+    results.append(check('web /execute ends the session', data.get('exit') and data['output'].startswith('a\n'),
+                         repr(data)))
+    client.get('/')
+    lines = client.post('/execute_stream', json={'command': 'echo b; exit; echo c'}).get_data(as_text=True).splitlines()
+    records = [json.loads(line) for line in lines]
+    results.append(check('web /execute_stream ends the session',
+                         records[-1].get('exit') and not any('c' in record.get('output', '') for record in records),
+                         repr(records)))
+    for session_id in list(web_interface.terminals):
+        web_interface.end_session(session_id)
+    return all(results)
+
+def run_output_limit_tests():
+    """A timeout kills the whole process group and keeps partial output; big output spills to a file"""
+    print("\nRunning timeout and output limit tests...")
+    if os.name != 'posix':
+        print("⚠ Timeout and output limit tests need sh and seq; skipped")
+        return True
+    
+    from terminal import PythonTerminal
+    terminal = PythonTerminal(command_timeout=1, max_output_bytes=100)
+    results = []
+    started = time.perf_counter()
+    output, code = terminal.execute_command("sh -c 'sleep 30 & echo $!; wait'")
+    elapsed = time.perf_counter() - started
+    lines = output.splitlines()
+    results.append(check('timeout keeps partial output', code == 1 and 'timed out' in lines[-1] and elapsed < 5,
+                         f"{output!r}, status {code}, {elapsed:.1f}s"))
+    grandchild_gone = False
+    for _ in range(50):
+        try:
+            os.kill(int(lines[0]), 0)
+        except ProcessLookupError:
+            grandchild_gone = True
+            break
+        time.sleep(0.1)
+    results.append(check('timeout kills the grandchild', grandchild_gone, lines[0]))
+    
+    output, code = terminal.execute_command('seq 1 1000')
+    captured = terminal.last_output
+    results.append(check('output over the limit ends with a truncation note',
+                         output.endswith('[output truncated at 100 of 3893 bytes]') and len(output) < 200, output[-60:]))
+    full = ''.join(captured.full_output()) if captured is not None else ''
+    results.append(check('full output is read back from the spill file', full.splitlines()[-1:] == ['1000'],
+                         full[-20:]))
+    terminal.execute_command('echo small')
+    results.append(check('next command deletes the spill file',
+                         captured is not None and captured.spill_file.closed and terminal.last_output is None))
+    terminal.close()
+    return all(results)
+
+def run_dispatch_cache_tests():
+    """Compiled command lines are reused, and aliases resolve through chains"""
+    print("\nRunning dispatch cache tests...")
+    from terminal import PythonTerminal
+    from command_cache import LRUCache
+    terminal = PythonTerminal()
+    results = []
+    terminal.execute_command("alias hi='echo hello'")
+    terminal.execute_command('alias greet=hi')
+    terminal.execute_command("alias echo='echo said:'")
+    output, code = terminal.execute_command('greet world')
+    results.append(check('alias chain expands', output == 'said: hello world' and code == 0, repr(output)))
+    command = terminal._compile('greet world').lists[0].items[0][1].commands[0]
+    results.append(check('compiled line records the chain and target',
+                         command.alias_chain == ['greet', 'hi', 'echo'] and command.builtin,
+                         f"{command.alias_chain}, builtin {command.builtin}"))
+    hits = terminal.compiled_lines.hits
+    terminal.execute_command('greet world')
+    results.append(check('repeated line is served from the cache', terminal.compiled_lines.hits == hits + 1,
+                         f"{hits} -> {terminal.compiled_lines.hits}"))
+    terminal.execute_command("alias hi='echo bye'")
+    output, _ = terminal.execute_command('greet world')
+    results.append(check('redefining an alias invalidates compiled lines', output == 'said: bye world', repr(output)))
+    terminal.close()
+    
+    cache = LRUCache(2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    cache.get('a')
+    cache.put('c', 3)
+    results.append(check('LRU cache evicts the least recently used',
+                         cache.get('b') is None and cache.get('a') == 1 and cache.get('c') == 3))
+    return all(results)
+
+def run_environment_tests():
+    """Each session's variables are its own, reach its children, and never touch os.environ"""
+    print("\nRunning environment isolation tests...")
+    if os.name != 'posix':
+        print("⚠ Environment tests need sh; skipped")
+        return True
+    
+    from terminal import PythonTerminal
+    first, second = PythonTerminal(), PythonTerminal()
+    results = []
+    first.execute_command('set TERMINAL_TEST_VAR=one')
+    first.execute_command('unset HOME')
+    output, _ = first.execute_command("sh -c 'echo ${TERMINAL_TEST_VAR-none} ${HOME-unset}'")
+    results.append(check('children see the session overlay', output == 'one unset', repr(output)))
+    output, _ = second.execute_command("sh -c 'echo ${TERMINAL_TEST_VAR-none} ${HOME-unset}'")
+    results.append(check('another session does not', output == f"none {os.environ.get('HOME', 'unset')}", repr(output)))
+    results.append(check('os.environ is unchanged', 'TERMINAL_TEST_VAR' not in os.environ))
+    results.append(check('the overlay holds only the changes',
+                         first.environment_vars.overrides == {'TERMINAL_TEST_VAR': 'one'}
+                         and first.environment_vars.removed == {'HOME'} and not second.environment_vars.overrides,
+                         f"{first.environment_vars.overrides}, {first.environment_vars.removed}"))
+    first.close()
+    second.close()
+    return all(results)
+
+def run_ls_tests():
+    """ls sorts by name, time or size, reverses, recurses and prints human sizes"""
+    print("\nRunning ls tests...")
+    from terminal import PythonTerminal
+    terminal = PythonTerminal()
+    results = []
+    with tempfile.TemporaryDirectory() as root:
+        for name, size, year in [('small', 1, 2020), ('big', 10, 2021), ('huge', 3000, 2022), ('.hidden', 0, 2019)]:
+            path = os.path.join(root, name)
+            with open(path, 'wb') as f:
+                f.write(b'x' * size)
+            stamp = time.mktime((year, 1, 1, 0, 0, 0, 0, 0, -1))
+            os.utime(path, (stamp, stamp))
+        os.makedirs(os.path.join(root, 'tree', 'sub'))
+        open(os.path.join(root, 'tree', 'sub', 'inner'), 'w').close()
+        terminal.execute_command(f'cd {root}')
+        for command, expected in [
+            ('ls big huge small', 'big\nhuge\nsmall'),
+            ('ls -a big huge small .hidden', '.hidden\nbig\nhuge\nsmall'),
+            ('ls -t big huge small', 'huge\nbig\nsmall'),
+            ('ls -S big huge small', 'huge\nbig\nsmall'),
+            ('ls -Sr big huge small', 'small\nbig\nhuge'),
+            ('ls -R tree', 'tree:\nsub\n\ntree/sub:\ninner'),
+        ]:
+            output, code = terminal.execute_command(command)
+            results.append(check(command, output == expected and code == 0, f"{output!r}, status {code}"))
+        output, code = terminal.execute_command('ls -a')
+        results.append(check('ls -a shows hidden entries', output.split('\n')[0] == '.hidden', repr(output)))
+        output, code = terminal.execute_command('ls -lh huge')
+        results.append(check('ls -lh prints human-readable sizes', '2.9K' in output and output.endswith(' huge'),
+                             repr(output)))
+        output, code = terminal.execute_command('ls -z')
+        results.append(check('ls rejects unknown flags', code == 2 and 'invalid option' in output, repr(output)))
+    terminal.close()
+    return all(results)
+
+def run_head_tail_tests():
+    """head and tail read only what they print: tail seeks back from the end of the file"""
+    print("\nRunning head and tail tests...")
+    from terminal import PythonTerminal
+    terminal = PythonTerminal(command_timeout=10)
+    results = []
+    with tempfile.TemporaryDirectory() as root:
+        with open(os.path.join(root, 'lines.txt'), 'w') as f:
+            f.write(''.join(f'line {n}\n' for n in range(1, 6)))
+        # 4 GB, nearly all a hole: reading it through would take far longer than seeking
+        with open(os.path.join(root, 'sparse.log'), 'wb') as f:
+            f.write(b'first\nsecond\n')
+            f.seek(4 << 30)
+            f.write(b'\npenultimate\nlast\n')
+        terminal.execute_command(f'cd {root}')
+        for command, expected in [
+            ('head -n 2 lines.txt', 'line 1\nline 2'),
+            ('tail -n 2 lines.txt', 'line 4\nline 5'),
+            ('tail -n +4 lines.txt', 'line 4\nline 5'),
+            ('tail -2 lines.txt', 'line 4\nline 5'),
+            ('cat lines.txt | tail -n +5', 'line 5'),
+            ('cat lines.txt | head -n1', 'line 1'),
+        ]:
+            output, code = terminal.execute_command(command)
+            results.append(check(command, output == expected and code == 0, f"{output!r}, status {code}"))
+        for command, expected in [('tail -n 2 sparse.log', 'penultimate\nlast'), ('head -n 2 sparse.log', 'first\nsecond')]:
+            started = time.perf_counter()
+            output, code = terminal.execute_command(command)
+            elapsed = time.perf_counter() - started
+            results.append(check(f'{command} of 4 GB is immediate', output == expected and elapsed < 1,
+                                 f"{output!r}, {elapsed:.2f}s"))
+        output, code = terminal.execute_command('tail -n x lines.txt')
+        results.append(check('tail rejects a bad count', code == 1 and 'invalid number' in output, repr(output)))
+    terminal.close()
+    return all(results)
+
+def run_job_directory_tests():
+    """Background jobs keep the directory they were started in"""
+    print("\nRunning job directory tests...")
+    if os.name != 'posix':
+        print("⚠ Job directory tests need sleep; skipped")
+        return True
+    
+    from terminal import PythonTerminal
+    results = []
+    with tempfile.TemporaryDirectory() as root:
+        os.mkdir(os.path.join(root, 'sub'))
+        with open(os.path.join(root, 'marker.txt'), 'w') as f:
+            f.write('start\n')
+        terminal = PythonTerminal()
+        terminal.execute_command(f'cd {root}')
+        terminal.execute_command('sleep 0.5 && pwd && cat marker.txt &')
+        terminal.execute_command('cd sub')
+        output, code = terminal.execute_command('wait')
+        results.append(check('job keeps its directory after cd',
+                             f"{root}\nstart\n" in output and code == 0, repr(output)))
+        output, _ = terminal.execute_command('pwd')
+        results.append(check('session cd still applies', output == os.path.join(root, 'sub'), repr(output)))
+        terminal.close()
+    return all(results)
+
+def run_job_control_tests():
+    """kill -STOP suspends a job's processes and bg resumes them"""
+    print("\nRunning job control tests...")
+    if os.name != 'posix':
+        print("⚠ Job control tests need SIGSTOP; skipped")
+        return True
+    
+    from terminal import PythonTerminal
+    terminal = PythonTerminal()
+    results = []
+    terminal.execute_command('sleep 0.5 && echo woke &')
+    time.sleep(0.2)
+    output, code = terminal.execute_command('kill -STOP %1')
+    results.append(check('kill -STOP %1', code == 0, f"{output!r}, status {code}"))
+    time.sleep(0.6)
+    output, _ = terminal.execute_command('jobs')
+    results.append(check('stopped job does not finish', 'Stopped' in output, repr(output)))
+    output, code = terminal.execute_command('bg %1')
+    results.append(check('bg %1', code == 0, f"{output!r}, status {code}"))
+    output, code = terminal.execute_command('wait')
+    results.append(check('resumed job completes', 'woke' in output and code == 0, f"{output!r}, status {code}"))
+    
+    with tempfile.NamedTemporaryFile() as log:
+        terminal.execute_command(f'tail -f {log.name} &')
+        output, code = terminal.execute_command('kill -STOP %1')
+        results.append(check('builtin job cannot be stopped', code == 1, f"{output!r}, status {code}"))
+        output, _ = terminal.execute_command('jobs')
+        results.append(check('builtin job still running', 'Running' in output, repr(output)))
+    terminal.close()
+    
+    # A background tail -f outlives the command timeout and ends when killed
+    terminal = PythonTerminal(command_timeout=0.3)
+    with tempfile.NamedTemporaryFile('w') as log:
+        terminal.execute_command(f'tail -f {log.name} &')
+        time.sleep(0.8)
+        log.write('late line\n')
+        log.flush()
+        time.sleep(0.3)
+        output, _ = terminal.execute_command('jobs')
+        results.append(check('background tail -f ignores the command timeout', 'Running' in output, repr(output)))
+        terminal.execute_command('kill %1')
+        started = time.perf_counter()
+        output, code = terminal.execute_command('wait')
+        elapsed = time.perf_counter() - started
+        results.append(check('kill %1 ends tail -f', 'late line' in output and elapsed < 2,
+                             f"{output!r}, {elapsed:.1f}s"))
+        started = time.perf_counter()
+        output, code = terminal.execute_command(f'tail -f {log.name}')
+        elapsed = time.perf_counter() - started
+        results.append(check('foreground tail -f stops at the command timeout', 'late line' in output and elapsed < 2,
+                             f"{output!r}, status {code}, {elapsed:.1f}s"))
+    terminal.close()
+    return all(results)
+
+def run_find_exec_tests():
+    """find -exec batches stay within the argument space and -execdir batches per directory"""
+    print("\nRunning find -exec tests...")
+    import file_finder
+    results = []
+    with tempfile.TemporaryDirectory() as root:
+        names = {}
+        for directory, count in [('a', 40), ('b', 3)]:
+            os.mkdir(os.path.join(root, directory))
+            names[directory] = [f"{index:03d}-" + 'x' * 200 for index in range(count)]
+            for name in names[directory]:
+                with open(os.path.join(root, directory, name), 'w') as f:
+                    f.write('data\n' if name.startswith('000') else '')
+        paths = sorted(os.path.join(root, directory, name) for directory in names for name in names[directory])
+        
+        calls = []
+        def record(argv, cwd=None):
+            calls.append((argv, cwd))
+            return '', 0
+        
+        arg_space = 1024
+        finder = file_finder.Finder([root, '-type', 'f', '-exec', 'echo', '{}', '+'], execute=record,
+                                    arg_space=arg_space)
+        list(finder.run())
+        sizes = [sum(file_finder._argument_size(word) for word in argv) for argv, _ in calls]
+        arguments = sorted(word for argv, _ in calls for word in argv[1:])
+        results.append(check('-exec + splits at the argument space', len(calls) > 1 and max(sizes) <= arg_space,
+                             f"{len(calls)} calls, sizes {sizes}"))
+        results.append(check('-exec + passes every file once', arguments == paths,
+                             f"{len(arguments)} of {len(paths)} files"))
+        
+        calls.clear()
+        finder = file_finder.Finder([root, '-type', 'f', '-execdir', 'echo', '{}', '+'], execute=record)
+        list(finder.run())
+        expected = [(['echo'] + ['./' + name for name in names[directory]], os.path.join(root, directory))
+                    for directory in ('a', 'b')]
+        results.append(check('-execdir + runs one batch per directory', calls == expected,
+                             repr([(len(argv), cwd) for argv, cwd in calls])))
+        
+        finder = file_finder.Finder([root, '-type', 'f', '-exec', 'test', '-s', '{}', ';', '-print'])
+        output = list(finder.run())
+        results.append(check('-exec ; is true when the command succeeds',
+                             output == [os.path.join(root, directory, names[directory][0]) + '\n'
+                                        for directory in ('a', 'b')], repr(output)))
+        
+        if os.name == 'posix':
+            # Fill the session environment so that batches near ARG_MAX are tested
+            from terminal import PythonTerminal
+            terminal = PythonTerminal()
+            filler = file_finder.argument_space(terminal.environment_vars) - 8 * 1024
+            index = 0
+            while filler > 0:
+                value = 'x' * min(filler, 64 * 1024)
+                terminal.environment_vars[f'FILLER_{index}'] = value
+                filler -= file_finder._argument_size(f'FILLER_{index}={value}')
+                index += 1
+            output, code = terminal.execute_command(f"find {root} -type f -exec sh -c 'echo $#' sh {{}} +")
+            counts = [int(line) for line in output.split()] if code == 0 else []
+            results.append(check('-exec + near ARG_MAX runs without E2BIG',
+                                 len(counts) > 1 and sum(counts) == len(paths),
+                                 f"{output[-200:]!r}, status {code}"))
+            terminal.close()
+    return all(results)
+
+def run_history_tests():
+    """Sessions sharing a history database only see their own commands"""
+    print("\nRunning history isolation tests...")
+    from terminal import PythonTerminal
+    results = []
+    with tempfile.TemporaryDirectory() as root:
+        path = os.path.join(root, 'history.db')
+        first = PythonTerminal(history_path=path, history_owner='web:first')
+        first.execute_command('echo first-session-secret')
+        second = PythonTerminal(history_path=path, history_owner='web:second')
+        second.execute_command('echo second-session')
+        output, _ = second.execute_command('history')
+        results.append(check('history shows only own commands',
+                             'second-session' in output and 'secret' not in output, repr(output)))
+        results.append(check('history search stays within the session',
+                             not any('secret' in entry.command for entry in second.history.search('first')),
+                             repr(second.history.search('first'))))
+        reopened = PythonTerminal(history_path=path, history_owner='web:first')
+        results.append(check('history survives for the same owner',
+                             'echo first-session-secret' in reopened.history.commands(),
+                             repr(reopened.history.commands())))
+        for terminal in (first, second, reopened):
+            terminal.close()
+        
+        # Pages come from the database, past what the in-memory ring holds
+        from history_store import CommandHistory
+        history = CommandHistory(path, capacity=3, owner='paged')
+        for index in range(1, 8):
+            history.add(f'echo {index}')
+        page = [(entry.number, entry.command) for entry in history.newest(limit=2, offset=5)]
+        results.append(check('history pages past the ring', page == [(2, 'echo 2'), (1, 'echo 1')], repr(page)))
+        history.close()
+        
+        # The web interface numbers each session's entries from 1
+        import web_interface
+        web_interface.history_path = path
+        clients = [web_interface.app.test_client() for _ in range(2)]
+        for client, commands in zip(clients, [['echo a1', 'echo a2', 'echo a3'], ['echo b1', 'echo b2']]):
+            client.get('/')
+            for command in commands:
+                client.post('/execute', json={'command': command})
+        data = clients[1].get('/history?per_page=1&page=2').get_json()
+        results.append(check('web history page 2 of one session',
+                             [(entry['number'], entry['command']) for entry in data['entries']] == [(1, 'echo b1')]
+                             and not data['hasMore'], repr(data)))
+        for session_id in list(web_interface.terminals):
+            web_interface.end_session(session_id)
+    return all(results)
+
+def run_grep_tests():
+    """grep matches Unicode text the same way on files and stdin, and reports binary files"""
+    print("\nRunning grep tests...")
+    from terminal import PythonTerminal
+    import text_search
+    results = []
+    with tempfile.TemporaryDirectory() as root:
+        with open(os.path.join(root, 'words.txt'), 'w', encoding='utf-8') as f:
+            f.write('cafe\ncafé\nCAFÉ\n')
+        with open(os.path.join(root, 'data.bin'), 'wb') as f:
+            f.write(b'\0\1cafe\n\2')
+        terminal = PythonTerminal()
+        terminal.execute_command(f'cd {root}')
+        for pattern, expected in [('-E caf.$', 'cafe\ncafé'), ("-E 'caf\\w'", 'cafe\ncafé'), ('-i CAFÉ', 'café\nCAFÉ'),
+                                  ('-vi cafe', 'café\nCAFÉ'), ('-n é', '2:café'), ('-ni é', '2:café\n3:CAFÉ')]:
+            from_file, _ = terminal.execute_command(f'grep {pattern} words.txt')
+            from_stdin, _ = terminal.execute_command(f'cat words.txt | grep {pattern}')
+            results.append(check(f'grep {pattern} on a file and on stdin', from_file == from_stdin == expected,
+                                 f"{from_file!r}, {from_stdin!r}, expected {expected!r}"))
+        
+        # Decoding a block of lines at a time keeps line numbers straight
+        with open(os.path.join(root, 'long.txt'), 'w', encoding='utf-8') as f:
+            f.write(''.join(f'ligne {n} {"é" * (n % 4)}\n' for n in range(1, 200)))
+        whole, _ = terminal.execute_command('grep -n -E "é{3}$" long.txt')
+        block, text_search.TEXT_BLOCK = text_search.TEXT_BLOCK, 20
+        try:
+            blocks, _ = terminal.execute_command('grep -n -E "é{3}$" long.txt')
+        finally:
+            text_search.TEXT_BLOCK = block
+        results.append(check('line numbers across decoded blocks', whole == blocks and whole.count('\n') == 49,
+                             f"{whole[:60]!r} != {blocks[:60]!r}"))
+        
+        with open(os.path.join(root, 'lower.txt'), 'w', encoding='utf-8') as f:
+            f.write('un café\n')
+        terminal.execute_command(f'set TERMINAL_INDEX_DIR={root}/index')
+        terminal.execute_command('index build .')
+        indexed, _ = terminal.execute_command('grep --indexed -i CAFÉ .')
+        walked, _ = terminal.execute_command('grep -r -i CAFÉ .')
+        results.append(check('grep --indexed -i finds non-ASCII case variants', indexed == walked and 'lower.txt:un café' in indexed,
+                             f"{indexed!r} != {walked!r}"))
+        
+        output, code = terminal.execute_command('grep cafe data.bin')
+        results.append(check('binary match is reported', output == 'Binary file data.bin matches' and code == 0,
+                             f"{output!r}, status {code}"))
+        output, code = terminal.execute_command('grep -c cafe data.bin')
+        results.append(check('binary match is counted', output == '1' and code == 0, f"{output!r}, status {code}"))
+        output, code = terminal.execute_command('grep tea data.bin')
+        results.append(check('binary file without a match is silent', output == '' and code == 1,
+                             f"{output!r}, status {code}"))
+        terminal.close()
+    return all(results)
+
+def run_index_tests():
+    """grep --indexed finds what grep -r finds, and index build only rereads changed files"""
+    print("\nRunning trigram index tests...")
+    from terminal import PythonTerminal
+    terminal = PythonTerminal()
+    results = []
+    with tempfile.TemporaryDirectory() as root:
+        tree = os.path.join(root, 'tree')
+        for index in range(30):
+            directory = os.path.join(tree, f'd{index % 3}')
+            os.makedirs(directory, exist_ok=True)
+            with open(os.path.join(directory, f'f{index:02d}.txt'), 'w') as f:
+                f.write(f'header {index}\n')
+                if index % 7 == 0:
+                    f.write(f'the Needle {index} is here\n')
+        terminal.execute_command(f'set TERMINAL_INDEX_DIR={root}/index')
+        terminal.execute_command(f'cd {tree}')
+        output, code = terminal.execute_command('index build .')
+        results.append(check('index build', code == 0 and output.startswith('Indexed 30 files'), repr(output)))
+        for options in ['Needle', '-n Needle', '-i needle', "-E 'Ne+dle [0-9]+'", '-l Needle', '-c Needle', '-v header']:
+            indexed, indexed_code = terminal.execute_command(f'grep --indexed {options} .')
+            walked, walked_code = terminal.execute_command(f'grep -r {options} .')
+            results.append(check(f'grep --indexed {options} matches grep -r',
+                                 indexed == walked and indexed_code == walked_code and indexed,
+                                 f"{indexed[:80]!r} != {walked[:80]!r}"))
+        output, code = terminal.execute_command('grep --indexed Needle d1')
+        walked, _ = terminal.execute_command('grep -r Needle d1')
+        results.append(check('an indexed subdirectory is searched through the index',
+                             output == walked and output.startswith('d1/f07.txt:') and code == 0, repr(output)))
+        
+        with open(os.path.join(tree, 'd0', 'f03.txt'), 'a') as f:
+            f.write('a new Needle\n')
+        output, code = terminal.execute_command('index build .')
+        results.append(check('rebuilding reads only the changed file', '(1 read, 29 unchanged, 0 removed)' in output,
+                             repr(output)))
+        output, _ = terminal.execute_command('grep --indexed -c new .')
+        results.append(check('rebuilt index finds the change', './d0/f03.txt:1' in output, repr(output)))
+        output, code = terminal.execute_command(f'grep --indexed Needle {root}')
+        results.append(check('unindexed directory is an error', code == 2 and 'not indexed' in output, repr(output)))
+    terminal.close()
+    return all(results)
+
+def run_brace_tests():
+    """Brace expansion, and refusing huge expansions before building them"""
+    print("\nRunning brace expansion tests...")
+    from terminal import PythonTerminal
+    terminal = PythonTerminal()
+    results = []
+    output, code = terminal.execute_command('echo {1..3}{a,b} x{c..a}')
+    results.append(check('ranges and alternatives', output == '1a 1b 2a 2b 3a 3b xc xb xa' and code == 0,
+                         f"{output!r}, status {code}"))
+    for command in ['echo {1..3000000}', 'echo {1..1000}{1..1000}', 'echo ' + '{a,b}' * 40,
+                    'echo {1..99999999999999999999}']:
+        started = time.perf_counter()
+        output, code = terminal.execute_command(command)
+        elapsed = time.perf_counter() - started
+        results.append(check(f'{command[:30]} is refused quickly',
+                             'exceeds' in output and code == 1 and elapsed < 0.5,
+                             f"{output!r}, status {code}, {elapsed:.2f}s"))
+    return all(results)
+
+def run_import_time_tests():
+    """Importing terminal must not load modules only some commands need"""
+    print("\nRunning import time tests...")
+    deferred = ['asyncio', 'sqlite3', 'ctypes', 'concurrent.futures', 'multiprocessing', 'tempfile', 'hashlib',
+                'text_search', 'trigram_index', 'file_finder', 'spawn_server']
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import terminal'],
+                            cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True)
+    # Lines look like 'import time:   self |   cumulative | [indent]module'
+    modules = {}
+    for line in result.stderr.splitlines():
+        fields = line.split('|')
+        if line.startswith('import time:') and len(fields) == 3 and fields[1].strip().isdigit():
+            modules[fields[2].strip()] = int(fields[1])
+    results = [check('terminal imports', result.returncode == 0 and 'terminal' in modules, result.stderr[-500:])]
+    loaded = [name for name in deferred if name in modules]
+    results.append(check('heavy modules are imported on first use', not loaded, f"imported eagerly: {loaded}"))
+    if 'terminal' in modules:
+        print(f"  import terminal: {modules['terminal'] / 1000:.0f} ms")
+    return all(results)
+
 if __name__ == "__main__":
     success = run_basic_tests()
+    success = run_pipeline_tests() and success
+    success = run_builtin_stderr_tests() and success
+    success = run_exit_tests() and success
+    success = run_output_limit_tests() and success
+    success = run_dispatch_cache_tests() and success
+    success = run_environment_tests() and success
+    success = run_ls_tests() and success
+    success = run_head_tail_tests() and success
+    success = run_job_directory_tests() and success
+    success = run_job_control_tests() and success
+    success = run_find_exec_tests() and success
+    success = run_history_tests() and success
+    success = run_grep_tests() and success
+    success = run_index_tests() and success
+    success = run_brace_tests() and success
+    success = run_import_time_tests() and success
     sys.exit(0 if success else 1)
\ No newline at end of file
@@ -0,0 +1,323 @@
+# spawn_server.py - Pre-forked Spawn Helper
+"""Launch external commands from a small helper process.
+
+Forking a large process is slow: the kernel has to copy the page tables of
+the whole address space, so a long-running web server that has grown to
+hundreds of megabytes pays for that on every command. The spawn server is
+started once, while the parent is still small, and launches children on
+its behalf. Requests travel over a Unix socket together with the child's
+stdin, stdout and stderr file descriptors (SCM_RIGHTS), and the helper
+reports the child's pid and, later, its exit status back on the same
+connection.
+
+POSIX only; ``SpawnServer.available()`` is False elsewhere.
+"""
+import array
+import errno
+import json
+import os
+import select
+import signal
+import socket
+import struct
+import subprocess
+import sys
+import threading
+from typing import Dict, List, Optional
+
+from process_limits import ProcessLimits
+
+# Length prefix of a request: the JSON payload follows the header
+HEADER = struct.Struct('!I')
+
+
+def _send_fds(sock: socket.socket, data: bytes, fds: List[int]):
+    """Send data with file descriptors attached"""
+    sock.sendmsg([data], [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array('i', fds))])
+
+
+def _recv_fds(sock: socket.socket, size: int, max_fds: int):
+    """Receive up to size bytes and the file descriptors sent with them"""
+    fds = array.array('i')
+    data, ancdata, _, _ = sock.recvmsg(size, socket.CMSG_SPACE(max_fds * fds.itemsize))
+    for level, kind, payload in ancdata:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            fds.frombytes(payload[:len(payload) - (len(payload) % fds.itemsize)])
+    return data, list(fds)
+
+
+def _read_reply(sock: socket.socket, pending: bytearray, timeout: Optional[float] = None):
+    """Read one JSON reply line, keeping any following bytes in pending.
+
+    Returns None if nothing arrives within the timeout, and {} when the
+    connection is closed.
+    """
+    while b'\n' not in pending:
+        ready, _, _ = select.select([sock], [], [], timeout)
+        if not ready:
+            return None
+        chunk = sock.recv(4096)
+        if not chunk:
+            return {}
+        pending.extend(chunk)
+    line, _, rest = bytes(pending).partition(b'\n')
+    pending[:] = rest
+    return json.loads(line)
+
+
+def exit_code(status: int) -> int:
+    """Popen-style return code for a wait() status: negative for signals"""
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+    """Receive exactly size bytes"""
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 65536))
+        if not chunk:
+            raise ConnectionError("spawn request truncated")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+class SpawnedProcess:
+    """A child started by the spawn server, with the parts of Popen the terminal uses
+
+    The child is not our own, so its exit status comes from the helper over
+    the request connection rather than from waitpid().
+    """
+
+    def __init__(self, args: List[str], pid: int, connection: socket.socket, pending: bytearray,
+                 stdin=None, stdout=None):
+        self.args = args
+        self.pid = pid
+        self.stdin = stdin
+        self.stdout = stdout
+        self.stderr = None
+        self.returncode: Optional[int] = None
+        # (user seconds, system seconds, max RSS) reported by the helper
+        self.rusage: Optional[tuple] = None
+        self.connection = connection
+        self.pending = pending
+        self.lock = threading.Lock()
+
+    def _read_status(self, timeout: Optional[float]) -> Optional[int]:
+        with self.lock:
+            if self.returncode is not None:
+                return self.returncode
+            reply = _read_reply(self.connection, self.pending, timeout)
+            if reply is None:
+                return None
+            # A helper that died leaves the status unknown
+            self.returncode = reply.get('returncode', -signal.SIGKILL)
+            if 'rusage' in reply:
+                self.rusage = tuple(reply['rusage'])
+            self.connection.close()
+            return self.returncode
+
+    def poll(self) -> Optional[int]:
+        return self._read_status(0)
+
+    def wait(self, timeout: Optional[float] = None) -> int:
+        status = self._read_status(timeout)
+        if status is None:
+            raise subprocess.TimeoutExpired(self.args, timeout)
+        return status
+
+    def send_signal(self, signum: int):
+        if self.returncode is None:
+            os.kill(self.pid, signum)
+
+    def terminate(self):
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self):
+        self.send_signal(signal.SIGKILL)
+
+
+class SpawnServer:
+    """Client handle for a spawn helper process"""
+
+    def __init__(self):
+        self.directory = None
+        self.path = None
+        self.process: Optional[subprocess.Popen] = None
+
+    @staticmethod
+    def available() -> bool:
+        return os.name == 'posix' and hasattr(socket, 'SCM_RIGHTS')
+
+    def start(self) -> 'SpawnServer':
+        """Start the helper; call this early, while the parent is still small"""
+        import tempfile  # Only a server that is started needs it
+        self.directory = tempfile.mkdtemp(prefix='terminal-spawn-')
+        self.path = os.path.join(self.directory, 'spawn.sock')
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(self.path)
+        listener.listen(64)
+        try:
+            self.process = subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__), str(listener.fileno())],
+                pass_fds=(listener.fileno(),),
+                stdin=subprocess.DEVNULL,
+                start_new_session=True,
+            )
+        finally:
+            listener.close()
+        return self
+
+    @property
+    def running(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def popen(self, argv: List[str], cwd: Optional[str] = None, env: Optional[Dict[str, str]] = None,
+              stdin=None, stdout=None, stderr=None, start_new_session: bool = False,
+              executable: Optional[str] = None,
+              limits: Optional[Dict[str, Optional[int]]] = None) -> SpawnedProcess:
+        """Start argv through the helper, accepting Popen's stdin/stdout/stderr values
+
+        ``limits`` is a ProcessLimits.to_dict(), applied in the child before exec.
+
+        Raises OSError (FileNotFoundError for unknown commands) like Popen,
+        and ConnectionError when the helper is not reachable.
+        """
+        close_after = []   # Child ends of pipes we created, closed once sent
+        keep = []          # Parent ends, returned as the process's pipes
+
+        def child_fd(value, default_fd: int, for_write: bool) -> int:
+            if value is None:
+                return default_fd
+            if value == subprocess.DEVNULL:
+                fd = os.open(os.devnull, os.O_RDWR)
+                close_after.append(fd)
+                return fd
+            if value == subprocess.PIPE:
+                read_fd, write_fd = os.pipe()
+                ours, theirs = (read_fd, write_fd) if for_write else (write_fd, read_fd)
+                close_after.append(theirs)
+                keep.append(ours)
+                return theirs
+            return value if isinstance(value, int) else value.fileno()
+
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            connection.connect(self.path)
+            fds = [child_fd(stdin, 0, False), child_fd(stdout, 1, True)]
+            fds.append(fds[1] if stderr == subprocess.STDOUT else child_fd(stderr, 2, True))
+            payload = json.dumps({
+                'argv': list(argv),
+                'executable': executable,
+                'cwd': cwd,
+                'env': env,
+                'start_new_session': start_new_session,
+                'limits': limits,
+            }).encode('utf-8')
+            _send_fds(connection, HEADER.pack(len(payload)), fds)
+            connection.sendall(payload)
+        except OSError as e:
+            connection.close()
+            for fd in keep:
+                os.close(fd)
+            raise ConnectionError(f"spawn server unavailable: {e}") from e
+        finally:
+            for fd in close_after:
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
+
+        pending = bytearray()
+        reply = _read_reply(connection, pending)
+        if 'pid' not in reply:
+            connection.close()
+            for fd in keep:
+                os.close(fd)
+            if 'errno' in reply:
+                raise OSError(reply['errno'], reply['message'], argv[0])
+            raise ConnectionError("spawn server closed the connection")
+
+        pipes = iter(keep)
+        process_stdin = os.fdopen(next(pipes), 'wb') if stdin == subprocess.PIPE else None
+        process_stdout = os.fdopen(next(pipes), 'rb') if stdout == subprocess.PIPE else None
+        return SpawnedProcess(list(argv), reply['pid'], connection, pending,
+                              process_stdin, process_stdout)
+
+    def stop(self):
+        """Stop the helper and remove its socket"""
+        if self.process is not None:
+            if self.process.poll() is None:
+                self.process.terminate()
+            self.process.wait()
+        for path in (self.path, self.directory):
+            if path:
+                try:
+                    (os.rmdir if path == self.directory else os.unlink)(path)
+                except OSError:
+                    pass
+
+
+def _handle(connection: socket.socket):
+    """Helper side of one request: spawn, report the pid, then the exit status"""
+    fds = []
+    try:
+        header, fds = _recv_fds(connection, HEADER.size, 3)
+        if len(header) < HEADER.size:
+            header += _recv_exact(connection, HEADER.size - len(header))
+        request = json.loads(_recv_exact(connection, HEADER.unpack(header)[0]))
+        limits = request.get('limits')
+        try:
+            process = subprocess.Popen(
+                request['argv'],
+                executable=request.get('executable'),
+                cwd=request.get('cwd'),
+                env=request.get('env'),
+                stdin=fds[0],
+                stdout=fds[1],
+                stderr=fds[2],
+                start_new_session=request.get('start_new_session', False),
+                preexec_fn=ProcessLimits.from_dict(limits).preexec_fn() if limits else None,
+            )
+        except OSError as e:
+            reply = {'errno': e.errno or errno.EIO, 'message': e.strerror or str(e)}
+            connection.sendall((json.dumps(reply) + '\n').encode('utf-8'))
+            return
+        finally:
+            for fd in fds:
+                os.close(fd)
+            fds = []
+
+        connection.sendall((json.dumps({'pid': process.pid}) + '\n').encode('utf-8'))
+        reply = {}
+        if hasattr(os, 'wait4'):
+            # Reap the child ourselves to pass its resource usage on
+            try:
+                _, status, rusage = os.wait4(process.pid, 0)
+                process.returncode = exit_code(status)
+                reply['rusage'] = [rusage.ru_utime, rusage.ru_stime, rusage.ru_maxrss]
+            except ChildProcessError:
+                pass
+        reply['returncode'] = process.wait()
+        connection.sendall((json.dumps(reply) + '\n').encode('utf-8'))
+    except (OSError, ValueError, IndexError):
+        pass
+    finally:
+        for fd in fds:
+            os.close(fd)
+        connection.close()
+
+
+def serve(listen_fd: int):
+    """Accept spawn requests until terminated"""
+    listener = socket.socket(fileno=listen_fd)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    while True:
+        connection, _ = listener.accept()
+        threading.Thread(target=_handle, args=(connection,), daemon=True).start()
+
+
+if __name__ == "__main__":
+    serve(int(sys.argv[1]))
@@ -0,0 +1,21 @@
+# stream_output.py - Writing Streamed Command Output
+import sys
+from typing import Iterable, Optional, TextIO
+
+
+def write_stream(chunks: Iterable[str], output: Optional[TextIO] = None, flush: bool = True):
+    """Write a command's streamed output, ending it on a new line
+
+    Writes to stdout unless output is given, flushing after each chunk
+    unless flush is False.
+    """
+    output = output or sys.stdout
+    last = '\n'
+    for chunk in chunks:
+        output.write(chunk)
+        if flush:
+            output.flush()
+        last = chunk[-1:] or last
+
+    if last != '\n':
+        output.write('\n')
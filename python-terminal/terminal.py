@@ -1,156 +1,1181 @@
 # terminal.py - Main Terminal Class
 import os
 import sys
-import shlex
 import subprocess
-import psutil
+import signal
+import stat
+import codecs
+import collections
+import contextlib
+import errno
+import functools
+import io
+import itertools
+import queue
+import re
+import threading
+import time
 import json
-from pathlib import Path
-from typing import Dict, List, Tuple, Optional
+from typing import Dict, List, Tuple, Optional, Iterator, Union, AsyncIterator, Awaitable, Callable
 from datetime import datetime
 
+import command_parser
+from commands import CommandTable, ErrorText
+from command_cache import LRUCache
+from command_hash import CommandHash
+from command_stats import CommandStats, ResourceUsage
+from environment import Environment
+from file_watch import FileWatcher
+from glob_expand import Globber
+from history_store import CommandHistory
+from job_control import JobTable, signal_process_group
+from output_capture import CapturedOutput
+import process_limits
+from process_limits import ProcessLimits
+
+# Builtins return their output, optionally paired with a non-zero return code;
+# error messages are ErrorText, which goes to the command's stderr
+BuiltinResult = Union[str, Tuple[str, int]]
+
+# A pipeline stage: argv, whether it names a builtin, and its redirections
+Stage = Tuple[List[str], bool, List[command_parser.Redirect]]
+
+def _process_types() -> tuple:
+    """Classes of child processes: Popen, and SpawnedProcess once spawn_server is loaded"""
+    spawn_server = sys.modules.get('spawn_server')
+    return (subprocess.Popen,) if spawn_server is None else (subprocess.Popen, spawn_server.SpawnedProcess)
+
+# Bytes read at a time when sniffing and scanning files
+READ_CHUNK = 64 * 1024
+
+# Seconds between checks of whether a background tail -f was killed
+FOLLOW_CANCEL_CHECK = 0.5
+
+class _ThreadDirectory(threading.local):
+    """Working directory of the job or worker running on a thread, if it has its own"""
+    path: Optional[str] = None
+    fd: Optional[int] = None
+
 class PythonTerminal:
     """A fully functioning command terminal built in Python"""
     
-    def __init__(self):
+    # Built-in commands: name -> method, or 'module:function' for commands
+    # in the commands package, which are imported on first use
+    BUILTINS = {
+        'cd': 'cmd_cd',
+        'pwd': 'cmd_pwd',
+        'ls': 'cmd_ls',
+        'dir': 'cmd_ls',  # Windows alias
+        'mkdir': 'cmd_mkdir',
+        'rmdir': 'cmd_rmdir',
+        'rm': 'cmd_rm',
+        'del': 'cmd_rm',  # Windows alias
+        'touch': 'cmd_touch',
+        'cat': 'cmd_cat',
+        'type': 'cmd_cat',  # Windows alias
+        'head': 'cmd_head',
+        'tail': 'cmd_tail',
+        'echo': 'cmd_echo',
+        'cp': 'cmd_cp',
+        'copy': 'cmd_cp',  # Windows alias
+        'mv': 'cmd_mv',
+        'move': 'cmd_mv',  # Windows alias
+        'find': 'cmd_find',
+        'grep': 'cmd_grep',
+        'ps': 'commands.monitoring:cmd_ps',
+        'kill': 'commands.monitoring:cmd_kill',
+        'top': 'commands.monitoring:cmd_top',
+        'df': 'commands.monitoring:cmd_df',
+        'free': 'commands.monitoring:cmd_free',
+        'whoami': 'cmd_whoami',
+        'date': 'cmd_date',
+        'history': 'cmd_history',
+        'clear': 'cmd_clear',
+        'cls': 'cmd_clear',  # Windows alias
+        'exit': 'cmd_exit',
+        'quit': 'cmd_exit',
+        'help': 'cmd_help',
+        'alias': 'cmd_alias',
+        'env': 'cmd_env',
+        'set': 'cmd_set',
+        'unset': 'cmd_unset',
+        'tree': 'cmd_tree',
+        'index': 'cmd_index',
+        'jobs': 'cmd_jobs',
+        'fg': 'cmd_fg',
+        'bg': 'cmd_bg',
+        'wait': 'cmd_wait',
+        'timeout': 'cmd_timeout',
+        'hash': 'cmd_hash',
+        'which': 'cmd_which',
+        'stats': 'cmd_stats',
+        'time': 'cmd_time',
+        'parallel': 'cmd_parallel',
+        'ulimit': 'cmd_ulimit',
+        'nice': 'cmd_nice',
+    }
+    
+    # Builtins that can run as pipeline stages on line iterators
+    LINE_COMMANDS = {
+        'ls': 'iter_ls',
+        'dir': 'iter_ls',
+        'cat': 'iter_cat',
+        'type': 'iter_cat',
+        'head': 'iter_head',
+        'tail': 'iter_tail',
+        'find': 'iter_find',
+        'grep': 'iter_grep',
+    }
+    
+    # Builtins that stream output chunks and return their exit status
+    STREAM_COMMANDS = {
+        'fg': 'stream_fg',
+        'wait': 'stream_wait',
+        'timeout': 'stream_timeout',
+        'time': 'stream_time',
+        'parallel': 'stream_parallel',
+        'ulimit': 'stream_ulimit',
+        'nice': 'stream_nice',
+    }
+    
+    def __init__(self, command_timeout: Optional[float] = 30, max_output_bytes: Optional[int] = 10 * 1024 * 1024,
+                 spawner=None, limits: Optional[ProcessLimits] = None, history_path: Optional[str] = None,
+                 history_owner: Optional[str] = None):
+        # The session's working directory; the process's own is never changed.
+        # On POSIX an open descriptor of it backs dir_fd-relative file access.
+        # Background jobs and worker threads override both for their thread.
+        self._thread_directory = _ThreadDirectory()
         self.current_directory = os.getcwd()
-        self.command_history = []
+        self.directory_fd = self._open_directory(self.current_directory)
+        # Recent command lines, also saved to the SQLite database at history_path
+        # under history_owner, whose entries are the only ones this session sees
+        self.history = CommandHistory(history_path, owner=history_owner)
+        self.record_history = True  # Batch runs switch this off
         self.aliases = {}
-        self.environment_vars = dict(os.environ)
-        
-        # Built-in commands mapping
-        self.builtin_commands = {
-            'cd': self.cmd_cd,
-            'pwd': self.cmd_pwd,
-            'ls': self.cmd_ls,
-            'dir': self.cmd_ls,  # Windows alias
-            'mkdir': self.cmd_mkdir,
-            'rmdir': self.cmd_rmdir,
-            'rm': self.cmd_rm,
-            'del': self.cmd_rm,  # Windows alias
-            'touch': self.cmd_touch,
-            'cat': self.cmd_cat,
-            'type': self.cmd_cat,  # Windows alias
-            'echo': self.cmd_echo,
-            'cp': self.cmd_cp,
-            'copy': self.cmd_cp,  # Windows alias
-            'mv': self.cmd_mv,
-            'move': self.cmd_mv,  # Windows alias
-            'find': self.cmd_find,
-            'grep': self.cmd_grep,
-            'ps': self.cmd_ps,
-            'kill': self.cmd_kill,
-            'top': self.cmd_top,
-            'df': self.cmd_df,
-            'free': self.cmd_free,
-            'whoami': self.cmd_whoami,
-            'date': self.cmd_date,
-            'history': self.cmd_history,
-            'clear': self.cmd_clear,
-            'cls': self.cmd_clear,  # Windows alias
-            'exit': self.cmd_exit,
-            'quit': self.cmd_exit,
-            'help': self.cmd_help,
-            'alias': self.cmd_alias,
-            'env': self.cmd_env,
-            'set': self.cmd_set,
-            'tree': self.cmd_tree,
-        }
+        # Variables set or unset here; the rest read through to os.environ
+        self.environment_vars = Environment()
+        self.last_return_code = 0
+        self.last_step_codes = []
+        self.exit_requested = False  # Set by exit; the interfaces then end the session
+        self.jobs = JobTable()
+        
+        # Default time limit for foreground commands (None for no limit) and
+        # the most output execute_command keeps in memory before spilling
+        self.command_timeout = command_timeout
+        self.max_output_bytes = max_output_bytes
+        # The whole output of the last execute_command that outgrew
+        # max_output_bytes; its spill file is deleted by the next one
+        self.last_output: Optional[CapturedOutput] = None
+        
+        # Optional spawn_server.SpawnServer that starts external commands
+        # for us, so that large processes avoid forking themselves
+        self.spawner = spawner
+        
+        # Resource limits and priority applied to every external command;
+        # the limits given here are also the most the session may lift them to
+        self.limits = limits or ProcessLimits()
+        self.hard_limits = self.limits.copy()
+        
+        # Where the executables on PATH live, for spawning and completion
+        self.command_hash = CommandHash()
+        
+        # Recently run command lines, parsed and with aliases resolved
+        self.compiled_lines = LRUCache(256)
+        
+        # Wall time and resource usage of every pipeline, by command names
+        self.stats = CommandStats()
+        
+        # Most words a single glob or brace pattern may expand to
+        self.max_glob_matches = 100000
+        
+        # Per-session views of the class-level command tables; plugins
+        # registered through entry points are plain builtins
+        self.builtin_commands = CommandTable(self, self.BUILTINS, include_plugins=True)
+        self.line_commands = CommandTable(self, self.LINE_COMMANDS)
+        self.stream_commands = CommandTable(self, self.STREAM_COMMANDS)
     
     def get_prompt(self) -> str:
         """Generate command prompt string"""
-        user = os.getenv('USER', os.getenv('USERNAME', 'user'))
-        hostname = os.getenv('HOSTNAME', os.getenv('COMPUTERNAME', 'localhost'))
+        env = self.environment_vars
+        user = env.get('USER', env.get('USERNAME', 'user'))
+        hostname = env.get('HOSTNAME', env.get('COMPUTERNAME', 'localhost'))
         cwd = os.path.basename(self.current_directory) if self.current_directory != '/' else '/'
         return f"{user}@{hostname}:{cwd}$ "
     
-    def execute_command(self, command_line: str) -> Tuple[str, int]:
+    def execute_command(self, command_line: str, timeout: Optional[float] = None) -> Tuple[str, int]:
         """Execute a command and return output and return code"""
+        captured = CapturedOutput(self.max_output_bytes)
+        try:
+            for chunk in self.execute_command_stream(command_line, timeout):
+                captured.write(chunk)
+        finally:
+            self._keep_output(captured)
+        output = captured.getvalue()
+        if output.endswith('\n'):
+            output = output[:-1]
+        return output, self.last_return_code
+    
+    def _keep_output(self, captured: CapturedOutput):
+        """Make captured the last output, deleting the previous spill file"""
+        previous, self.last_output = self.last_output, captured if captured.truncated else None
+        if previous is not None:
+            previous.close()
+    
+    def execute_command_stream(self, command_line: str, timeout: Optional[float] = None) -> Iterator[str]:
+        """Execute a command and yield its output in chunks as it is produced"""
+        self.last_return_code = 0
+        self.last_step_codes = []
+        self.exit_requested = False
         if not command_line.strip():
-            return "", 0
+            return
         
-        # Add to history
-        self.command_history.append(command_line)
-        if len(self.command_history) > 1000:  # Limit history size
-            self.command_history = self.command_history[-1000:]
+        started = time.time()
+        cwd = self.current_directory
+        try:
+            yield from self._run_command_line(command_line, timeout)
+        finally:
+            self._record_history(command_line, cwd, started)
+    
+    def _run_command_line(self, command_line: str, timeout: Optional[float]) -> Iterator[str]:
+        """Run a non-empty command line for execute_command_stream"""
+        # Report background jobs that finished since the last command
+        yield from self._job_notifications()
         
         try:
-            # Parse command
-            parts = shlex.split(command_line)
-            if not parts:
-                return "", 0
-            
-            command = parts[0]
-            args = parts[1:] if len(parts) > 1 else []
+            command_list = self._compile(command_line)
+        except ValueError as e:
+            self.last_return_code = 1
+            yield ErrorText(f"Command parsing error: {str(e)}\n")
+            return
+        
+        status = 0
+        for and_or in command_list.lists:
+            if self.exit_requested:
+                break
+            if and_or.background:
+                yield self._start_job(and_or)
+                status = 0
+                continue
             
-            # Check for aliases
-            if command in self.aliases:
-                command = self.aliases[command]
+            status = yield from self._run_and_or(and_or, self.last_step_codes, timeout=self._timeout_for(timeout))
+        
+        self.last_return_code = status
+    
+    def _timeout_for(self, timeout: Optional[float]) -> Optional[float]:
+        """The effective time limit for a command: an override or the session default"""
+        if timeout is None:
+            timeout = self.command_timeout
+        return timeout or None
+    
+    def _record_history(self, command_line: str, cwd: str, started: float):
+        """Add a finished command line to the session history"""
+        if not self.record_history:
+            return
+        self.history.add(command_line, cwd, self.last_return_code, time.time() - started, started)
+    
+    def _start_job(self, and_or) -> str:
+        """Start an and-or list as a background job in the current directory and return its announcement"""
+        # The job owns a duplicate descriptor, so a later cd does not move it
+        path, fd = self.current_directory, self.directory_fd
+        fd = None if fd is None else os.dup(fd)
+        job = self.jobs.start(and_or.text, lambda job: self._in_directory(path, fd, self._run_and_or(and_or, job=job)))
+        self.last_step_codes.append((and_or.text + ' &', 0))
+        return f"[{job.id}] {job.command}\n"
+    
+    def _run_and_or(self, and_or, step_codes: Optional[list] = None, job=None,
+                    timeout: Optional[float] = None) -> Iterator[str]:
+        """Run pipelines joined by '&&' and '||', returning the final status"""
+        status = 0
+        for connector, pipeline in and_or.items:
+            if self.exit_requested and job is None:
+                break
+            # Short-circuit: skipped steps keep the previous status
+            if (connector == '&&' and status != 0) or (connector == '||' and status == 0):
+                if step_codes is not None:
+                    step_codes.append((pipeline.text, None))
+                continue
             
-            # Execute built-in command
-            if command in self.builtin_commands:
+            try:
+                stages = self._expand_stages(pipeline.stages)
+            except ValueError as e:
+                yield ErrorText(f"{str(e)}\n")
+                status = 1
+            else:
+                status = yield from self._run_pipeline(stages, timeout=timeout, job=job)
+            if step_codes is not None:
+                step_codes.append((pipeline.text, status))
+        
+        return status
+    
+    def _expand_stages(self, stages: List[Stage]) -> List[Stage]:
+        """Apply brace expansion and globbing to the words of a pipeline"""
+        if not any(isinstance(arg, command_parser.Word) for argv, _, _ in stages for arg in argv):
+            return stages
+        
+        globber = Globber(self.current_directory, self.max_glob_matches)
+        expanded = []
+        for argv, is_builtin, redirects in stages:
+            words = []
+            for arg in argv:
+                if isinstance(arg, command_parser.Word):
+                    words.extend(globber.expand(arg.pattern))
+                else:
+                    words.append(arg)
+            if isinstance(argv[0], command_parser.Word):
+                is_builtin = words[0] in self.builtin_commands
+            expanded.append((words, is_builtin, redirects))
+        return expanded
+    
+    def _job_notifications(self) -> Iterator[str]:
+        """Yield the output and final state of finished background jobs"""
+        for job in self.jobs.finished():
+            self.jobs.remove(job)
+            yield job.output.read()
+            yield f"[{job.id}]  {job.state:<10} {job.command}\n"
+    
+    @staticmethod
+    def _collect(lines: Iterator[str]) -> str:
+        """Join the lines of a line-oriented builtin into a single output string"""
+        output = ''.join(lines)
+        return output[:-1] if output.endswith('\n') else output
+    
+    @classmethod
+    def _collect_result(cls, chunks: Iterator[str]) -> Tuple[str, int]:
+        """Run a streaming builtin to completion, returning its output and status"""
+        parts = []
+        while True:
+            try:
+                parts.append(next(chunks))
+            except StopIteration as stop:
+                return cls._collect(parts), stop.value or 0
+    
+    def _compile(self, command_line: str) -> command_parser.CommandList:
+        """Parse a command line and resolve its aliases, reusing recent results"""
+        # Cached lists are shared, so they are never modified; alias clears the cache
+        command_list = self.compiled_lines.get(command_line)
+        if command_list is None:
+            command_list = command_parser.parse(command_line)
+            for and_or in command_list.lists:
+                for _, pipeline in and_or.items:
+                    for command in pipeline.commands:
+                        command.expanded, command.alias_chain = self._resolve_aliases(command.argv)
+                        command.builtin = command.expanded[0] in self.builtin_commands
+            self.compiled_lines.put(command_line, command_list)
+        return command_list
+    
+    def _resolve_aliases(self, argv: List[str]) -> Tuple[List[str], List[str]]:
+        """Expand aliases recursively, returning the new argv and the aliases used"""
+        chain = []
+        while argv[0] in self.aliases and argv[0] not in chain:
+            expansion = command_parser.tokenize(self.aliases[argv[0]]) + argv[1:]
+            if not expansion:
+                break
+            chain.append(argv[0])
+            argv = expansion
+        return argv, chain
+    
+    def _expand_alias(self, argv: List[str]) -> List[str]:
+        """Replace an aliased command name with the alias definition"""
+        return self._resolve_aliases(argv)[0]
+    
+    def execute_external_command(self, command: str, args: List[str]) -> Tuple[str, int]:
+        """Execute external system command"""
+        output = ''.join(self.stream_external_command(command, args))
+        return output, self.last_return_code
+    
+    def stream_external_command(self, command: str, args: List[str]) -> Iterator[str]:
+        """Run an external command, yielding stdout/stderr chunks as they arrive"""
+        self.last_return_code = yield from self._run_pipeline([([command] + args, False, [])], self._timeout_for(None))
+    
+    def _run_pipeline(self, stages: List[Stage], timeout: Optional[float] = None, job=None,
+                      usage: Optional[ResourceUsage] = None,
+                      limits: Optional[ProcessLimits] = None, cwd: Optional[str] = None) -> Iterator[str]:
+        """Run a pipeline like _run_stages, recording its time and resource usage"""
+        if usage is None:
+            usage = ResourceUsage()
+        started = time.perf_counter()
+        thread_started = time.thread_time()
+        try:
+            return (yield from self._run_stages(stages, timeout, job, usage, limits or self.limits, cwd))
+        finally:
+            usage.wall = time.perf_counter() - started
+            # Builtins run in this thread; count them as user time
+            usage.user += time.thread_time() - thread_started
+            self.stats.record(' | '.join(stage[0][0] for stage in stages), usage)
+    
+    def _run_stages(self, stages: List[Stage], timeout: Optional[float], job,
+                    usage: ResourceUsage, limits: ProcessLimits, cwd: Optional[str] = None) -> Iterator[str]:
+        """Run (argv, is_builtin, redirects) stages connected by pipes, yielding the output"""
+        if len(stages) == 1 and stages[0][1] and not stages[0][2]:
+            return (yield from self._run_builtin(stages[0][0]))
+        
+        opened = []  # Redirection files, closed once the pipeline is done
+        processes = []
+        feeders = []
+        spawn_errors = []
+        # stderr of the external stages (bytes) and diagnostics of builtin
+        # stages before the last (str), for the terminal
+        errors = queue.Queue()
+        diverted = False  # Whether any builtin stage sends diagnostics to errors
+        upstream = None  # None, a line iterator, or the Popen feeding the next stage
+        return_code = 0
+        timed_out = threading.Event()
+        output_r, output_w = os.pipe()
+        finished = False
+        watchdog = threading.Timer(timeout or 0, self._kill_processes, args=(processes, timed_out))
+        
+        try:
+            for index, (argv, is_builtin, redirects) in enumerate(stages):
+                is_last = index == len(stages) - 1
+                if is_builtin:
+                    try:
+                        files = self._open_redirects(redirects, {0: None, 1: subprocess.PIPE, 2: None}, opened)
+                    except ValueError as e:
+                        spawn_errors.append(ErrorText(f"{str(e)}\n"))
+                        return_code = 1
+                        upstream = None if is_last else iter(())
+                        continue
+                    
+                    stdin_lines = self._upstream_lines(upstream)
+                    if files[0] is not None:
+                        if isinstance(upstream, _process_types()):
+                            upstream.stdout.close()
+                        stdin_lines = io.TextIOWrapper(files[0], encoding='utf-8', errors='replace')
+                    if len(stages) == 1:
+                        upstream = self._run_builtin(argv, stdin_lines)
+                    else:
+                        upstream = self._builtin_lines(argv, stdin_lines)
+                    if stdin_lines is not None:
+                        upstream = self._release_upstream(upstream, stdin_lines, list(processes))
+                    if files[1] is not subprocess.PIPE or files[2] is not None or not is_last:
+                        upstream = self._route_output(upstream, files[1], files[2], None if is_last else errors.put)
+                        diverted = diverted or not is_last
+                    continue
+                
+                stdin = subprocess.DEVNULL
+                if isinstance(upstream, _process_types()):
+                    stdin = upstream.stdout
+                elif upstream is not None:
+                    stdin = subprocess.PIPE
+                
                 try:
-                    return self.builtin_commands[command](args), 0
+                    files = self._open_redirects(
+                        redirects, {0: stdin, 1: output_w if is_last else subprocess.PIPE, 2: output_w}, opened)
+                    # '2>&1' onto the pipe to the next stage
+                    stderr = subprocess.STDOUT if files[2] == subprocess.PIPE else files[2]
+                    process = self._spawn(argv, files[0], files[1], stderr, limits, cwd)
+                except ValueError as e:
+                    spawn_errors.append(ErrorText(f"{str(e)}\n"))
+                    return_code = 1
+                    process = None
+                except FileNotFoundError:
+                    spawn_errors.append(ErrorText(f"Command not found: {argv[0]}\n"))
+                    return_code = 127
+                    process = None
                 except Exception as e:
-                    return f"Error executing {command}: {str(e)}", 1
+                    spawn_errors.append(ErrorText(f"Error executing external command: {str(e)}\n"))
+                    return_code = 1
+                    process = None
+                finally:
+                    # The next stage owns the read end of the previous pipe now
+                    if isinstance(upstream, _process_types()):
+                        upstream.stdout.close()
+                
+                if process is None:
+                    # Later stages read nothing; a failed last stage keeps its status
+                    upstream = None if is_last else iter(())
+                    continue
+                
+                if job is not None:
+                    job.processes.append(process)
+                if process.stdin is not None:
+                    feeder = threading.Thread(target=self._feed_lines, args=(upstream, process.stdin), daemon=True)
+                    feeder.start()
+                    feeders.append(feeder)
+                processes.append(process)
+                # Output redirected away from the pipe leaves the next stage nothing to read
+                upstream = process if is_last or process.stdout is not None else iter(())
             
-            # Execute external command
-            return self.execute_external_command(command, args)
+            # Only the spawned children may hold the write end from here on,
+            # so the output pipe reaches EOF once they have all exited
+            os.close(output_w)
+            output_w = None
+            if timeout is not None:
+                watchdog.start()
             
+            for message in spawn_errors:
+                yield message
+            
+            decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+            last_finished_in_time = False
+            if (isinstance(upstream, _process_types()) or upstream is None) and not diverted:
+                # Last stage is external: stream the shared output pipe
+                while True:
+                    data = os.read(output_r, 65536)
+                    if not data:
+                        break
+                    text = decoder.decode(data)
+                    if text:
+                        yield text
+                if upstream is not None:
+                    return_code = self._reap(upstream, usage)
+            elif isinstance(upstream, _process_types()) or upstream is None:
+                # Last stage is external, with builtin stages feeding it:
+                # their diagnostics join the output pipe's data in the queue
+                reader = threading.Thread(target=self._pump_pipe, args=(output_r, errors), daemon=True)
+                reader.start()
+                output_r = None
+                while True:
+                    data = errors.get()
+                    if data is None:
+                        break
+                    text = data if isinstance(data, str) else decoder.decode(data)
+                    if text:
+                        yield text
+                reader.join()
+                yield from self._drain_errors(iter(()), errors, decoder)
+                if upstream is not None:
+                    return_code = self._reap(upstream, usage)
+            else:
+                # Last stage is a builtin: yield its lines while a reader
+                # thread collects stderr from the external stages
+                reader = threading.Thread(target=self._pump_pipe, args=(output_r, errors), daemon=True)
+                reader.start()
+                output_r = None
+                
+                return_code = yield from self._drain_errors(upstream, errors, decoder)
+                # Upstream stages stopped after the last one finished are no timeout
+                last_finished_in_time = not timed_out.is_set()
+                for process in processes:
+                    self._reap(process, usage)
+                reader.join()
+                yield from self._drain_errors(iter(()), errors, decoder)
+            
+            tail = decoder.decode(b'', final=True)
+            if tail:
+                yield tail
+            
+            for process in processes:
+                self._reap(process, usage)
+            finished = True
+            if timed_out.is_set() and not last_finished_in_time:
+                return_code = 1
+                yield ErrorText(f"Command timed out after {timeout:g} seconds\n")
+            
+            return return_code
+        finally:
+            watchdog.cancel()
+            if not finished:
+                # The consumer stopped iterating early
+                self._kill_processes(processes)
+            for process in processes:
+                self._reap(process, usage)
+            for fd in (output_r, output_w):
+                if fd is not None:
+                    os.close(fd)
+            for file in opened:
+                file.close()
+    
+    def _open_redirects(self, redirects: list, files: Dict[int, object], opened: list) -> Dict[int, object]:
+        """Apply redirections in order to a stage's {0: stdin, 1: stdout, 2: stderr} targets"""
+        files = dict(files)
+        for redirect in redirects:
+            if redirect.mode == '>&':
+                if redirect.target not in ('0', '1', '2'):
+                    raise ValueError(f"{redirect.target}: bad file descriptor")
+                files[redirect.fd] = files[int(redirect.target)]
+                continue
+            
+            if redirect.fd not in files:
+                raise ValueError(f"{redirect.fd}: bad file descriptor")
+            path, opener = self._opener(redirect.target)
+            try:
+                file = open(path, {'<': 'rb', '>': 'wb', '>>': 'ab'}[redirect.mode], opener=opener)
+            except OSError as e:
+                raise ValueError(f"{redirect.target}: {e.strerror}")
+            opened.append(file)
+            files[redirect.fd] = file
+        return files
+    
+    @staticmethod
+    def _route_output(chunks: Iterator[str], stdout, stderr,
+                      terminal: Optional[Callable[[str], None]] = None) -> Iterator[str]:
+        """Send a builtin stage's output and ErrorText where its redirections say; returns its status"""
+        writers = {}
+        try:
+            while True:
+                try:
+                    chunk = next(chunks)
+                except StopIteration as stop:
+                    return stop.value or 0
+                target = stderr if isinstance(chunk, ErrorText) else stdout
+                if target is subprocess.PIPE:
+                    yield str(chunk)
+                elif target is None:
+                    if terminal is None:
+                        yield ErrorText(chunk)
+                    else:
+                        terminal(ErrorText(chunk))
+                else:
+                    writer = writers.get(id(target))
+                    if writer is None:
+                        writer = writers[id(target)] = io.TextIOWrapper(target, encoding='utf-8', errors='replace')
+                    writer.write(chunk)
+        finally:
+            if hasattr(chunks, 'close'):
+                chunks.close()
+            for writer in writers.values():
+                writer.flush()
+                writer.detach()
+    
+    def _run_builtin(self, argv: List[str], stdin: Optional[Iterator[str]] = None) -> Iterator[str]:
+        """Run a single builtin as a whole command, yielding its output"""
+        command, args = argv[0], argv[1:]
+        if command in self.line_commands:
+            return (yield from self._builtin_lines(argv, stdin))
+        if command in self.stream_commands:
+            return (yield from self.stream_commands[command](args))
+        
+        try:
+            output, status = self._split_result(self.builtin_commands[command](args))
         except Exception as e:
-            return f"Command parsing error: {str(e)}", 1
+            output = ErrorText(f"Error executing {command}: {str(e)}")
+            status = 1
+        if output:
+            yield output if output.endswith('\n') else type(output)(output + '\n')
+        return status
     
-    def execute_external_command(self, command: str, args: List[str]) -> Tuple[str, int]:
-        """Execute external system command"""
+    def _builtin_lines(self, argv: List[str], stdin: Optional[Iterator[str]] = None) -> Iterator[str]:
+        """Run a builtin as a pipeline stage, yielding newline-terminated lines"""
+        command, args = argv[0], argv[1:]
         try:
-            # Change to current directory for command execution
-            result = subprocess.run(
-                [command] + args,
-                cwd=self.current_directory,
-                capture_output=True,
-                text=True,
-                timeout=30  # 30 second timeout
-            )
+            if command in self.line_commands:
+                status = yield from self.line_commands[command](args, stdin)
+                return status or 0
             
-            output = result.stdout
-            if result.stderr:
-                output += result.stderr
+            output, status = self._split_result(self.builtin_commands[command](args))
+            lines = output.splitlines(True)
+            if isinstance(output, ErrorText):
+                lines = map(ErrorText, lines)
+            for line in lines:
+                yield line if line.endswith('\n') else type(line)(line + '\n')
+            return status
+        except Exception as e:
+            yield ErrorText(f"Error executing {command}: {str(e)}\n")
+            return 1
+    
+    @staticmethod
+    def _split_result(result: BuiltinResult) -> Tuple[str, int]:
+        """Normalize a builtin's result to an (output, return code) pair"""
+        if isinstance(result, tuple):
+            return result
+        return result, 0
+    
+    @staticmethod
+    def _upstream_lines(upstream) -> Optional[Iterator[str]]:
+        """Turn the previous pipeline stage into an iterator of lines"""
+        if isinstance(upstream, _process_types()):
+            return io.TextIOWrapper(upstream.stdout, encoding='utf-8', errors='replace')
+        return upstream
+    
+    @staticmethod
+    def _release_upstream(lines: Iterator[str], reader, processes: list) -> Iterator[str]:
+        """Yield a builtin stage's lines, then stop the stages feeding it"""
+        try:
+            return (yield from lines)
+        finally:
+            try:
+                reader.close()
+            except OSError:
+                pass
+            # Writers blocked on a full pipe would otherwise wait for the timeout
+            for process in processes:
+                signal_process_group(process, getattr(signal, 'SIGPIPE', signal.SIGTERM))
+    
+    @staticmethod
+    def _drain_errors(lines: Iterator[str], errors: queue.Queue, decoder) -> Iterator[str]:
+        """Yield lines, interleaving any stderr chunks collected in the meantime"""
+        status = None
+        try:
+            while True:
+                while not errors.empty():
+                    data = errors.get_nowait()
+                    if data is not None:
+                        text = data if isinstance(data, str) else decoder.decode(data)
+                        if text:
+                            yield text
+                try:
+                    yield next(lines)
+                except StopIteration as stop:
+                    status = stop.value
+                    break
+        finally:
+            if hasattr(lines, 'close'):
+                lines.close()
+        return status or 0
+    
+    @staticmethod
+    def _feed_lines(lines: Iterator[str], pipe):
+        """Write lines from a builtin stage into an external stage's stdin"""
+        try:
+            for line in lines:
+                pipe.write(line.encode('utf-8'))
+        except (OSError, ValueError):
+            pass
+        finally:
+            try:
+                pipe.close()
+            except OSError:
+                pass
+    
+    @staticmethod
+    def _pump_pipe(fd: int, chunks: queue.Queue):
+        """Copy raw chunks from a pipe into a queue, ending with None"""
+        try:
+            while True:
+                data = os.read(fd, 65536)
+                if not data:
+                    break
+                chunks.put(data)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+            chunks.put(None)
+    
+    @staticmethod
+    def _reap(process, usage: ResourceUsage) -> int:
+        """Wait for a child, adding its CPU time and peak RSS to usage"""
+        if process.returncode is not None:
+            return process.returncode
+        if not isinstance(process, subprocess.Popen):  # A spawn_server.SpawnedProcess
+            process.wait()
+            if process.rusage is not None:
+                usage.add_child(*process.rusage)
+            return process.returncode
+        if hasattr(os, 'wait4'):
+            from spawn_server import exit_code
+            try:
+                _, status, rusage = os.wait4(process.pid, 0)
+                process.returncode = exit_code(status)
+                usage.add_child(rusage.ru_utime, rusage.ru_stime, rusage.ru_maxrss)
+            except ChildProcessError:
+                pass  # Already reaped through Popen.poll()
+        return process.wait()
+    
+    def _resolve_executable(self, name: str) -> str:
+        """Full path of an external command, via the session's hash table"""
+        executable = self.command_hash.lookup(name, self.environment_vars.get('PATH', os.defpath))
+        if executable is None:
+            raise FileNotFoundError(errno.ENOENT, "No such file or directory", name)
+        return executable
+    
+    def complete_command(self, prefix: str) -> List[str]:
+        """Command names starting with prefix: builtins, aliases and executables on PATH"""
+        names = {name for name in self.builtin_commands if name.startswith(prefix)}
+        names.update(name for name in self.aliases if name.startswith(prefix))
+        names.update(self.command_hash.commands(prefix, self.environment_vars.get('PATH', os.defpath)))
+        return sorted(names)
+    
+    def _spawn(self, argv: List[str], stdin, stdout, stderr, limits: ProcessLimits, cwd: Optional[str] = None):
+        """Start an external command in a process group of its own, under limits"""
+        executable = self._resolve_executable(argv[0])
+        cwd = cwd or self.current_directory
+        if self.spawner is not None and self.spawner.running:
+            try:
+                return self.spawner.popen(
+                    argv,
+                    cwd=cwd,
+                    env=self.environment_vars.child_env(),
+                    stdin=stdin,
+                    stdout=stdout,
+                    stderr=stderr,
+                    start_new_session=True,
+                    executable=executable,
+                    limits=None if limits.is_default() else limits.to_dict(),
+                )
+            except ConnectionError:
+                pass  # Fall back to forking this process
+        return subprocess.Popen(
+            argv,
+            executable=executable,
+            cwd=cwd,
+            env=self.environment_vars.child_env(),
+            stdin=stdin,
+            stdout=stdout,
+            stderr=stderr,
+            start_new_session=(os.name == 'posix'),
+            preexec_fn=limits.preexec_fn(),
+        )
+    
+    @staticmethod
+    def _kill_processes(processes: List[subprocess.Popen], killed: Optional[threading.Event] = None):
+        """Kill the process group of every stage of a pipeline"""
+        if killed is not None:
+            killed.set()
+        # Whole groups, so grandchildren still holding the output pipe die too
+        for process in processes:
+            signal_process_group(process, signal.SIGKILL if hasattr(signal, 'SIGKILL') else signal.SIGTERM)
+    
+    # Asynchronous Execution
+    
+    async def execute_command_async(self, command_line: str, timeout: Optional[float] = None) -> Tuple[str, int]:
+        """Coroutine version of execute_command"""
+        captured = CapturedOutput(self.max_output_bytes)
+        
+        async def collect(chunk: str):
+            captured.write(chunk)
+        
+        try:
+            await self._execute_async(command_line, collect, timeout)
+        finally:
+            self._keep_output(captured)
+        output = captured.getvalue()
+        if output.endswith('\n'):
+            output = output[:-1]
+        return output, self.last_return_code
+    
+    async def execute_command_stream_async(self, command_line: str, timeout: Optional[float] = None) -> AsyncIterator[str]:
+        """Async generator version of execute_command_stream"""
+        import asyncio  # Only the async interfaces pay for importing it
+        chunks = asyncio.Queue(maxsize=64)
+        
+        async def produce():
+            try:
+                await self._execute_async(command_line, chunks.put, timeout)
+            finally:
+                await chunks.put(None)
+        
+        task = asyncio.ensure_future(produce())
+        try:
+            while True:
+                chunk = await chunks.get()
+                if chunk is None:
+                    break
+                yield chunk
+            await task
+        finally:
+            if not task.done():
+                task.cancel()
+    
+    async def _execute_async(self, command_line: str, emit: Callable[[str], Awaitable[None]],
+                             timeout: Optional[float] = None):
+        """Execute a command line on the running event loop, passing output to emit"""
+        self.last_return_code = 0
+        self.last_step_codes = []
+        self.exit_requested = False
+        if not command_line.strip():
+            return
+        
+        started = time.time()
+        cwd = self.current_directory
+        try:
+            await self._run_command_line_async(command_line, emit, timeout)
+        finally:
+            self._record_history(command_line, cwd, started)
+    
+    async def _run_command_line_async(self, command_line: str, emit: Callable[[str], Awaitable[None]],
+                                      timeout: Optional[float]):
+        """Run a non-empty command line for _execute_async"""
+        for text in self._job_notifications():
+            await emit(text)
+        
+        try:
+            command_list = self._compile(command_line)
+        except ValueError as e:
+            self.last_return_code = 1
+            await emit(f"Command parsing error: {str(e)}\n")
+            return
+        
+        timeout = self._timeout_for(timeout)
+        status = 0
+        for and_or in command_list.lists:
+            if self.exit_requested:
+                break
+            if and_or.background:
+                await emit(self._start_job(and_or))
+                status = 0
+                continue
             
-            return output, result.returncode
+            for connector, pipeline in and_or.items:
+                if self.exit_requested:
+                    break
+                # Short-circuit: skipped steps keep the previous status
+                if (connector == '&&' and status != 0) or (connector == '||' and status == 0):
+                    self.last_step_codes.append((pipeline.text, None))
+                    continue
+                
+                try:
+                    stages = self._expand_stages(pipeline.stages)
+                except ValueError as e:
+                    await emit(f"{str(e)}\n")
+                    status = 1
+                    self.last_step_codes.append((pipeline.text, status))
+                    continue
+                
+                if os.name == 'posix' and not any(is_builtin or redirects for _, is_builtin, redirects in stages):
+                    # The event loop reaps these children, so only wall time is known
+                    usage = ResourceUsage()
+                    started = time.perf_counter()
+                    status = await self._run_external_async(stages, emit, timeout)
+                    usage.wall = time.perf_counter() - started
+                    self.stats.record(' | '.join(stage[0][0] for stage in stages), usage)
+                else:
+                    status = await self._run_in_executor(self._run_pipeline(stages, timeout), emit)
+                self.last_step_codes.append((pipeline.text, status))
+        
+        self.last_return_code = status
+    
+    async def _run_external_async(self, stages: List[Stage], emit: Callable[[str], Awaitable[None]],
+                                  timeout: Optional[float] = None) -> int:
+        """Run a pipeline of external commands as asyncio subprocesses"""
+        import asyncio
+        loop = asyncio.get_event_loop()
+        processes = []
+        return_code = 0
+        output_r, output_w = os.pipe()
+        stdin = subprocess.DEVNULL
+        transport = None
+        finished = False
+        
+        try:
+            for index, (argv, _, _) in enumerate(stages):
+                is_last = index == len(stages) - 1
+                next_r, next_w = (None, None) if is_last else os.pipe()
+                try:
+                    process = await asyncio.create_subprocess_exec(
+                        *argv,
+                        executable=self._resolve_executable(argv[0]),
+                        cwd=self.current_directory,
+                        env=self.environment_vars.child_env(),
+                        stdin=stdin,
+                        stdout=output_w if is_last else next_w,
+                        stderr=output_w,
+                        start_new_session=True,
+                        preexec_fn=self.limits.preexec_fn(),
+                    )
+                    processes.append(process)
+                    return_code = 0
+                except FileNotFoundError:
+                    await emit(f"Command not found: {argv[0]}\n")
+                    return_code = 127
+                except Exception as e:
+                    await emit(f"Error executing external command: {str(e)}\n")
+                    return_code = 1
+                finally:
+                    # The children hold their own copies of the pipe ends
+                    if stdin != subprocess.DEVNULL:
+                        os.close(stdin)
+                    if next_w is not None:
+                        os.close(next_w)
+                stdin = subprocess.DEVNULL if next_r is None else next_r
             
-        except subprocess.TimeoutExpired:
-            return "Command timed out after 30 seconds", 1
-        except FileNotFoundError:
-            return f"Command not found: {command}", 127
-        except Exception as e:
-            return f"Error executing external command: {str(e)}", 1
+            os.close(output_w)
+            output_w = None
+            
+            reader = asyncio.StreamReader()
+            transport, _ = await loop.connect_read_pipe(
+                lambda: asyncio.StreamReaderProtocol(reader), os.fdopen(output_r, 'rb', 0))
+            output_r = None
+            
+            decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+            deadline = None if timeout is None else loop.time() + timeout
+            timed_out = False
+            while True:
+                try:
+                    remaining = None if deadline is None else max(deadline - loop.time(), 0)
+                    data = await asyncio.wait_for(reader.read(65536), remaining)
+                except asyncio.TimeoutError:
+                    timed_out = True
+                    break
+                if not data:
+                    break
+                text = decoder.decode(data)
+                if text:
+                    await emit(text)
+            
+            tail = decoder.decode(b'', final=True)
+            if tail:
+                await emit(tail)
+            
+            if timed_out:
+                self._kill_async_processes(processes)
+            for process in processes:
+                await process.wait()
+            finished = True
+            if timed_out:
+                await emit(f"Command timed out after {timeout:g} seconds\n")
+                return 1
+            
+            last_spawned = len(processes) == len(stages) and return_code == 0
+            return processes[-1].returncode if last_spawned else return_code
+        finally:
+            if not finished:
+                # Reached early when the caller is cancelled
+                self._kill_async_processes(processes)
+            if transport is not None:
+                transport.close()
+            for fd in (output_r, output_w):
+                if fd is not None:
+                    os.close(fd)
+    
+    @staticmethod
+    def _kill_async_processes(processes: List['asyncio.subprocess.Process']):
+        """Kill the process group of every asyncio subprocess of a pipeline"""
+        for process in processes:
+            signal_process_group(process, signal.SIGKILL)
+    
+    async def _run_in_executor(self, chunks: Iterator[str], emit: Callable[[str], Awaitable[None]]) -> int:
+        """Drive a blocking output generator on a worker thread, returning its status"""
+        import asyncio
+        loop = asyncio.get_event_loop()
+        ready = asyncio.Queue()
+        # Bounds the chunks in flight so a fast builtin cannot outrun the consumer
+        slots = threading.Semaphore(64)
+        abandoned = threading.Event()
+        
+        def drain() -> int:
+            status = 1
+            try:
+                while True:
+                    try:
+                        chunk = next(chunks)
+                    except StopIteration as stop:
+                        status = stop.value or 0
+                        break
+                    while not slots.acquire(timeout=0.5):
+                        if abandoned.is_set():
+                            chunks.close()
+                            return 1
+                    loop.call_soon_threadsafe(ready.put_nowait, chunk)
+            finally:
+                if not abandoned.is_set():
+                    loop.call_soon_threadsafe(ready.put_nowait, None)
+            return status
+        
+        future = loop.run_in_executor(None, drain)
+        try:
+            while True:
+                chunk = await ready.get()
+                if chunk is None:
+                    break
+                slots.release()
+                await emit(chunk)
+            return await future
+        finally:
+            abandoned.set()
+    
+    # Session Paths
+    
+    @property
+    def current_directory(self) -> str:
+        """The working directory: this thread's job's, or the session's"""
+        return self._thread_directory.path or self._session_directory
+    
+    @current_directory.setter
+    def current_directory(self, path: str):
+        if self._thread_directory.path is not None:
+            self._thread_directory.path = path
+        else:
+            self._session_directory = path
+    
+    @property
+    def directory_fd(self) -> Optional[int]:
+        """Descriptor of current_directory, or None to use its path"""
+        local = self._thread_directory
+        return local.fd if local.path is not None else self._session_fd
+    
+    @directory_fd.setter
+    def directory_fd(self, fd: Optional[int]):
+        if self._thread_directory.path is not None:
+            self._thread_directory.fd = fd
+        else:
+            self._session_fd = fd
+    
+    @contextlib.contextmanager
+    def _working_directory(self, path: str, fd: Optional[int] = None):
+        """Give this thread its own working directory, closing fd (which it owns) at the end"""
+        local = self._thread_directory
+        saved = local.path, local.fd
+        local.path, local.fd = path, fd
+        try:
+            yield
+        finally:
+            # A cd inside may have replaced the descriptor, closing the old one
+            if local.fd is not None:
+                os.close(local.fd)
+            local.path, local.fd = saved
+    
+    def _in_directory(self, path: str, fd: Optional[int], chunks: Iterator[str]) -> Iterator[str]:
+        """Run a command's chunks in a working directory of their own"""
+        with self._working_directory(path, fd):
+            return (yield from chunks)
+    
+    @staticmethod
+    def _open_directory(path: str) -> Optional[int]:
+        """A descriptor for dir_fd calls, or None where they are unsupported"""
+        if os.open not in os.supports_dir_fd or not hasattr(os, 'O_DIRECTORY'):
+            return None
+        return os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    
+    def close(self):
+        """Release the session's directory descriptor, output spill file and history database"""
+        fd, self._session_fd = self._session_fd, None
+        if fd is not None:
+            os.close(fd)
+        if self.last_output is not None:
+            self.last_output.close()
+            self.last_output = None
+        self.history.close()
+    
+    def __del__(self):
+        try:
+            self.close()
+        except (AttributeError, OSError):
+            pass
+    
+    def _resolve_path(self, path: str) -> str:
+        """Absolute form of a path given relative to the session's directory"""
+        path = os.path.expanduser(path)
+        return path if os.path.isabs(path) else os.path.join(self.current_directory, path)
+    
+    def _at(self, path: str) -> Tuple[str, Optional[int]]:
+        """(path, dir_fd) arguments that reach path from the session's directory"""
+        path = os.path.expanduser(path)
+        if self.directory_fd is None or os.path.isabs(path):
+            return self._resolve_path(path), None
+        return path, self.directory_fd
+    
+    def _opener(self, path: str) -> Tuple[str, Callable]:
+        """(file, opener) arguments for open() relative to the session's directory"""
+        path, dir_fd = self._at(path)
+        return path, lambda name, flags: os.open(name, flags, 0o666, dir_fd=dir_fd)
     
     # Built-in Commands Implementation
     
-    def cmd_cd(self, args: List[str]) -> str:
+    def cmd_cd(self, args: List[str]) -> BuiltinResult:
         """Change directory command"""
         if not args:
             # Go to home directory
             target = os.path.expanduser("~")
         else:
-            target = args[0]
-            if target.startswith("~"):
-                target = os.path.expanduser(target)
-            elif not os.path.isabs(target):
-                target = os.path.join(self.current_directory, target)
+            target = self._resolve_path(args[0])
         
         try:
-            target = os.path.abspath(target)
+            target = os.path.normpath(target)
             if os.path.isdir(target):
+                directory_fd, previous_fd = self._open_directory(target), self.directory_fd
                 self.current_directory = target
-                os.chdir(target)
+                self.directory_fd = directory_fd
+                if previous_fd is not None:
+                    os.close(previous_fd)
                 return f"Changed directory to: {target}"
             else:
-                return f"Directory not found: {target}"
+                return ErrorText(f"Directory not found: {target}"), 1
         except PermissionError:
-            return f"Permission denied: {target}"
+            return ErrorText(f"Permission denied: {target}"), 1
         except Exception as e:
-            return f"Error changing directory: {str(e)}"
+            return ErrorText(f"Error changing directory: {str(e)}"), 1
     
     def cmd_pwd(self, args: List[str]) -> str:
         """Print working directory"""
@@ -158,34 +1183,175 @@ class PythonTerminal:
     
     def cmd_ls(self, args: List[str]) -> str:
         """List directory contents"""
-        path = args[0] if args else self.current_directory
-        show_hidden = '-a' in args or '--all' in args
-        long_format = '-l' in args or '--long' in args
+        return self._collect(self.iter_ls(args))
+    
+    # ls options: short flag -> name; long options map to the same names
+    LS_FLAGS = {'a': 'all', 'l': 'long', 'h': 'human', 't': 'time', 'S': 'size',
+                'r': 'reverse', 'R': 'recursive', 'U': 'unsorted'}
+    LS_LONG_OPTIONS = {'--all': 'all', '--long': 'long', '--human-readable': 'human',
+                       '--reverse': 'reverse', '--recursive': 'recursive'}
+    
+    def iter_ls(self, args: List[str], stdin: Optional[Iterator[str]] = None) -> Iterator[str]:
+        """List directory contents, one line per entry"""
+        options = set()
+        paths = []
+        for arg in args:
+            if arg in self.LS_LONG_OPTIONS:
+                options.add(self.LS_LONG_OPTIONS[arg])
+            elif arg.startswith('-') and len(arg) > 1:
+                for flag in arg[1:]:
+                    if flag not in self.LS_FLAGS:
+                        yield ErrorText(f"ls: invalid option -- '{flag}'\n")
+                        return 2
+                    options.add(self.LS_FLAGS[flag])
+            else:
+                paths.append(arg)
         
-        try:
-            if not os.path.exists(path):
-                return f"Path not found: {path}"
-            
-            if os.path.isfile(path):
-                return self.format_file_info(path, long_format)
+        status = 0
+        directories = []
+        files = []
+        for path in paths or ['.']:
+            full_path = os.path.normpath(self._resolve_path(path))
+            try:
+                if os.path.isdir(full_path):
+                    directories.append((path, full_path))
+                else:
+                    files.append((path, os.lstat(full_path)))
+            except FileNotFoundError:
+                yield ErrorText(f"Path not found: {full_path}\n")
+                status = 1
+            except PermissionError:
+                yield ErrorText(f"Permission denied: {full_path}\n")
+                status = 1
+        
+        if 'unsorted' not in options:
+            self._ls_sort(files, options)
+        for path, file_stat in files:
+            yield (self._format_long(path, file_stat, 'human' in options) if 'long' in options else path) + '\n'
+        
+        headers = len(directories) + len(files) > 1 or 'recursive' in options
+        for index, (path, full_path) in enumerate(directories):
+            if headers and (files or index):
+                yield '\n'
+            status = (yield from self._ls_directory(path, full_path, options, headers)) or status
+        return status
+    
+    def _ls_directory(self, label: str, path: str, options: set, headers: bool) -> Iterator[str]:
+        """List one directory for iter_ls (and, with -R, the directories below it)"""
+        show_all = 'all' in options
+        long_format = 'long' in options
+        human = 'human' in options
+        recursive = 'recursive' in options
+        need_stat = long_format or 'time' in options or 'size' in options
+        unsorted = 'unsorted' in options
+        
+        def line(name: str, entry_stat) -> str:
+            return (self._format_long(name, entry_stat, human) if long_format else name) + '\n'
+        
+        status = 0
+        pending = [(label, path)]
+        first = True
+        while pending:
+            label, path = pending.pop()
+            if headers:
+                yield f"{label}:\n" if first else f"\n{label}:\n"
+            first = False
             
-            items = []
-            for item in os.listdir(path):
-                if not show_hidden and item.startswith('.'):
+            items = []       # (name, stat or None, is_dir)
+            directories = []  # Subdirectory names in directory order, for -R
+            listed = 0
+            try:
+                # The session's own directory is read through its descriptor
+                target = self.directory_fd if path == self.current_directory and self.directory_fd is not None \
+                    else path
+                if not need_stat and not recursive and not unsorted:
+                    # Names are all a plain sorted listing needs; listdir builds no DirEntry objects
+                    names = sorted(name for name in os.listdir(target) if show_all or not name.startswith('.'))
+                    if 'reverse' in options:
+                        names.reverse()
+                    if not names and not headers:
+                        yield "Directory is empty\n"
+                    for name in names:
+                        yield name + '\n'
                     continue
-                
-                full_path = os.path.join(path, item)
-                if long_format:
-                    items.append(self.format_file_info(full_path, True))
-                else:
-                    items.append(item)
+                with os.scandir(target) as entries:
+                    for entry in entries:
+                        name = entry.name
+                        if not show_all and name.startswith('.'):
+                            continue
+                        try:
+                            entry_stat = entry.stat(follow_symlinks=False) if need_stat else None
+                            is_dir = recursive and entry.is_dir(follow_symlinks=False)
+                        except OSError:
+                            continue  # Removed while we were listing
+                        if unsorted:
+                            listed += 1
+                            yield line(name, entry_stat)
+                            if is_dir:
+                                directories.append(name)
+                        else:
+                            items.append((name, entry_stat, is_dir))
+            except PermissionError:
+                yield ErrorText(f"Permission denied: {path}\n")
+                status = 1
+                continue
+            except OSError as e:
+                yield ErrorText(f"Error listing directory: {str(e)}\n")
+                status = 1
+                continue
             
-            return '\n'.join(sorted(items)) if items else "Directory is empty"
+            if not unsorted:
+                self._ls_sort(items, options)
+                for name, entry_stat, is_dir in items:
+                    yield line(name, entry_stat)
+                    if is_dir:
+                        directories.append(name)
+                listed = len(items)
             
-        except PermissionError:
-            return f"Permission denied: {path}"
-        except Exception as e:
-            return f"Error listing directory: {str(e)}"
+            if not listed and not headers:
+                yield "Directory is empty\n"
+            # Depth first, in listing order
+            for name in reversed(directories):
+                pending.append((os.path.join(label, name), os.path.join(path, name)))
+        return status
+    
+    @staticmethod
+    def _ls_sort(items: list, options: set):
+        """Sort (name, stat, ...) tuples for ls: by name, newest first (-t) or largest first (-S); -r reverses"""
+        if 'time' in options:
+            items.sort(key=lambda item: (-item[1].st_mtime, item[0]))
+        elif 'size' in options:
+            items.sort(key=lambda item: (-item[1].st_size, item[0]))
+        else:
+            items.sort(key=lambda item: item[0])
+        if 'reverse' in options:
+            items.reverse()
+    
+    @staticmethod
+    def _human_size(size: int) -> str:
+        """A size like ls -h: 512, 4.0K, 23M"""
+        value = float(size)
+        for unit in ('', 'K', 'M', 'G', 'T', 'P'):
+            if value < 1024 or unit == 'P':
+                break
+            value /= 1024
+        if not unit:
+            return str(size)
+        return f"{value:.1f}{unit}" if value < 10 else f"{value:.0f}{unit}"
+    
+    @staticmethod
+    @functools.lru_cache(maxsize=4096)
+    def _format_minute(minute: int) -> str:
+        """Local time of a minute since the epoch; listings reuse each one"""
+        return time.strftime('%Y-%m-%d %H:%M', time.localtime(minute * 60))
+    
+    def _format_long(self, name: str, file_stat: os.stat_result, human: bool = False) -> str:
+        """One ls -l line from an lstat result"""
+        mode = file_stat.st_mode
+        file_type = 'd' if stat.S_ISDIR(mode) else 'l' if stat.S_ISLNK(mode) else '-'
+        size = self._human_size(file_stat.st_size) if human else file_stat.st_size
+        mtime = self._format_minute(int(file_stat.st_mtime // 60))
+        return f"{file_type}{mode & 0o777:03o} {size:>8} {mtime} {name}"
     
     def format_file_info(self, path: str, long_format: bool = False) -> str:
         """Format file information for ls command"""
@@ -193,72 +1359,58 @@ class PythonTerminal:
             return os.path.basename(path)
         
         try:
-            stat = os.stat(path)
-            size = stat.st_size
-            mtime = datetime.fromtimestamp(stat.st_mtime).strftime('%Y-%m-%d %H:%M')
-            
-            # File type and permissions
-            if os.path.isdir(path):
-                file_type = 'd'
-            elif os.path.islink(path):
-                file_type = 'l'
-            else:
-                file_type = '-'
-            
-            # Simple permission representation
-            perms = oct(stat.st_mode)[-3:]
-            
-            return f"{file_type}{perms} {size:>8} {mtime} {os.path.basename(path)}"
-            
-        except Exception:
+            return self._format_long(os.path.basename(path), os.lstat(path))
+        except OSError:
             return os.path.basename(path)
     
-    def cmd_mkdir(self, args: List[str]) -> str:
+    @staticmethod
+    def _report(results: List[str], failed: bool) -> BuiltinResult:
+        """The messages of a file operation, as errors if any step failed"""
+        output = '\n'.join(results)
+        return (ErrorText(output), 1) if failed else output
+    
+    def cmd_mkdir(self, args: List[str]) -> BuiltinResult:
         """Create directory"""
         if not args:
-            return "Usage: mkdir <directory_name>"
+            return ErrorText("Usage: mkdir <directory_name>"), 1
         
         results = []
+        failed = False
         for dir_name in args:
             try:
-                if not os.path.isabs(dir_name):
-                    dir_path = os.path.join(self.current_directory, dir_name)
-                else:
-                    dir_path = dir_name
-                
-                os.makedirs(dir_path, exist_ok=True)
+                os.makedirs(self._resolve_path(dir_name), exist_ok=True)
                 results.append(f"Created directory: {dir_name}")
             except Exception as e:
                 results.append(f"Error creating {dir_name}: {str(e)}")
+                failed = True
         
-        return '\n'.join(results)
+        return self._report(results, failed)
     
-    def cmd_rmdir(self, args: List[str]) -> str:
+    def cmd_rmdir(self, args: List[str]) -> BuiltinResult:
         """Remove empty directory"""
         if not args:
-            return "Usage: rmdir <directory_name>"
+            return ErrorText("Usage: rmdir <directory_name>"), 1
         
         results = []
+        failed = False
         for dir_name in args:
             try:
-                if not os.path.isabs(dir_name):
-                    dir_path = os.path.join(self.current_directory, dir_name)
-                else:
-                    dir_path = dir_name
-                
-                os.rmdir(dir_path)
+                path, dir_fd = self._at(dir_name)
+                os.rmdir(path, dir_fd=dir_fd)
                 results.append(f"Removed directory: {dir_name}")
             except FileNotFoundError:
                 results.append(f"Directory not found: {dir_name}")
+                failed = True
             except OSError as e:
                 results.append(f"Error removing {dir_name}: {str(e)}")
+                failed = True
         
-        return '\n'.join(results)
+        return self._report(results, failed)
     
-    def cmd_rm(self, args: List[str]) -> str:
+    def cmd_rm(self, args: List[str]) -> BuiltinResult:
         """Remove files or directories"""
         if not args:
-            return "Usage: rm [-r] <file_or_directory>"
+            return ErrorText("Usage: rm [-r] <file_or_directory>"), 1
         
         recursive = '-r' in args or '-rf' in args or '--recursive' in args
         force = '-f' in args or '-rf' in args or '--force' in args
@@ -267,110 +1419,342 @@ class PythonTerminal:
         files = [arg for arg in args if not arg.startswith('-')]
         
         if not files:
-            return "No files specified"
+            return ErrorText("No files specified"), 1
         
         results = []
+        failed = False
         for file_name in files:
             try:
-                if not os.path.isabs(file_name):
-                    file_path = os.path.join(self.current_directory, file_name)
-                else:
-                    file_path = file_name
-                
-                if os.path.isdir(file_path):
+                path, dir_fd = self._at(file_name)
+                if os.path.isdir(self._resolve_path(file_name)):
                     if recursive:
                         import shutil
-                        shutil.rmtree(file_path)
+                        shutil.rmtree(self._resolve_path(file_name))
                         results.append(f"Removed directory tree: {file_name}")
                     else:
                         results.append(f"Cannot remove directory {file_name}: use -r flag")
+                        failed = True
                 else:
-                    os.remove(file_path)
+                    os.remove(path, dir_fd=dir_fd)
                     results.append(f"Removed file: {file_name}")
                     
             except FileNotFoundError:
                 if not force:
                     results.append(f"File not found: {file_name}")
+                    failed = True
             except PermissionError:
                 results.append(f"Permission denied: {file_name}")
+                failed = True
             except Exception as e:
                 results.append(f"Error removing {file_name}: {str(e)}")
+                failed = True
         
-        return '\n'.join(results)
+        return self._report(results, failed)
     
-    def cmd_touch(self, args: List[str]) -> str:
+    def cmd_touch(self, args: List[str]) -> BuiltinResult:
         """Create empty file or update timestamp"""
         if not args:
-            return "Usage: touch <filename>"
+            return ErrorText("Usage: touch <filename>"), 1
         
         results = []
+        failed = False
         for filename in args:
             try:
-                if not os.path.isabs(filename):
-                    file_path = os.path.join(self.current_directory, filename)
-                else:
-                    file_path = filename
-                
                 # Create file if it doesn't exist, update timestamp if it does
-                Path(file_path).touch()
+                path, dir_fd = self._at(filename)
+                os.close(os.open(path, os.O_WRONLY | os.O_CREAT, 0o666, dir_fd=dir_fd))
+                os.utime(path, dir_fd=dir_fd)
                 results.append(f"Touched: {filename}")
             except Exception as e:
                 results.append(f"Error touching {filename}: {str(e)}")
+                failed = True
         
-        return '\n'.join(results)
+        return self._report(results, failed)
     
     def cmd_cat(self, args: List[str]) -> str:
         """Display file contents"""
+        return self._collect(self.iter_cat(args))
+    
+    def iter_cat(self, args: List[str], stdin: Optional[Iterator[str]] = None) -> Iterator[str]:
+        """Display file contents line by line, or pass stdin through"""
         if not args:
-            return "Usage: cat <filename>"
+            if stdin is None:
+                yield ErrorText("Usage: cat <filename>\n")
+                return 1
+            else:
+                yield from stdin
+            return
         
-        results = []
+        status = 0
         for filename in args:
             try:
-                if not os.path.isabs(filename):
-                    file_path = os.path.join(self.current_directory, filename)
-                else:
-                    file_path = filename
-                
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
+                file_path, opener = self._opener(filename)
+                with open(file_path, 'rb', opener=opener) as f:
+                    # A NUL in the first block marks a binary file
+                    if b'\0' in f.peek(READ_CHUNK)[:READ_CHUNK]:
+                        yield ErrorText(f"Cannot display binary file: {filename}\n")
+                        status = 1
+                        continue
                     if len(args) > 1:
-                        results.append(f"==> {filename} <==")
-                    results.append(content)
-            except FileNotFoundError:
-                results.append(f"File not found: {filename}")
-            except PermissionError:
-                results.append(f"Permission denied: {filename}")
-            except UnicodeDecodeError:
-                results.append(f"Cannot display binary file: {filename}")
+                        yield f"==> {filename} <==\n"
+                    yield from self._text_lines(f)
+            except OSError as e:
+                yield self._read_error(filename, e)
+                status = 1
             except Exception as e:
-                results.append(f"Error reading {filename}: {str(e)}")
+                yield ErrorText(f"Error reading {filename}: {str(e)}\n")
+                status = 1
         
-        return '\n'.join(results)
+        return status
+    
+    @staticmethod
+    def _text_lines(binary) -> Iterator[str]:
+        """Newline-terminated lines of a binary file from its position on, read in buffered chunks"""
+        text = io.TextIOWrapper(binary, encoding='utf-8', errors='replace')
+        try:
+            for line in text:
+                yield line if line.endswith('\n') else line + '\n'
+        finally:
+            # Leave the file open and positioned after what was read
+            text.detach()
+    
+    @staticmethod
+    def _read_error(filename: str, error: OSError) -> ErrorText:
+        """The message for a file that could not be opened or read"""
+        if isinstance(error, FileNotFoundError):
+            return ErrorText(f"File not found: {filename}\n")
+        if isinstance(error, PermissionError):
+            return ErrorText(f"Permission denied: {filename}\n")
+        return ErrorText(f"Error reading {filename}: {str(error)}\n")
+    
+    @staticmethod
+    def _parse_line_options(command: str, args: List[str], flags: str) -> Tuple[int, bool, set, List[str]]:
+        """Split head/tail arguments into (lines, from_start, flags, files)"""
+        count = '10'
+        options = set()
+        files = []
+        index = 0
+        while index < len(args):
+            arg = args[index]
+            index += 1
+            if arg == '--':
+                files.extend(args[index:])
+                break
+            if arg in ('-n', '--lines'):
+                if index >= len(args):
+                    raise ValueError(f"{command}: option requires an argument -- 'n'")
+                count = args[index]
+                index += 1
+            elif arg.startswith('--lines='):
+                count = arg[len('--lines='):]
+            elif arg.startswith('-n'):
+                count = arg[2:]
+            elif len(arg) > 1 and arg[0] == '-' and arg[1:].isdigit():
+                count = arg[1:]
+            elif len(arg) > 1 and arg[0] == '-':
+                for flag in arg[1:]:
+                    if flag not in flags:
+                        raise ValueError(f"{command}: invalid option -- '{flag}'")
+                    options.add(flag)
+            else:
+                files.append(arg)
+        
+        from_start = command == 'tail' and count.startswith('+')
+        digits = count[1:] if from_start else count
+        if not digits.isdigit():
+            raise ValueError(f"{command}: invalid number of lines: '{count}'")
+        return int(digits), from_start, options, files
+    
+    def cmd_head(self, args: List[str]) -> str:
+        """Display the first lines of files"""
+        return self._collect(self.iter_head(args))
+    
+    def iter_head(self, args: List[str], stdin: Optional[Iterator[str]] = None) -> Iterator[str]:
+        """head [-n N] [FILE...] - The first N lines; reading stops there"""
+        try:
+            lines, _, _, files = self._parse_line_options('head', args, '')
+        except ValueError as e:
+            yield ErrorText(f"{str(e)}\n")
+            return 1
+        if not files:
+            if stdin is None:
+                yield ErrorText("Usage: head [-n lines] <filename>...\n")
+                return 1
+            yield from itertools.islice(stdin, lines)
+            return 0
+        
+        status = 0
+        for index, filename in enumerate(files):
+            try:
+                file_path, opener = self._opener(filename)
+                with open(file_path, 'rb', opener=opener) as f:
+                    if len(files) > 1:
+                        if index:
+                            yield "\n"
+                        yield f"==> {filename} <==\n"
+                    yield from itertools.islice(self._text_lines(f), lines)
+            except OSError as e:
+                yield self._read_error(filename, e)
+                status = 1
+        return status
+    
+    def cmd_tail(self, args: List[str]) -> str:
+        """Display the last lines of files"""
+        return self._collect(self.iter_tail(args))
+    
+    def iter_tail(self, args: List[str], stdin: Optional[Iterator[str]] = None) -> Iterator[str]:
+        """tail [-n N|+K] [-f] [FILE...] - The last N lines, or from line K on"""
+        try:
+            lines, from_start, options, files = self._parse_line_options('tail', args, 'f')
+        except ValueError as e:
+            yield ErrorText(f"{str(e)}\n")
+            return 1
+        if not files:
+            if stdin is None:
+                yield ErrorText("Usage: tail [-n lines] [-f] <filename>...\n")
+                return 1
+            if from_start:
+                yield from itertools.islice(stdin, max(lines - 1, 0), None)
+            else:
+                yield from collections.deque(stdin, maxlen=lines)
+            return 0
+        
+        follow = 'f' in options
+        status = 0
+        followed = []  # (filename, open file) pairs for -f
+        with contextlib.ExitStack() as stack:
+            for index, filename in enumerate(files):
+                try:
+                    file_path, opener = self._opener(filename)
+                    f = stack.enter_context(open(file_path, 'rb', opener=opener))
+                    if len(files) > 1:
+                        if index:
+                            yield "\n"
+                        yield f"==> {filename} <==\n"
+                    if from_start:
+                        yield from itertools.islice(self._text_lines(f), max(lines - 1, 0), None)
+                    elif f.seekable():
+                        f.seek(self._tail_offset(f, lines))
+                        yield from self._text_lines(f)
+                    else:
+                        yield from collections.deque(self._text_lines(f), maxlen=lines)
+                    if follow:
+                        followed.append((filename, f))
+                    else:
+                        f.close()
+                except OSError as e:
+                    yield self._read_error(filename, e)
+                    status = 1
+            
+            if followed:
+                yield from self._follow(followed, len(files) > 1)
+        return status
+    
+    @staticmethod
+    def _tail_offset(f, count: int) -> int:
+        """Offset where the last count lines of a binary file start, found reading backwards"""
+        end = f.seek(0, os.SEEK_END)
+        position = end
+        if end:
+            f.seek(end - 1)
+            if f.read(1) == b'\n':
+                position -= 1  # The final newline ends the last line
+        found = 0
+        while position > 0 and found < count:
+            start = max(position - READ_CHUNK, 0)
+            f.seek(start)
+            block = f.read(position - start)
+            index = len(block)
+            while True:
+                index = block.rfind(b'\n', 0, index)
+                if index < 0:
+                    break
+                found += 1
+                if found == count:
+                    return start + index + 1
+            position = start
+        return end if count == 0 else 0
+    
+    def _follow(self, followed: List[Tuple[str, object]], headers: bool) -> Iterator[str]:
+        """tail -f: yield the lines appended to the open files until the command timeout or kill"""
+        job = self.jobs.current()
+        timeout = None if job is not None else self._timeout_for(None)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        partial = {}  # Filename -> the start of a line still being written
+        current = followed[-1][0]  # File whose header was printed last
+        
+        # Files whose last line was printed with a newline it did not have yet;
+        # the newline that completes it is then not printed again
+        unterminated = set()
+        for filename, f in followed:
+            position = f.tell()
+            if position:
+                f.seek(position - 1)
+                if f.read(1) != b'\n':
+                    unterminated.add(filename)
+        
+        with FileWatcher([self._resolve_path(filename) for filename, _ in followed]) as watcher:
+            while True:
+                for filename, f in followed:
+                    if os.fstat(f.fileno()).st_size < f.tell():
+                        yield ErrorText(f"tail: {filename}: file truncated\n")
+                        f.seek(0)
+                        partial.pop(filename, None)
+                        unterminated.discard(filename)
+                    data = f.read()
+                    if not data:
+                        continue
+                    if filename in unterminated:
+                        unterminated.discard(filename)
+                        if data.startswith(b'\n'):
+                            data = data[1:]
+                    complete, newline, rest = (partial.pop(filename, b'') + data).rpartition(b'\n')
+                    if rest:
+                        partial[filename] = rest
+                    if not newline:
+                        continue
+                    if headers and filename != current:
+                        yield "\n"
+                        yield f"==> {filename} <==\n"
+                        current = filename
+                    for line in complete.decode('utf-8', errors='replace').split('\n'):
+                        yield line + '\n'
+                
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                if job is not None:
+                    if job.cancelled.is_set():
+                        break
+                    remaining = FOLLOW_CANCEL_CHECK
+                watcher.wait(remaining)
+        
+        # Lines still unterminated when following stops
+        for filename, f in followed:
+            if filename in partial:
+                yield partial[filename].decode('utf-8', errors='replace') + '\n'
     
     def cmd_echo(self, args: List[str]) -> str:
         """Echo text to output"""
         return ' '.join(args)
     
-    def cmd_cp(self, args: List[str]) -> str:
+    def cmd_cp(self, args: List[str]) -> BuiltinResult:
         """Copy files or directories"""
         if len(args) < 2:
-            return "Usage: cp [-r] <source> <destination>"
+            return ErrorText("Usage: cp [-r] <source> <destination>"), 1
         
         recursive = '-r' in args or '--recursive' in args
         files = [arg for arg in args if not arg.startswith('-')]
         
         if len(files) < 2:
-            return "Source and destination required"
+            return ErrorText("Source and destination required"), 1
         
         source = files[0]
         dest = files[1]
         
         try:
-            if not os.path.isabs(source):
-                source = os.path.join(self.current_directory, source)
-            if not os.path.isabs(dest):
-                dest = os.path.join(self.current_directory, dest)
+            source = self._resolve_path(source)
+            dest = self._resolve_path(dest)
             
             if os.path.isdir(source):
                 if recursive:
@@ -378,252 +1762,284 @@ class PythonTerminal:
                     shutil.copytree(source, dest)
                     return f"Copied directory tree: {files[0]} -> {files[1]}"
                 else:
-                    return f"Cannot copy directory {files[0]}: use -r flag"
+                    return ErrorText(f"Cannot copy directory {files[0]}: use -r flag"), 1
             else:
                 import shutil
                 shutil.copy2(source, dest)
                 return f"Copied file: {files[0]} -> {files[1]}"
                 
         except FileNotFoundError:
-            return f"Source not found: {files[0]}"
+            return ErrorText(f"Source not found: {files[0]}"), 1
         except Exception as e:
-            return f"Error copying: {str(e)}"
+            return ErrorText(f"Error copying: {str(e)}"), 1
     
-    def cmd_mv(self, args: List[str]) -> str:
+    def cmd_mv(self, args: List[str]) -> BuiltinResult:
         """Move/rename files or directories"""
         if len(args) != 2:
-            return "Usage: mv <source> <destination>"
+            return ErrorText("Usage: mv <source> <destination>"), 1
         
         source, dest = args
         
         try:
-            if not os.path.isabs(source):
-                source = os.path.join(self.current_directory, source)
-            if not os.path.isabs(dest):
-                dest = os.path.join(self.current_directory, dest)
+            source = self._resolve_path(source)
+            dest = self._resolve_path(dest)
             
             import shutil
             shutil.move(source, dest)
             return f"Moved: {args[0]} -> {args[1]}"
             
         except FileNotFoundError:
-            return f"Source not found: {args[0]}"
+            return ErrorText(f"Source not found: {args[0]}"), 1
         except Exception as e:
-            return f"Error moving: {str(e)}"
+            return ErrorText(f"Error moving: {str(e)}"), 1
     
     def cmd_find(self, args: List[str]) -> str:
         """Find files and directories"""
-        if not args:
-            return "Usage: find <path> -name <pattern>"
-        
-        path = args[0] if args else self.current_directory
-        pattern = None
-        
-        # Simple pattern matching for -name
-        if '-name' in args:
-            try:
-                name_idx = args.index('-name')
-                if name_idx + 1 < len(args):
-                    pattern = args[name_idx + 1]
-            except:
-                pass
-        
+        return self._collect(self.iter_find(args))
+    
+    def iter_find(self, args: List[str], stdin: Optional[Iterator[str]] = None) -> Iterator[str]:
+        """find [PATH...] [EXPRESSION] - Walk directory trees, yielding matches as they are found"""
+        import file_finder
         try:
-            if not os.path.isabs(path):
-                path = os.path.join(self.current_directory, path)
-            
-            results = []
-            for root, dirs, files in os.walk(path):
-                for item in dirs + files:
-                    full_path = os.path.join(root, item)
-                    if pattern:
-                        import fnmatch
-                        if fnmatch.fnmatch(item, pattern):
-                            results.append(full_path)
-                    else:
-                        results.append(full_path)
-            
-            return '\n'.join(results) if results else "No matches found"
-            
-        except Exception as e:
-            return f"Error in find: {str(e)}"
+            finder = file_finder.Finder(args, self._resolve_path,
+                                        functools.partial(self._find_exec, self.current_directory),
+                                        file_finder.argument_space(self.environment_vars))
+        except ValueError as e:
+            yield ErrorText(f"{str(e)}\n")
+            return 1
+        return (yield from finder.run())
+    
+    def _find_exec(self, directory: str, argv: List[str], cwd: Optional[str]) -> Tuple[str, int]:
+        """Run a command for find -exec, with the session's environment, limits and timeout"""
+        parts = []
+        chunks = self._run_pipeline([(argv, False, [])], self._timeout_for(None), cwd=cwd or directory)
+        while True:
+            try:
+                parts.append(next(chunks))
+            except StopIteration as stop:
+                return ''.join(parts), stop.value or 0
     
     def cmd_grep(self, args: List[str]) -> str:
         """Search text in files"""
-        if len(args) < 2:
-            return "Usage: grep <pattern> <file>"
-        
-        pattern = args[0]
-        filename = args[1]
-        
-        try:
-            if not os.path.isabs(filename):
-                file_path = os.path.join(self.current_directory, filename)
-            else:
-                file_path = filename
-            
-            results = []
-            with open(file_path, 'r', encoding='utf-8') as f:
-                for line_num, line in enumerate(f, 1):
-                    if pattern in line:
-                        results.append(f"{line_num}: {line.rstrip()}")
-            
-            return '\n'.join(results) if results else f"No matches found for '{pattern}'"
-            
-        except FileNotFoundError:
-            return f"File not found: {filename}"
-        except Exception as e:
-            return f"Error in grep: {str(e)}"
+        return self._collect(self.iter_grep(args))
     
-    # System Monitoring Commands
+    GREP_FLAGS = {'E': 'extended', 'F': 'fixed', 'i': 'ignore_case', 'v': 'invert', 'c': 'count',
+                  'l': 'files_with_matches', 'n': 'line_numbers', 'r': 'recursive', 'R': 'recursive',
+                  'H': 'with_filename', 'h': 'no_filename'}
     
-    def cmd_ps(self, args: List[str]) -> str:
-        """List running processes"""
+    def iter_grep(self, args: List[str], stdin: Optional[Iterator[str]] = None) -> Iterator[str]:
+        """grep [-EFivclnrRHh] [-e] PATTERN [FILE...] - Lines matching a string, or a regex with -E"""
+        import text_search
+        options = set()
+        pattern = None
+        operands = []
+        index = 0
+        while index < len(args):
+            arg = args[index]
+            index += 1
+            if arg == '--':
+                operands.extend(args[index:])
+                break
+            if arg == '--indexed':
+                options.add('indexed')
+            elif arg == '-e':
+                if index >= len(args):
+                    yield ErrorText("grep: option requires an argument -- 'e'\n")
+                    return 2
+                pattern = args[index]
+                index += 1
+            elif arg.startswith('-') and len(arg) > 1:
+                for flag in arg[1:]:
+                    if flag not in self.GREP_FLAGS:
+                        yield ErrorText(f"grep: invalid option -- '{flag}'\n")
+                        return 2
+                    options.add(self.GREP_FLAGS[flag])
+            else:
+                operands.append(arg)
+        
+        if pattern is None and operands:
+            pattern = operands.pop(0)
+        recursive = 'recursive' in options or 'indexed' in options
+        files = operands or (['.'] if recursive and stdin is None else [])
+        if pattern is None or (not files and stdin is None):
+            yield ErrorText("Usage: grep [-EFivclnrRHh] [--indexed] <pattern> [file...]\n")
+            return 2
+        
+        extended = 'extended' in options and 'fixed' not in options
         try:
-            results = ["PID   NAME                     CPU%   MEM%"]
-            results.append("-" * 45)
-            
-            for proc in psutil.process_iter(['pid', 'name', 'cpu_percent', 'memory_percent']):
-                try:
-                    info = proc.info
-                    results.append(f"{info['pid']:<5} {info['name']:<20} {info['cpu_percent']:<6.1f} {info['memory_percent']:<6.1f}")
-                except (psutil.NoSuchProcess, psutil.AccessDenied):
-                    continue
-            
-            return '\n'.join(results)
-        except Exception as e:
-            return f"Error listing processes: {str(e)}"
-    
-    def cmd_kill(self, args: List[str]) -> str:
-        """Kill a process by PID"""
-        if not args:
-            return "Usage: kill <pid>"
+            source, flags = text_search.compile_pattern(pattern, extended, 'ignore_case' in options)
+        except re.error as e:
+            yield ErrorText(f"grep: invalid regular expression: {str(e)}\n")
+            return 2
         
+        if 'with_filename' in options:
+            show_names = True
+        elif 'no_filename' in options:
+            show_names = False
+        else:
+            show_names = len(files) > 1 or (recursive and any(
+                os.path.isdir(self._resolve_path(name)) for name in files))
+        search = text_search.SearchOptions(
+            source, flags, fixed=not extended, invert='invert' in options, count='count' in options,
+            files_with_matches='files_with_matches' in options, line_numbers='line_numbers' in options,
+            show_names=show_names)
+        
+        if not files:
+            matched = yield from text_search.search_lines(stdin, '(standard input)', search)
+            return 0 if matched else 1
+        
+        # With --indexed, directories are narrowed to the files that can match;
+        # -v and -c report on files without matches too, so they get them all
+        index_keys = None
+        if 'indexed' in options:
+            import trigram_index
+            narrow = not (search.invert or search.count)
+            index_keys = trigram_index.required_trigrams(pattern, extended, 'ignore_case' in options) if narrow else []
+        
+        matched = False
+        failed = False
+        walk_errors = []
         try:
-            pid = int(args[0])
-            proc = psutil.Process(pid)
-            proc.terminate()
-            return f"Process {pid} terminated"
-        except ValueError:
-            return "Invalid PID: must be a number"
-        except psutil.NoSuchProcess:
-            return f"No such process: {args[0]}"
-        except psutil.AccessDenied:
-            return f"Access denied: cannot kill process {args[0]}"
+            paths = self._grep_files(files, recursive, walk_errors, index_keys)
+            for result in text_search.search_files(paths, search):
+                if result.error:
+                    yield ErrorText(result.error)
+                    failed = True
+                matched = matched or result.matched
+                yield from result.lines
         except Exception as e:
-            return f"Error killing process: {str(e)}"
+            yield ErrorText(f"Error in grep: {str(e)}\n")
+            return 2
+        for message in walk_errors:
+            yield ErrorText(message)
+        return 2 if failed or walk_errors else 0 if matched else 1
     
-    def cmd_top(self, args: List[str]) -> str:
-        """Display system resource usage"""
-        try:
-            # CPU usage
-            cpu_percent = psutil.cpu_percent(interval=1)
-            
-            # Memory usage
-            memory = psutil.virtual_memory()
-            
-            # Disk usage
-            disk = psutil.disk_usage('/')
-            
-            results = [
-                "System Resource Usage",
-                "=" * 30,
-                f"CPU Usage: {cpu_percent}%",
-                f"Memory Usage: {memory.percent}% ({memory.used // (1024**3):.1f}GB / {memory.total // (1024**3):.1f}GB)",
-                f"Disk Usage: {disk.percent}% ({disk.used // (1024**3):.1f}GB / {disk.total // (1024**3):.1f}GB)",
-                "",
-                "Top Processes by CPU:",
-                "PID   NAME                     CPU%   MEM%",
-                "-" * 45
-            ]
-            
-            # Get top CPU processes
-            processes = []
-            for proc in psutil.process_iter(['pid', 'name', 'cpu_percent', 'memory_percent']):
-                try:
-                    processes.append(proc.info)
-                except (psutil.NoSuchProcess, psutil.AccessDenied):
-                    continue
-            
-            # Sort by CPU usage
-            processes.sort(key=lambda x: x['cpu_percent'] or 0, reverse=True)
-            
-            for proc in processes[:10]:  # Top 10
-                results.append(f"{proc['pid']:<5} {proc['name']:<20} {proc['cpu_percent'] or 0:<6.1f} {proc['memory_percent'] or 0:<6.1f}")
-            
-            return '\n'.join(results)
-        except Exception as e:
-            return f"Error getting system info: {str(e)}"
+    def _grep_files(self, names: List[str], recursive: bool, errors: List[str],
+                    index_keys: Optional[List[int]] = None) -> Iterator[Tuple[str, str]]:
+        """(path, display name) of each file to search; with recursive, the files below directories"""
+        for name in names:
+            path = self._resolve_path(name)
+            if recursive and os.path.isdir(path) and index_keys is not None:
+                yield from self._indexed_files(path, name, index_keys, errors)
+            elif recursive and os.path.isdir(path):
+                import text_search
+                walk_errors = []
+                for entry, label in text_search.walk_files(path, name, walk_errors):
+                    yield entry.path, label
+                errors.extend(f"grep: {message}\n" for message in walk_errors)
+            else:
+                yield path, name
     
-    def cmd_df(self, args: List[str]) -> str:
-        """Display filesystem disk space usage"""
+    def _indexed_files(self, path: str, name: str, keys: List[int], errors: List[str]) -> Iterator[Tuple[str, str]]:
+        """(path, display name) of the files below a directory that its index says may match"""
+        import trigram_index
+        found = trigram_index.find_index(path, self._index_directory())
+        if found is None:
+            errors.append(f"grep: {name}: not indexed (run 'index build {name}')\n")
+            return
+        index_path, root = found
         try:
-            results = ["Filesystem Usage", "=" * 30]
-            
-            # Get all disk partitions
-            partitions = psutil.disk_partitions()
-            
-            for partition in partitions:
-                try:
-                    usage = psutil.disk_usage(partition.mountpoint)
-                    results.append(f"Device: {partition.device}")
-                    results.append(f"  Mountpoint: {partition.mountpoint}")
-                    results.append(f"  File system: {partition.fstype}")
-                    results.append(f"  Total: {usage.total // (1024**3):.1f}GB")
-                    results.append(f"  Used: {usage.used // (1024**3):.1f}GB ({usage.percent}%)")
-                    results.append(f"  Free: {usage.free // (1024**3):.1f}GB")
-                    results.append("")
-                except PermissionError:
-                    results.append(f"Permission denied: {partition.device}")
-                    results.append("")
-            
-            return '\n'.join(results)
-        except Exception as e:
-            return f"Error getting disk info: {str(e)}"
+            index = trigram_index.TrigramIndex(index_path)
+        except (OSError, ValueError) as e:
+            errors.append(f"grep: {name}: {str(e)}\n")
+            return
+        
+        with index:
+            prefix = os.path.relpath(os.path.realpath(path), root)
+            prefix = '' if prefix == '.' else prefix
+            for candidate in index.candidates(keys, prefix):
+                below = candidate[len(prefix) + 1:] if prefix else candidate
+                yield os.path.join(root, candidate), os.path.join(name, below)
+    
+    def _index_directory(self) -> Optional[str]:
+        """Where this session keeps trigram indexes ($TERMINAL_INDEX_DIR), None for the default"""
+        return self.environment_vars.get('TERMINAL_INDEX_DIR') or None
     
-    def cmd_free(self, args: List[str]) -> str:
-        """Display memory usage"""
+    def cmd_index(self, args: List[str]) -> BuiltinResult:
+        """index build|status|drop [DIR] - Manage the trigram index grep --indexed searches"""
+        import trigram_index
+        if not args or args[0] not in ('build', 'status', 'drop') or len(args) > 2:
+            return ErrorText("Usage: index build|status|drop [directory]"), 2
+        action = args[0]
+        name = args[1] if len(args) > 1 else '.'
+        path = self._resolve_path(name)
+        if not os.path.isdir(path):
+            return ErrorText(f"index: {name}: Not a directory"), 1
+        directory = self._index_directory()
+        
+        if action == 'build':
+            errors = []
+            try:
+                stats = trigram_index.build(path, directory, errors)
+            except OSError as e:
+                return ErrorText(f"index: {str(e)}"), 1
+            lines = [f"index: {message}" for message in errors]
+            lines.append(f"Indexed {stats.files} files in {name} ({stats.read} read, {stats.reused} unchanged, "
+                         f"{stats.removed} removed): {stats.trigrams} trigrams, {self._human_size(stats.size)} "
+                         f"in {stats.elapsed:.2f}s")
+            return '\n'.join(lines), (1 if errors else 0)
+        
+        if action == 'drop':
+            index_path = trigram_index.index_file(os.path.realpath(path), directory)
+            try:
+                os.unlink(index_path)
+            except FileNotFoundError:
+                return ErrorText(f"index: {name} is not indexed"), 1
+            except OSError as e:
+                return ErrorText(f"index: {str(e)}"), 1
+            return f"Removed the index of {name}"
+        
+        found = trigram_index.find_index(path, directory)
+        if found is None:
+            return ErrorText(f"index: {name} is not indexed"), 1
         try:
-            memory = psutil.virtual_memory()
-            swap = psutil.swap_memory()
-            
-            results = [
-                "Memory Usage Information",
-                "=" * 30,
-                f"Total RAM: {memory.total // (1024**3):.1f}GB",
-                f"Available RAM: {memory.available // (1024**3):.1f}GB",
-                f"Used RAM: {memory.used // (1024**3):.1f}GB ({memory.percent}%)",
-                f"Free RAM: {memory.free // (1024**3):.1f}GB",
-                "",
-                f"Total Swap: {swap.total // (1024**3):.1f}GB",
-                f"Used Swap: {swap.used // (1024**3):.1f}GB ({swap.percent}%)",
-                f"Free Swap: {swap.free // (1024**3):.1f}GB"
-            ]
-            
-            return '\n'.join(results)
-        except Exception as e:
-            return f"Error getting memory info: {str(e)}"
+            with trigram_index.TrigramIndex(found[0]) as index:
+                changed, deleted = index.changes()
+                built = datetime.fromtimestamp(index.built).strftime('%Y-%m-%d %H:%M:%S')
+                return (f"Index of {index.root}: {index.file_count} files, {index.trigram_count} trigrams, "
+                        f"{self._human_size(os.path.getsize(found[0]))}, built {built}\n"
+                        f"Since then: {changed} files new or modified, {deleted} deleted")
+        except (OSError, ValueError) as e:
+            return ErrorText(f"index: {str(e)}"), 1
     
     # Utility Commands
     
     def cmd_whoami(self, args: List[str]) -> str:
         """Display current user"""
-        return os.getenv('USER', os.getenv('USERNAME', 'unknown'))
+        env = self.environment_vars
+        return env.get('USER', env.get('USERNAME', 'unknown'))
     
     def cmd_date(self, args: List[str]) -> str:
         """Display current date and time"""
         return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     
-    def cmd_history(self, args: List[str]) -> str:
-        """Display command history"""
-        if not self.command_history:
-            return "No command history"
+    def cmd_history(self, args: List[str]) -> BuiltinResult:
+        """Display the last commands (50 by default), or search the history"""
+        if args and args[0] == 'search':
+            if len(args) < 2:
+                return ErrorText("Usage: history search <term>"), 2
+            term = ' '.join(args[1:])
+            entries = self.history.search(term, limit=50)
+            if not entries:
+                return ErrorText(f"No history entries match '{term}'"), 1
+            
+            results = []
+            for entry in reversed(entries):
+                when = datetime.fromtimestamp(entry.timestamp).strftime('%Y-%m-%d %H:%M:%S')
+                code = '-' if entry.exit_code is None else entry.exit_code
+                duration = '-' if entry.duration is None else CommandStats.format_seconds(entry.duration)
+                results.append(f"{entry.number:5d}  {when}  [{code}] {duration:>8}  {entry.cwd}  {entry.command}")
+            return '\n'.join(results)
         
-        results = []
-        for i, cmd in enumerate(self.command_history[-50:], 1):  # Last 50 commands
-            results.append(f"{i:3d}  {cmd}")
+        try:
+            count = int(args[0]) if args else 50
+        except ValueError:
+            return ErrorText("Usage: history [count] | history search <term>"), 2
+        entries = self.history.recent(count)
+        if not entries:
+            return "No command history"
         
-        return '\n'.join(results)
+        return '\n'.join(f"{entry.number:5d}  {entry.command}" for entry in entries)
     
     def cmd_clear(self, args: List[str]) -> str:
         """Clear screen"""
@@ -632,7 +2048,9 @@ class PythonTerminal:
     
     def cmd_exit(self, args: List[str]) -> str:
         """Exit terminal"""
-        return "EXIT_TERMINAL"
+        if self.jobs.current() is None:  # In a background job, exit only ends the job
+            self.exit_requested = True
+        return ""
     
     def cmd_help(self, args: List[str]) -> str:
         """Display help information"""
@@ -648,10 +2066,13 @@ File Operations:
   rm, del          - Remove files/directories
   touch            - Create empty file
   cat, type        - Display file contents
+  head [-n N] file - Show the first N lines (default 10)
+  tail [-n N] [-f] file - Show the last N lines; -f follows new lines
   cp, copy         - Copy files/directories
   mv, move         - Move/rename files/directories
-  find             - Find files and directories
-  grep             - Search text in files
+  find [path...] [expr] - Find files (-name -type -size -mtime -prune -delete -exec ... -jobs N)
+  grep [-EivclnrH] pat [file...] - Search files; -E regex, -r recursive
+  index build|status|drop [dir] - Trigram index for fast grep --indexed
   tree             - Display directory tree
 
 System Monitoring:
@@ -661,14 +2082,32 @@ System Monitoring:
   df               - Display filesystem usage
   free             - Display memory usage
 
+Job Control:
+  cmd &            - Run a command in the background
+  jobs             - List background jobs
+  fg [%job]        - Wait for a job and show its output
+  bg [%job]        - Resume a job stopped with kill -STOP %job
+  wait [%job...]   - Wait for background jobs to finish
+  timeout [s [cmd]] - Show/set the command time limit, or run cmd with one
+  parallel [-j N] [-k] cmd ::: args - Run cmd once per arg on N workers
+  ulimit [-a] [-t|-v|-n N] [cmd] - Show/set CPU, memory, open-file limits
+  nice [-n N] [-i class[:level]] [cmd] - Show/set CPU and I/O priority
+
 Utilities:
   echo             - Echo text
   whoami           - Display current user
   date             - Display current date/time
-  history          - Show command history
+  history [n]      - Show the last n commands (default 50)
+  history search t - Search the saved history for commands with words t
   clear, cls       - Clear screen
   env              - Show environment variables
+  set VAR=value    - Set an environment variable for this session
+  unset VAR...     - Remove environment variables from this session
   alias            - Create command aliases
+  hash [-r] [cmd]  - Show, reset or add remembered command locations
+  which cmd        - Show what runs for a command name
+  time cmd         - Run cmd and report real/user/sys time and max RSS
+  stats [-r|cmd]   - Show per-command timing (histogram for cmd, -r resets)
   help             - Show this help
 
 Navigation:
@@ -676,6 +2115,9 @@ Navigation:
 
 Use -h or --help with most commands for more options.
         """
+        plugin_names = self.builtin_commands.plugin_names()
+        if plugin_names:
+            help_text += "\nPlugin commands:\n  " + ' '.join(plugin_names) + "\n"
         return help_text.strip()
     
     def cmd_alias(self, args: List[str]) -> str:
@@ -694,6 +2136,7 @@ Use -h or --help with most commands for more options.
             # Create alias
             alias, command = args[0].split('=', 1)
             self.aliases[alias.strip()] = command.strip()
+            self.compiled_lines.clear()
             return f"Alias created: {alias.strip()} = {command.strip()}"
         else:
             return "Usage: alias name=command"
@@ -712,17 +2155,381 @@ Use -h or --help with most commands for more options.
         
         var, value = args[0].split('=', 1)
         self.environment_vars[var] = value
-        os.environ[var] = value
+        if var == 'PATH':
+            self.command_hash.clear()
         return f"Set {var}={value}"
     
+    def cmd_unset(self, args: List[str]) -> str:
+        """Remove environment variables from the session"""
+        if not args:
+            return "Usage: unset VARIABLE..."
+        
+        for var in args:
+            self.environment_vars.pop(var, None)
+            if var == 'PATH':
+                self.command_hash.clear()
+        return ""
+    
+    def cmd_hash(self, args: List[str]) -> BuiltinResult:
+        """Show, reset or add to the table of remembered command locations"""
+        path = self.environment_vars.get('PATH', os.defpath)
+        if args == ['-r']:
+            self.command_hash.clear()
+            return ""
+        
+        if args:
+            missing = [name for name in args if self.command_hash.lookup(name, path) is None]
+            if missing:
+                return ErrorText('\n'.join(f"hash: {name}: not found" for name in missing)), 1
+            return ""
+        
+        table = self.command_hash.remembered(path)
+        if not table:
+            return "hash: hash table empty"
+        return '\n'.join(["hits\tcommand"] + [f"{hits:4}\t{location}" for hits, location in table])
+    
+    def cmd_which(self, args: List[str]) -> BuiltinResult:
+        """Show what runs for each command name"""
+        if not args:
+            return ErrorText("Usage: which command [command...]"), 2
+        
+        path = self.environment_vars.get('PATH', os.defpath)
+        results = []
+        status = 0
+        for name in args:
+            if name in self.aliases:
+                results.append(f"{name}: aliased to {self.aliases[name]}")
+            elif name in self.builtin_commands:
+                results.append(f"{name}: shell built-in command")
+            else:
+                location = self.command_hash.lookup(name, path)
+                if location is None:
+                    results.append(f"which: no {name} in PATH")
+                    status = 1
+                else:
+                    results.append(location)
+        
+        return '\n'.join(results), status
+    
+    # Job Control Commands
+    
+    def cmd_jobs(self, args: List[str]) -> str:
+        """List background jobs"""
+        results = []
+        for job in self.jobs:
+            pids = ' '.join(str(process.pid) for process in job.processes)
+            line = f"[{job.id}]  {job.state:<10} {job.command}"
+            if '-l' in args and pids:
+                line += f"  (pid {pids})"
+            results.append(line)
+            if job.finished.is_set():
+                # Reported now, so it is not announced again
+                self.jobs.remove(job)
+        
+        return '\n'.join(results) if results else "No background jobs"
+    
+    def cmd_fg(self, args: List[str]) -> BuiltinResult:
+        """Wait for a background job in the foreground and show its output"""
+        return self._collect_result(self.stream_fg(args))
+    
+    def stream_fg(self, args: List[str]) -> Iterator[str]:
+        """Resume a job if stopped and stream its output until it finishes"""
+        try:
+            job = self.jobs.get(args[0] if args else None)
+        except ValueError as e:
+            yield ErrorText(f"fg: {str(e)}\n")
+            return 1
+        
+        yield f"{job.command}\n"
+        job.resume()
+        yield from job.follow()
+        self.jobs.remove(job)
+        return job.return_code
+    
+    def cmd_bg(self, args: List[str]) -> BuiltinResult:
+        """Resume a background job stopped with kill -STOP"""
+        try:
+            job = self.jobs.get(args[0] if args else None)
+        except ValueError as e:
+            return ErrorText(f"bg: {str(e)}"), 1
+        
+        if job.finished.is_set():
+            return ErrorText(f"bg: job {job.id} has already completed"), 1
+        job.resume()
+        return f"[{job.id}] {job.command} &"
+    
+    def cmd_wait(self, args: List[str]) -> BuiltinResult:
+        """Wait for background jobs to finish"""
+        return self._collect_result(self.stream_wait(args))
+    
+    def stream_wait(self, args: List[str]) -> Iterator[str]:
+        """Wait for the given jobs (or all jobs), yielding their output"""
+        try:
+            jobs = [self.jobs.get(spec) for spec in args] if args else list(self.jobs)
+        except ValueError as e:
+            yield ErrorText(f"wait: {str(e)}\n")
+            return 127
+        
+        status = 0
+        for job in jobs:
+            yield from job.follow()
+            self.jobs.remove(job)
+            yield f"[{job.id}]  {job.state:<10} {job.command}\n"
+            status = job.return_code
+        
+        return status
+    
+    def cmd_timeout(self, args: List[str]) -> BuiltinResult:
+        """Show or set the session time limit, or run a command with a time limit"""
+        return self._collect_result(self.stream_timeout(args))
+    
+    def stream_timeout(self, args: List[str]) -> Iterator[str]:
+        """timeout [SECONDS [COMMAND [ARGS...]]] - 0 means no limit"""
+        if not args:
+            limit = f"{self.command_timeout:g} seconds" if self.command_timeout else "none"
+            yield f"Command timeout: {limit}\n"
+            return 0
+        
+        try:
+            seconds = float(args[0])
+            if seconds < 0:
+                raise ValueError
+        except ValueError:
+            yield ErrorText("Usage: timeout [seconds [command [args...]]]\n")
+            return 2
+        
+        if len(args) == 1:
+            self.command_timeout = seconds or None
+            limit = f"{seconds:g} seconds" if seconds else "none"
+            yield f"Command timeout set to {limit}\n"
+            return 0
+        
+        argv = self._expand_alias(args[1:])
+        stages = [(argv, argv[0] in self.builtin_commands, [])]
+        return (yield from self._run_pipeline(stages, timeout=seconds or None))
+    
+    # Parallel Execution
+    
+    def cmd_parallel(self, args: List[str]) -> BuiltinResult:
+        """Run a command template over many arguments on a worker pool"""
+        return self._collect_result(self.stream_parallel(args))
+    
+    def stream_parallel(self, args: List[str]) -> Iterator[str]:
+        """parallel [-j N] [-k] COMMAND [ARGS...] ::: ITEMS... - run COMMAND once per item"""
+        usage = "Usage: parallel [-j jobs] [-k] command [args...] ::: items...\n"
+        workers = os.cpu_count() or 1
+        keep_order = False
+        index = 0
+        try:
+            while index < len(args) and args[index].startswith('-') and args[index] != ':::':
+                option = args[index]
+                if option == '-k':
+                    keep_order = True
+                elif option == '-j':
+                    index += 1
+                    workers = int(args[index])
+                elif option.startswith('-j'):
+                    workers = int(option[2:])
+                else:
+                    raise ValueError(option)
+                index += 1
+            separator = args.index(':::', index)
+        except (ValueError, IndexError):
+            yield usage
+            return 2
+        
+        template, items = args[index:separator], args[separator + 1:]
+        if not template or workers < 1:
+            yield usage
+            return 2
+        
+        timeout = self._timeout_for(None)
+        substitute = any('{}' in word for word in template)
+        directory = self.current_directory
+        
+        def run(item: str) -> Tuple[str, int]:
+            with self._working_directory(directory):
+                return run_in_directory(item)
+        
+        def run_in_directory(item: str) -> Tuple[str, int]:
+            if substitute:
+                argv = [word.replace('{}', item) for word in template]
+            else:
+                argv = template + [item]
+            argv = self._expand_alias(argv)
+            parts = []
+            chunks = self._run_pipeline([(argv, argv[0] in self.builtin_commands, [])], timeout)
+            while True:
+                try:
+                    parts.append(next(chunks))
+                except StopIteration as stop:
+                    output = ''.join(parts)
+                    if output and not output.endswith('\n'):
+                        output += '\n'
+                    return output, stop.value or 0
+        
+        failed = 0
+        futures = []
+        from concurrent.futures import ThreadPoolExecutor, as_completed
+        executor = ThreadPoolExecutor(max_workers=min(workers, len(items) or 1))
+        try:
+            futures = [executor.submit(run, item) for item in items]
+            for future in (futures if keep_order else as_completed(futures)):
+                output, status = future.result()
+                failed += status != 0
+                if output:
+                    yield output
+        finally:
+            # Closed early: drop the tasks that have not started
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=False)
+        return min(failed, 101)
+    
+    # Resource Limits
+    
+    def cmd_ulimit(self, args: List[str]) -> BuiltinResult:
+        """Show or set resource limits of external commands"""
+        return self._collect_result(self.stream_ulimit(args))
+    
+    def stream_ulimit(self, args: List[str]) -> Iterator[str]:
+        """ulimit [-a] [-t SECONDS] [-v KBYTES] [-n FILES] [COMMAND [ARGS...]] - Show or set resource limits"""
+        if process_limits.resource is None:
+            yield ErrorText("ulimit: not supported on this system\n")
+            return 1
+        try:
+            limits, queries, command = process_limits.parse_ulimit(args, self.limits)
+        except ValueError as e:
+            yield ErrorText(f"ulimit: {str(e)}\nUsage: ulimit [-a] [-t seconds] [-v kbytes] [-n files] [command [args...]]\n")
+            return 2
+        
+        exceeded = limits.exceeds(self.hard_limits)
+        if exceeded:
+            yield ErrorText(f"ulimit: cannot raise the {exceeded} limit above the session's hard limit\n")
+            return 1
+        if command:
+            return (yield from self._run_limited(command, limits))
+        self.limits = limits
+        if not args:
+            queries = list(process_limits.RLIMITS)
+        
+        for option in queries:
+            field, _, multiplier, description = process_limits.RLIMITS[option]
+            value = getattr(limits, field)
+            value = process_limits.current_rlimit(option) if value is None else value // multiplier
+            shown = 'unlimited' if value is None else str(value)
+            yield f"{shown}\n" if len(queries) == 1 else f"{description:<24} (-{option}) {shown}\n"
+        return 0
+    
+    def cmd_nice(self, args: List[str]) -> BuiltinResult:
+        """Show or set the CPU and I/O priority of external commands"""
+        return self._collect_result(self.stream_nice(args))
+    
+    def stream_nice(self, args: List[str]) -> Iterator[str]:
+        """nice [-n ADJUSTMENT] [-i CLASS[:LEVEL]] [COMMAND [ARGS...]] - Set CPU and I/O priority"""
+        usage = "Usage: nice [-n adjustment] [-i idle|best-effort[:level]|realtime[:level]] [command [args...]]\n"
+        if not hasattr(os, 'nice'):
+            yield ErrorText("nice: not supported on this system\n")
+            return 1
+        
+        changes = {}
+        index = 0
+        try:
+            while index < len(args) and args[index] in ('-n', '-i'):
+                if index + 1 >= len(args):
+                    raise ValueError("missing value")
+                option, value = args[index], args[index + 1]
+                if option == '-n':
+                    adjustment = int(value)
+                    if not -20 <= adjustment <= 19:
+                        raise ValueError("adjustment must be between -20 and 19")
+                    changes['nice'] = adjustment or None
+                else:
+                    io_class, io_level = process_limits.parse_io_priority(value)
+                    if not process_limits.io_priority_supported():
+                        raise ValueError("I/O priority is not supported on this system")
+                    changes['io_class'] = io_class or None
+                    changes['io_level'] = io_level if io_class else None
+                index += 2
+        except ValueError as e:
+            yield ErrorText(f"nice: {str(e)}\n{usage}")
+            return 2
+        
+        privileged = os.name != 'posix' or os.geteuid() == 0
+        if not privileged and ((changes.get('nice') or 0) < 0 or changes.get('io_class') == 1):
+            yield ErrorText("nice: raising priority requires root\n")
+            return 1
+        
+        command = args[index:]
+        if command and not changes:
+            changes['nice'] = 10
+        limits = self.limits.copy(**changes)
+        exceeded = limits.exceeds(self.hard_limits)
+        if exceeded:
+            yield ErrorText(f"nice: cannot raise the {exceeded} above the session's limit\n")
+            return 1
+        if command:
+            return (yield from self._run_limited(command, limits))
+        if changes:
+            self.limits = limits
+            return 0
+        
+        yield f"{os.nice(0) + (self.limits.nice or 0)}\n"
+        if self.limits.io_class is not None:
+            names = {number: name for name, number in process_limits.IO_CLASSES.items()}
+            level = f":{self.limits.io_level}" if self.limits.io_class in (1, 2) else ''
+            yield f"io: {names[self.limits.io_class]}{level}\n"
+        return 0
+    
+    def _run_limited(self, command: List[str], limits: ProcessLimits) -> Iterator[str]:
+        """Run one command with its own limits; builtins run in the terminal unlimited"""
+        argv = self._expand_alias(command)
+        return (yield from self._run_pipeline([(argv, argv[0] in self.builtin_commands, [])],
+                                              self._timeout_for(None), limits=limits))
+    
+    # Statistics Commands
+    
+    def cmd_stats(self, args: List[str]) -> BuiltinResult:
+        """Show per-command timing statistics, a command's histogram, or reset them"""
+        if args == ['-r']:
+            self.stats.reset()
+            return "Command statistics cleared"
+        if args:
+            histogram = self.stats.histogram(' '.join(args))
+            if histogram is None:
+                return ErrorText(f"stats: no runs of {' '.join(args)} recorded"), 1
+            return histogram
+        return self.stats.summary()
+    
+    def cmd_time(self, args: List[str]) -> BuiltinResult:
+        """Run a command and report its time and resource usage"""
+        return self._collect_result(self.stream_time(args))
+    
+    def stream_time(self, args: List[str]) -> Iterator[str]:
+        """time COMMAND [ARGS...] - run a command, then print real/user/sys time and max RSS"""
+        if not args:
+            yield ErrorText("Usage: time command [args...]\n")
+            return 2
+        
+        argv = self._expand_alias(args)
+        usage = ResourceUsage()
+        status = yield from self._run_pipeline([(argv, argv[0] in self.builtin_commands, [])],
+                                               self._timeout_for(None), usage=usage)
+        
+        def minutes(seconds: float) -> str:
+            return f"{int(seconds // 60)}m{seconds % 60:.3f}s"
+        
+        yield (f"\nreal\t{minutes(usage.wall)}\nuser\t{minutes(usage.user)}\n"
+               f"sys\t{minutes(usage.sys)}\nmaxrss\t{usage.maxrss} KB\n")
+        return status
+    
     def cmd_tree(self, args: List[str]) -> str:
         """Display directory tree"""
         path = args[0] if args else self.current_directory
         max_depth = 3  # Limit depth to avoid huge outputs
         
         try:
-            if not os.path.isabs(path):
-                path = os.path.join(self.current_directory, path)
+            path = self._resolve_path(path)
             
             if not os.path.exists(path):
                 return f"Path not found: {path}"
@@ -0,0 +1,369 @@
+# text_search.py - Regex Search over Files
+"""The engine behind the ``grep`` builtin.
+
+Each file is memory-mapped and searched a large block at a time with
+one precompiled pattern, so lines are only located and split around the
+matches the regex engine finds; a file without matches is never split
+at all. Matches are confined to a single line by re-checking each
+candidate within its line. A fixed string without -i is found in the
+raw bytes; any other pattern is matched against text decoded as UTF-8,
+so -i, . and \\w cover all of Unicode, as they do on a pipe's lines.
+Files with a NUL byte in their first block are taken to be binary: they
+are searched the same way, but, as in GNU grep, a match is reported as
+"Binary file NAME matches" instead of lines.
+
+Many files are searched by a pool of worker processes (started through
+a fork server, so a large, threaded parent is never forked). Results
+come back in the order the files were given, whatever order the
+workers finish in.
+"""
+import atexit
+import collections
+import mmap
+import os
+import re
+import threading
+from itertools import islice
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+# Bytes inspected for a NUL to recognize binary files
+BINARY_SNIFF = 8192
+
+# Searches over fewer files than this stay in the calling process
+PARALLEL_MIN_FILES = 16
+
+# Files handed to a worker at a time, and batches in flight per worker
+BATCH_SIZE = 8
+BATCHES_PER_WORKER = 4
+
+# Newlines are counted over slices of at most this many bytes
+COUNT_CHUNK = 1 << 20
+
+# Files matched as text are decoded this many bytes (rounded to whole lines) at a time
+TEXT_BLOCK = 1 << 20
+
+# Files are decoded as this before matching as text
+TEXT_ENCODING = 'utf-8'
+
+
+class SearchOptions(NamedTuple):
+    """What to search for and how to report it"""
+    pattern: str
+    flags: int = 0
+    fixed: bool = False               # The pattern is an escaped fixed string
+    invert: bool = False              # -v
+    count: bool = False               # -c
+    files_with_matches: bool = False  # -l
+    line_numbers: bool = False        # -n
+    show_names: bool = False          # Prefix lines with the file name
+
+
+class FileResult(NamedTuple):
+    """Output lines of one file, whether anything matched, and any error"""
+    lines: List[str]
+    matched: bool
+    error: Optional[str] = None
+
+
+def compile_pattern(pattern: str, extended: bool, ignore_case: bool) -> Tuple[str, int]:
+    """(regex source, flags) for a grep pattern: a fixed string unless extended
+
+    Raises re.error for an invalid extended pattern.
+    """
+    source = pattern if extended else re.escape(pattern)
+    flags = re.MULTILINE | (re.IGNORECASE if ignore_case else 0)
+    re.compile(source, flags)
+    return source, flags
+
+
+def _byte_pattern(options: SearchOptions) -> Optional[bytes]:
+    """The pattern as bytes if it can be found in a file's raw bytes"""
+    if options.fixed and not options.flags & re.IGNORECASE:
+        try:
+            return options.pattern.encode(TEXT_ENCODING)
+        except UnicodeEncodeError:  # A lone surrogate, which decoded text never has
+            return None
+    return None
+
+
+def _newline(data):
+    return '\n' if isinstance(data, str) else b'\n'
+
+
+def _count_newlines(data, start: int, end: int) -> int:
+    """Newlines in data[start:end], counted a bounded slice at a time"""
+    newline = _newline(data)
+    count = 0
+    while start < end:
+        stop = min(start + COUNT_CHUNK, end)
+        count += data[start:stop].count(newline)
+        start = stop
+    return count
+
+
+def _line_end(data, position: int, size: int) -> int:
+    end = data.find(_newline(data), position)
+    return size if end < 0 else end
+
+
+def _matching_lines(data, size: int, regex) -> Iterator[Tuple[int, int]]:
+    """(start, end) of every line containing a match, in order"""
+    newline = _newline(data)
+    position = 0
+    while position < size:
+        found = regex.search(data, position)
+        if found is None:
+            return
+        start = data.rfind(newline, 0, found.start()) + 1
+        end = _line_end(data, found.start(), size)
+        # A match that ran past the end of its line may not match within it
+        if found.end() <= end or regex.search(data, start, end) is not None:
+            yield start, end
+        position = end + 1
+
+
+def _non_matching_lines(data, size: int, regex) -> Iterator[Tuple[int, int]]:
+    """(start, end) of every line without a match, in order"""
+    position = 0
+    for match_start, match_end in _matching_lines(data, size, regex):
+        while position < match_start:
+            end = _line_end(data, position, size)
+            yield position, end
+            position = end + 1
+        position = match_end + 1
+    while position < size:
+        end = _line_end(data, position, size)
+        yield position, end
+        position = end + 1
+
+
+def _format(options: SearchOptions, name: str, number: int, text: str) -> str:
+    """An output line: the text after the optional name: and number: prefixes"""
+    prefix = f"{name}:" if options.show_names else ''
+    if options.line_numbers:
+        prefix += f"{number}:"
+    return prefix + text + '\n'
+
+
+def _blocks(data, size: int, text: bool) -> Iterator[Tuple[object, int]]:
+    """(block, length) pairs covering a buffer: itself, or whole lines decoded as text"""
+    if not text:
+        yield data, size
+        return
+    position = 0
+    while position < size:
+        end = min(position + TEXT_BLOCK, size)
+        if end < size:
+            cut = data.rfind(b'\n', position, end)
+            end = cut + 1 if cut >= 0 else min(_line_end(data, end, size) + 1, size)
+        block = data[position:end].decode(TEXT_ENCODING, errors='replace')
+        yield block, len(block)
+        position = end
+
+
+def _selected_lines(data, size: int, options: SearchOptions) -> Iterator[Tuple[int, object]]:
+    """(line number, line) of every line selected by the pattern and -v
+
+    Line numbers are only counted with -n. Lines are bytes when the
+    pattern is matched against raw bytes, and text otherwise.
+    """
+    encoded = _byte_pattern(options)
+    regex = re.compile(options.pattern if encoded is None else encoded, options.flags)
+    select = _non_matching_lines if options.invert else _matching_lines
+    number = 1
+    for block, length in _blocks(data, size, encoded is None):
+        counted_to = 0
+        for start, end in select(block, length, regex):
+            if options.line_numbers:
+                number += _count_newlines(block, counted_to, start)
+                counted_to = start
+            yield number, block[start:end]
+        if options.line_numbers:
+            number += _count_newlines(block, counted_to, length)
+
+
+def search_buffer(data, size: int, name: str, options: SearchOptions, binary: bool = False) -> FileResult:
+    """Search the first size bytes of a bytes-like object
+
+    A binary buffer yields a single "Binary file NAME matches" line in
+    place of its matching lines; -l and -c output is unchanged.
+    """
+    lines = _selected_lines(data, size, options)
+
+    if options.files_with_matches:
+        matched = next(lines, None) is not None
+        return FileResult([name + '\n'] if matched else [], matched)
+    if options.count:
+        count = sum(1 for _ in lines)
+        return FileResult([f"{name}:{count}\n" if options.show_names else f"{count}\n"], count > 0)
+    if binary:
+        matched = next(lines, None) is not None
+        return FileResult([f"Binary file {name} matches\n"] if matched else [], matched)
+
+    output = []
+    for number, line in lines:
+        text = line if isinstance(line, str) else line.decode(TEXT_ENCODING, errors='replace')
+        output.append(_format(options, name, number, text))
+    return FileResult(output, bool(output))
+
+
+def search_file(path: str, name: str, options: SearchOptions) -> FileResult:
+    """Search one file, mapping it into memory"""
+    try:
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                return search_buffer(b'', 0, name, options)
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                binary = data.find(b'\0', 0, min(size, BINARY_SNIFF)) >= 0
+                return search_buffer(data, size, name, options, binary)
+    except FileNotFoundError:
+        return FileResult([], False, f"grep: {name}: No such file or directory\n")
+    except IsADirectoryError:
+        return FileResult([], False, f"grep: {name}: Is a directory\n")
+    except PermissionError:
+        return FileResult([], False, f"grep: {name}: Permission denied\n")
+    except (OSError, ValueError) as e:
+        # ValueError: files mmap cannot map, such as /proc entries
+        return FileResult([], False, f"grep: {name}: {e}\n")
+
+
+def walk_files(path: str, label: str, errors: Optional[List[str]] = None) -> Iterator[Tuple[os.DirEntry, str]]:
+    """(entry, label) for every regular file below a directory
+
+    Directories are walked in name order, files before subdirectories,
+    without following symlinks; each label is label joined with the
+    file's path below the directory. Unreadable directories are added to
+    errors as 'label: reason'.
+    """
+    pending = [(path, label)]
+    while pending:
+        directory, label = pending.pop()
+        try:
+            with os.scandir(directory) as entries:
+                entries = sorted(entries, key=lambda entry: entry.name)
+        except OSError as e:
+            if errors is not None:
+                errors.append(f"{label}: {e.strerror}")
+            continue
+        subdirectories = []
+        for entry in entries:
+            child = os.path.join(label, entry.name)
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirectories.append((entry.path, child))
+                elif entry.is_file(follow_symlinks=False):
+                    yield entry, child
+            except OSError:
+                continue  # Removed while we were walking
+        pending.extend(reversed(subdirectories))
+
+
+def _search_batch(batch: List[Tuple[str, str]], options: SearchOptions) -> List[FileResult]:
+    return [search_file(path, name, options) for path, name in batch]
+
+
+_pool: Optional['ProcessPoolExecutor'] = None
+_pool_lock = threading.Lock()
+
+# Batches queued by search_files and not yet finished, cancelled at exit
+_queued = set()
+
+
+def worker_count() -> int:
+    return os.cpu_count() or 1
+
+
+def worker_pool() -> 'ProcessPoolExecutor':
+    """The shared worker pool, started on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            _pool = ProcessPoolExecutor(worker_count(), mp_context=multiprocessing.get_context(method))
+            # Before module teardown, which would otherwise find the lazily
+            # imported concurrent.futures.process already cleared
+            atexit.register(_shutdown_pool)
+        return _pool
+
+
+def _shutdown_pool():
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        # By hand: shutdown's cancel_futures needs Python 3.9
+        for future in list(_queued):
+            future.cancel()
+        pool.shutdown(wait=False)
+
+
+def search_files(files: Iterable[Tuple[str, str]], options: SearchOptions) -> Iterator[FileResult]:
+    """Search (path, display name) pairs, yielding results in the order given
+
+    Small searches, and any search on a single CPU, run in this process;
+    otherwise batches of files go to the worker pool, with a bounded
+    number in flight so that results stream as the files are walked.
+    """
+    files = iter(files)
+    first = list(islice(files, PARALLEL_MIN_FILES))
+    if len(first) < PARALLEL_MIN_FILES or worker_count() == 1:
+        for path, name in first:
+            yield search_file(path, name, options)
+        for path, name in files:
+            yield search_file(path, name, options)
+        return
+
+    pool = worker_pool()
+    pending = collections.deque()
+    batches = _batches(first, files)
+    limit = worker_count() * BATCHES_PER_WORKER
+    try:
+        for batch in batches:
+            future = pool.submit(_search_batch, batch, options)
+            _queued.add(future)
+            future.add_done_callback(_queued.discard)
+            pending.append(future)
+            while len(pending) >= limit:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def _batches(first: List[Tuple[str, str]], rest: Iterator[Tuple[str, str]]) -> Iterator[List[Tuple[str, str]]]:
+    for index in range(0, len(first), BATCH_SIZE):
+        yield first[index:index + BATCH_SIZE]
+    while True:
+        batch = list(islice(rest, BATCH_SIZE))
+        if not batch:
+            return
+        yield batch
+
+
+def search_lines(lines: Iterable[str], name: str, options: SearchOptions) -> Iterator[str]:
+    """Search text lines, such as a pipeline's stdin, yielding output as it is found
+
+    Returns whether anything matched.
+    """
+    regex = re.compile(options.pattern, options.flags)
+    matched = False
+    count = 0
+    for number, line in enumerate(lines, 1):
+        text = line[:-1] if line.endswith('\n') else line
+        if (regex.search(text) is not None) != options.invert:
+            matched = True
+            if options.files_with_matches:
+                yield name + '\n'
+                return True
+            count += 1
+            if not options.count:
+                yield _format(options, name, number, text)
+    if options.count:
+        yield f"{name}:{count}\n" if options.show_names else f"{count}\n"
+    return matched
+
@@ -0,0 +1,410 @@
+# trigram_index.py - Persistent Trigram Index for grep --indexed
+"""An on-disk index of the three-byte sequences each file contains.
+
+``build`` walks a directory tree (in the same order as ``grep -r``) and
+records, for every trigram of the lowercased file contents, the sorted
+list of files containing it. A pattern's literal text yields trigrams
+that any matching file must contain, so ``TrigramIndex.candidates``
+narrows a search to the files in the intersection of their posting
+lists; grep still verifies every candidate.
+
+The index is a single file of packed arrays that queries memory-map and
+binary-search in place, so opening one costs a few system calls however
+large the tree is. Rebuilding is incremental: files whose mtime and size
+are unchanged keep their postings and are not read again. Binary files
+are not indexed; like files too large to index, they are always
+candidates, since grep reports a match in them too. Files
+created or changed after the last build are not seen until the next.
+"""
+import array
+import bisect
+import mmap
+import os
+import re
+import struct
+import sys
+import time
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+import text_search
+
+MAGIC = b'TRGM'
+VERSION = 1
+
+# Files larger than this are not read; every search checks them
+MAX_FILE_SIZE = 64 << 20
+
+# Per-file states
+INDEXED, UNINDEXED, BINARY = 0, 1, 2
+
+# magic, version, byte order, build time, root length, file count, trigram
+# count, then the offsets of the sections in SECTIONS order
+SECTIONS = ('root', 'mtimes', 'sizes', 'states', 'path_offsets', 'paths', 'keys', 'posting_offsets', 'postings')
+HEADER = struct.Struct('<4sHHdQQQ' + 'Q' * len(SECTIONS))
+
+# Files read per task when the worker pool builds an index
+BUILD_BATCH = 16
+
+
+def default_dir() -> str:
+    """Where indexes are kept: $TERMINAL_INDEX_DIR or ~/.cache/python-terminal/index"""
+    return os.environ.get('TERMINAL_INDEX_DIR') or os.path.expanduser('~/.cache/python-terminal/index')
+
+
+def index_file(root: str, directory: Optional[str] = None) -> str:
+    """The index file of a (real, absolute) root directory"""
+    import hashlib
+    digest = hashlib.sha1(os.fsencode(root)).hexdigest()[:20]
+    return os.path.join(directory or default_dir(), digest + '.idx')
+
+
+def find_index(path: str, directory: Optional[str] = None) -> Optional[Tuple[str, str]]:
+    """(index file, root) of the nearest indexed directory containing path, or None"""
+    current = os.path.realpath(path)
+    while True:
+        candidate = index_file(current, directory)
+        if os.path.exists(candidate):
+            return candidate, current
+        parent = os.path.dirname(current)
+        if parent == current:
+            return None
+        current = parent
+
+
+def trigram_keys(data: bytes) -> array.array:
+    """Sorted distinct trigrams of data, each packed into an int"""
+    grams = set(zip(data, data[1:], data[2:]))
+    return array.array('I', sorted((a << 16) | (b << 8) | c for a, b, c in grams))
+
+
+# Characters a case-insensitive match may find as something other than
+# their ASCII lowercase: non-ASCII letters, and the ASCII letters that
+# match a non-ASCII one (dotted and dotless I, the Kelvin sign, long s)
+_CASE_UNSTABLE = re.compile('[^\x00-\x7f]|[iksIKS]')
+
+
+def _literal_runs(pattern, ignore_case: bool = False) -> Iterator[str]:
+    """Literal strings every match of a parsed regex must contain"""
+    run = []
+    for op, value in pattern:
+        if op is sre_parse.LITERAL:
+            run.append(chr(value))
+            continue
+        if run:
+            yield from _case_stable(''.join(run), ignore_case)
+            run = []
+        if op is sre_parse.SUBPATTERN:
+            # A group matches its contents exactly once
+            group_case = (ignore_case or value[1] & re.IGNORECASE) and not value[2] & re.IGNORECASE
+            yield from _literal_runs(value[-1], group_case)
+        elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) and value[0] >= 1:
+            yield from _literal_runs(value[2], ignore_case)
+    if run:
+        yield from _case_stable(''.join(run), ignore_case)
+
+
+def _case_stable(literal: str, ignore_case: bool) -> List[str]:
+    """The parts of a literal whose lowercased bytes every match contains"""
+    return _CASE_UNSTABLE.split(literal) if ignore_case else [literal]
+
+
+def required_trigrams(pattern: str, extended: bool, ignore_case: bool = False) -> List[int]:
+    """Trigrams any line matching a grep pattern must contain (none if unknown)"""
+    if extended:
+        try:
+            parsed = sre_parse.parse(pattern)
+            # The global flags, including any inline (?i)
+            state = getattr(parsed, 'state', None) or parsed.pattern
+            literals = list(_literal_runs(parsed, ignore_case or bool(state.flags & re.IGNORECASE)))
+        except Exception:
+            return []
+    else:
+        literals = _case_stable(pattern, ignore_case)
+    keys = set()
+    for literal in literals:
+        keys.update(trigram_keys(literal.encode('utf-8', errors='surrogateescape').lower()))
+    return sorted(keys)
+
+
+def read_trigrams(path: str) -> Tuple[int, bytes]:
+    """(state, packed trigram keys) of one file, read in full"""
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(text_search.BINARY_SNIFF)
+            if b'\0' in head:
+                return BINARY, b''
+            data = (head + f.read()).lower()
+    except OSError:
+        return UNINDEXED, b''
+    return INDEXED, trigram_keys(data).tobytes()
+
+
+def _read_batch(paths: List[str]) -> List[Tuple[int, bytes]]:
+    return [read_trigrams(path) for path in paths]
+
+
+class TrigramIndex:
+    """A built index, memory-mapped read-only"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            fields = HEADER.unpack_from(self.map)
+            magic, version, little_endian, self.built, root_length, self.file_count, self.trigram_count = fields[:7]
+            if magic != MAGIC or version != VERSION or bool(little_endian) != (sys.byteorder == 'little'):
+                raise ValueError(f"{path}: not a trigram index of this version")
+            offsets = dict(zip(SECTIONS, fields[7:]))
+            view = memoryview(self.map)
+
+            def section(name: str, code: str, count: int):
+                start = offsets[name]
+                return view[start:start + count * array.array(code).itemsize].cast(code)
+
+            self.root = os.fsdecode(bytes(view[offsets['root']:offsets['root'] + root_length]))
+            self.mtimes = section('mtimes', 'q', self.file_count)
+            self.sizes = section('sizes', 'Q', self.file_count)
+            self.states = section('states', 'B', self.file_count)
+            self.path_offsets = section('path_offsets', 'Q', self.file_count + 1)
+            self.paths = view[offsets['paths']:offsets['paths'] + self.path_offsets[self.file_count]]
+            self.keys = section('keys', 'I', self.trigram_count)
+            self.posting_offsets = section('posting_offsets', 'Q', self.trigram_count + 1)
+            self.postings = section('postings', 'I', self.posting_offsets[self.trigram_count])
+        except Exception:
+            self.close()
+            raise
+
+    def file_path(self, file_id: int) -> str:
+        """A file's path relative to the root"""
+        return os.fsdecode(bytes(self.paths[self.path_offsets[file_id]:self.path_offsets[file_id + 1]]))
+
+    def files(self) -> Dict[str, Tuple[int, int, int, int]]:
+        """Relative path -> (file id, mtime in ns, size, state) of every file"""
+        return {self.file_path(file_id): (file_id, self.mtimes[file_id], self.sizes[file_id], self.states[file_id])
+                for file_id in range(self.file_count)}
+
+    def posting_list(self, key: int):
+        """Sorted ids of the indexed files containing a trigram"""
+        position = bisect.bisect_left(self.keys, key)
+        if position == self.trigram_count or self.keys[position] != key:
+            return self.postings[0:0]
+        return self.postings[self.posting_offsets[position]:self.posting_offsets[position + 1]]
+
+    def candidates(self, keys: Iterable[int], prefix: str = '') -> Iterator[str]:
+        """Relative paths, in walk order, of the files below prefix that may contain every trigram"""
+        lists = sorted((self.posting_list(key) for key in keys), key=len)
+        states = bytes(self.states)
+        if lists:
+            ids = set(lists[0])
+            for postings in lists[1:]:
+                if not ids:
+                    break
+                ids = {file_id for file_id in ids if self._contains(postings, file_id)}
+            # Binary files and files too large to index might contain anything
+            for state in (UNINDEXED, BINARY):
+                position = states.find(state)
+                while position >= 0:
+                    ids.add(position)
+                    position = states.find(state, position + 1)
+            ordered = sorted(ids)
+        else:
+            ordered = range(self.file_count)
+
+        below = prefix + os.sep if prefix else ''
+        for file_id in ordered:
+            path = self.file_path(file_id)
+            if not prefix or path.startswith(below):
+                yield path
+
+    def changes(self) -> Tuple[int, int]:
+        """(new or modified, deleted) files under the root since the index was built"""
+        files = self.files()
+        changed = 0
+        for entry, relative in text_search.walk_files(self.root, ''):
+            known = files.pop(relative, None)
+            try:
+                info = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            if known is None or known[1] != info.st_mtime_ns or known[2] != info.st_size:
+                changed += 1
+        return changed, len(files)
+
+    @staticmethod
+    def _contains(postings, file_id: int) -> bool:
+        position = bisect.bisect_left(postings, file_id)
+        return position < len(postings) and postings[position] == file_id
+
+    def close(self):
+        for name in ('mtimes', 'sizes', 'states', 'path_offsets', 'paths', 'keys', 'posting_offsets', 'postings'):
+            view = getattr(self, name, None)
+            if view is not None:
+                view.release()
+                setattr(self, name, None)
+        try:
+            self.map.close()
+        except BufferError:
+            pass  # A caller still holds a slice; the mapping goes with it
+
+    def __enter__(self) -> 'TrigramIndex':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class BuildStats(NamedTuple):
+    """What an index build did"""
+    files: int
+    read: int
+    reused: int
+    removed: int
+    trigrams: int
+    size: int
+    elapsed: float
+
+
+def _open_previous(path: str, root: str) -> Optional[TrigramIndex]:
+    try:
+        index = TrigramIndex(path)
+    except (OSError, ValueError):
+        return None
+    if index.root != root:
+        index.close()
+        return None
+    return index
+
+
+def build(root: str, directory: Optional[str] = None, errors: Optional[List[str]] = None) -> BuildStats:
+    """Build or refresh the index of a directory tree, rereading only changed files"""
+    start = time.perf_counter()
+    root = os.path.realpath(root)
+    target = index_file(root, directory)
+    previous = _open_previous(target, root)
+    old_files = previous.files() if previous is not None else {}
+
+    paths: List[str] = []
+    mtimes = array.array('q')
+    sizes = array.array('Q')
+    states = array.array('B')
+    renumber = array.array('i', [-1]) * (previous.file_count if previous is not None else 0)
+    to_read: List[int] = []
+    reused = 0
+
+    for entry, relative in text_search.walk_files(root, '', errors):
+        try:
+            info = entry.stat(follow_symlinks=False)
+        except OSError:
+            continue
+        file_id = len(paths)
+        paths.append(relative)
+        mtimes.append(info.st_mtime_ns)
+        sizes.append(info.st_size)
+        old = old_files.get(relative)
+        if old is not None and old[1] == info.st_mtime_ns and old[2] == info.st_size:
+            states.append(old[3])
+            renumber[old[0]] = file_id
+            reused += 1
+        elif info.st_size > MAX_FILE_SIZE:
+            states.append(UNINDEXED)
+        else:
+            states.append(INDEXED)
+            to_read.append(file_id)
+
+    if previous is not None and not to_read and reused == previous.file_count == len(paths):
+        # Nothing changed: the index on disk is current
+        previous.close()
+        return BuildStats(len(paths), 0, reused, 0, previous.trigram_count, os.path.getsize(target),
+                          time.perf_counter() - start)
+
+    # Postings of unchanged files, renumbered; the order of ids is kept
+    postings: Dict[int, array.array] = {}
+    if previous is not None:
+        for position in range(previous.trigram_count):
+            ids = previous.postings[previous.posting_offsets[position]:previous.posting_offsets[position + 1]]
+            kept = array.array('I', (new_id for new_id in map(renumber.__getitem__, ids) if new_id >= 0))
+            if kept:
+                postings[previous.keys[position]] = kept
+        previous.close()
+
+    # Trigrams of new and changed files, on the worker pool when there are many
+    full_paths = [os.path.join(root, paths[file_id]) for file_id in to_read]
+    if len(full_paths) >= text_search.PARALLEL_MIN_FILES and text_search.worker_count() > 1:
+        batches = (full_paths[index:index + BUILD_BATCH] for index in range(0, len(full_paths), BUILD_BATCH))
+        results = (result for batch in text_search.worker_pool().map(_read_batch, batches) for result in batch)
+    else:
+        results = map(read_trigrams, full_paths)
+    touched = set()
+    keys = array.array('I')
+    for file_id, (state, packed) in zip(to_read, results):
+        states[file_id] = state
+        if state != INDEXED:
+            continue
+        keys.frombytes(packed)
+        for key in keys:
+            ids = postings.get(key)
+            if ids is None:
+                postings[key] = array.array('I', [file_id])
+            else:
+                if ids[-1] > file_id:
+                    touched.add(key)
+                ids.append(file_id)
+        del keys[:]
+    for key in touched:
+        postings[key] = array.array('I', sorted(postings[key]))
+
+    size = _write(target, root, paths, mtimes, sizes, states, postings)
+    removed = len(old_files.keys() - set(paths))
+    return BuildStats(len(paths), len(to_read), reused, removed, len(postings), size, time.perf_counter() - start)
+
+
+def _write(target: str, root: str, paths: List[str], mtimes: array.array, sizes: array.array,
+           states: array.array, postings: Dict[int, array.array]) -> int:
+    """Write an index atomically, returning its size"""
+    encoded = [os.fsencode(path) for path in paths]
+    path_offsets = array.array('Q', [0])
+    total = 0
+    for path in encoded:
+        total += len(path)
+        path_offsets.append(total)
+    keys = array.array('I', sorted(postings))
+    posting_offsets = array.array('Q', [0])
+    all_postings = array.array('I')
+    for key in keys:
+        all_postings.extend(postings[key])
+        posting_offsets.append(len(all_postings))
+
+    sections = {
+        'root': os.fsencode(root), 'mtimes': mtimes.tobytes(), 'sizes': sizes.tobytes(),
+        'states': states.tobytes(), 'path_offsets': path_offsets.tobytes(), 'paths': b''.join(encoded),
+        'keys': keys.tobytes(), 'posting_offsets': posting_offsets.tobytes(), 'postings': all_postings.tobytes(),
+    }
+    offsets = []
+    position = HEADER.size
+    for name in SECTIONS:
+        position += -position % 8  # Keep the arrays aligned
+        offsets.append(position)
+        position += len(sections[name])
+
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    temporary = f"{target}.{os.getpid()}.tmp"
+    try:
+        with open(temporary, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, sys.byteorder == 'little', time.time(), len(sections['root']),
+                                len(paths), len(keys), *offsets))
+            for name, offset in zip(SECTIONS, offsets):
+                f.write(b'\0' * (offset - f.tell()))
+                f.write(sections[name])
+        # Readers keep the mapping of the file they opened
+        os.replace(temporary, target)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.unlink(temporary)
+        raise
+    return position
@@ -1,20 +1,59 @@
 # web_interface.py - Flask Web Interface
-from flask import Flask, render_template, request, jsonify, session
+from flask import Flask, render_template, request, jsonify, session, Response, stream_with_context
 import os
+import json
 import uuid
+import threading
 from terminal import PythonTerminal
+from spawn_server import SpawnServer
+from process_limits import ProcessLimits
+import history_store
+
+# Spawn helper that terminals launch external commands through instead of
+# forking the whole server; run_web_server starts it in the serving process
+spawner = None
 
 app = Flask(__name__)
 app.secret_key = os.urandom(24)
 
-# Store terminal instances per session
+# Store terminal instances per session. Requests are served on several
+# threads: each session's lock keeps its commands from running concurrently,
+# while different sessions run in parallel without sharing any state.
 terminals = {}
+session_locks = {}
+terminals_lock = threading.Lock()
+
+# Resource limits and priority every session starts with and cannot lift
+session_limits = ProcessLimits()
+
+# History database shared by all sessions; each session only sees the
+# entries recorded under its own session id
+history_path = history_store.default_path()
+
+def get_session(session_id):
+    """Get or create the terminal of a session and the lock its commands run under"""
+    with terminals_lock:
+        if session_id not in terminals:
+            terminals[session_id] = PythonTerminal(spawner=spawner, limits=session_limits,
+                                               history_path=history_path, history_owner=f"web:{session_id}")
+            session_locks[session_id] = threading.Lock()
+        return terminals[session_id], session_locks[session_id]
 
 def get_terminal(session_id):
     """Get or create terminal instance for session"""
-    if session_id not in terminals:
-        terminals[session_id] = PythonTerminal()
-    return terminals[session_id]
+    return get_session(session_id)[0]
+
+def end_session(session_id):
+    """Forget a session's terminal and release its resources"""
+    with terminals_lock:
+        terminal = terminals.pop(session_id, None)
+        session_locks.pop(session_id, None)
+    if terminal is not None:
+        terminal.close()
+
+def step_codes(terminal):
+    """Per-step return codes of the last command list; None marks a skipped step"""
+    return [{'command': command, 'returnCode': code} for command, code in terminal.last_step_codes]
 
 @app.route('/')
 def index():
@@ -39,27 +78,69 @@ def execute_command():
         if not session_id:
             return jsonify({'error': 'No session found'}), 400
         
-        terminal = get_terminal(session_id)
+        terminal, lock = get_session(session_id)
         
         # Execute command
-        output, return_code = terminal.execute_command(command)
+        with lock:
+            output, return_code = terminal.execute_command(command)
+            steps, prompt = step_codes(terminal), terminal.get_prompt()
+            exited = terminal.exit_requested
         
-        # Handle exit command
-        if output == "EXIT_TERMINAL":
+        # Handle exit command, keeping the output of the commands before it
+        if exited:
             # Clean up terminal instance
-            if session_id in terminals:
-                del terminals[session_id]
-            return jsonify({'output': 'Terminal session ended.', 'returnCode': 0, 'exit': True})
+            end_session(session_id)
+            output = (output + '\n' if output else '') + 'Terminal session ended.'
+            return jsonify({'output': output, 'returnCode': 0, 'exit': True})
         
         return jsonify({
             'output': output,
             'returnCode': return_code,
-            'prompt': terminal.get_prompt()
+            'steps': steps,
+            'prompt': prompt
         })
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/execute_stream', methods=['POST'])
+def execute_command_stream():
+    """Execute command and stream its output as newline-delimited JSON"""
+    try:
+        data = request.get_json()
+        command = data.get('command', '').strip()
+        
+        session_id = session.get('session_id')
+        if not session_id:
+            return jsonify({'error': 'No session found'}), 400
+        
+        terminal, lock = get_session(session_id)
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    
+    def generate():
+        # Each line is one JSON object: output chunks first, then a final
+        # status record with the return code and the new prompt
+        try:
+            with lock:
+                for chunk in terminal.execute_command_stream(command):
+                    yield json.dumps({'output': chunk}) + '\n'
+                if terminal.exit_requested:
+                    end_session(session_id)
+                    yield json.dumps({'output': 'Terminal session ended.', 'returnCode': 0, 'exit': True}) + '\n'
+                    return
+                
+                yield json.dumps({
+                    'returnCode': terminal.last_return_code,
+                    'steps': step_codes(terminal),
+                    'prompt': terminal.get_prompt()
+                }) + '\n'
+        except Exception as e:
+            yield json.dumps({'error': str(e)}) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 @app.route('/autocomplete', methods=['POST'])
 def autocomplete():
     """Provide command and file autocompletion"""
@@ -79,12 +160,7 @@ def autocomplete():
         
         # Command completion (first word)
         if not parts or (len(parts) == 1 and not line.endswith(' ')):
-            commands = list(terminal.builtin_commands.keys())
-            commands.extend(['python', 'git', 'npm', 'pip', 'node', 'java', 'gcc'])
-            
-            for cmd in commands:
-                if cmd.startswith(text):
-                    suggestions.append(cmd)
+            suggestions = terminal.complete_command(text)
         
         else:
             # File/directory completion
@@ -123,14 +199,31 @@ def autocomplete():
 
 @app.route('/history', methods=['GET'])
 def get_history():
-    """Get command history"""
+    """Get command history, newest page first; ?q= searches, ?page= and ?per_page= paginate"""
     try:
         session_id = session.get('session_id')
         if not session_id:
             return jsonify({'history': []})
         
         terminal = get_terminal(session_id)
-        return jsonify({'history': terminal.command_history[-50:]})  # Last 50 commands
+        query = request.args.get('q', '').strip()
+        page = max(request.args.get('page', 1, type=int), 1)
+        per_page = min(max(request.args.get('per_page', 50, type=int), 1), 500)
+        
+        # One extra entry tells whether another page follows; pages run newest first
+        if query:
+            entries = terminal.history.search(query, limit=per_page + 1, offset=(page - 1) * per_page)
+        else:
+            entries = terminal.history.newest(limit=per_page + 1, offset=(page - 1) * per_page)
+        has_more = len(entries) > per_page
+        entries = entries[:per_page]
+        
+        return jsonify({
+            'history': [entry.command for entry in reversed(entries)],  # Oldest first, for arrow keys
+            'entries': [entry.to_dict() for entry in entries],
+            'page': page,
+            'hasMore': has_more,
+        })
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -337,8 +430,44 @@ TERMINAL_HTML = '''
             output.appendChild(loadingDiv);
             scrollToBottom();
             
+            // Output chunks are appended to one block as they stream in
+            const outputDiv = document.createElement('div');
+            let exited = false;
+            
+            function handleRecord(data) {
+                if (data.error) {
+                    addToOutput(`Error: ${data.error}`, 'error');
+                    return;
+                }
+                
+                if (data.exit) {
+                    addToOutput('Terminal session ended.', 'info');
+                    input.disabled = true;
+                    exited = true;
+                    return;
+                }
+                
+                if (data.output) {
+                    // Handle special clear command
+                    if (data.output.includes('\033[2J\033[H')) {
+                        output.innerHTML = '';
+                    } else {
+                        if (!outputDiv.parentNode) {
+                            output.insertBefore(outputDiv, loadingDiv);
+                        }
+                        outputDiv.textContent += data.output;
+                        scrollToBottom();
+                    }
+                }
+                
+                // Update prompt
+                if (data.prompt) {
+                    prompt.textContent = data.prompt;
+                }
+            }
+            
             try {
-                const response = await fetch('/execute', {
+                const response = await fetch('/execute_stream', {
                     method: 'POST',
                     headers: {
                         'Content-Type': 'application/json'
@@ -346,40 +475,38 @@ TERMINAL_HTML = '''
                     body: JSON.stringify({ command })
                 });
                 
-                const data = await response.json();
-                
-                // Remove loading
-                output.removeChild(loadingDiv);
-                
-                if (data.error) {
-                    addToOutput(`Error: ${data.error}`, 'error');
+                if (!response.ok) {
+                    const data = await response.json();
+                    handleRecord({ error: data.error || response.statusText });
                 } else {
-                    if (data.output) {
-                        // Handle special clear command
-                        if (data.output.includes('\033[2J\033[H')) {
-                            output.innerHTML = '';
-                        } else {
-                            addToOutput(data.output);
-                        }
-                    }
+                    const reader = response.body.getReader();
+                    const decoder = new TextDecoder();
+                    let buffer = '';
                     
-                    // Update prompt
-                    if (data.prompt) {
-                        prompt.textContent = data.prompt;
-                    }
-                    
-                    // Handle exit
-                    if (data.exit) {
-                        addToOutput('Terminal session ended.', 'info');
-                        input.disabled = true;
-                        return;
+                    while (true) {
+                        const { value, done } = await reader.read();
+                        if (done) break;
+                        
+                        buffer += decoder.decode(value, { stream: true });
+                        let newline;
+                        while ((newline = buffer.indexOf('\\n')) >= 0) {
+                            const line = buffer.slice(0, newline);
+                            buffer = buffer.slice(newline + 1);
+                            if (line.trim()) handleRecord(JSON.parse(line));
+                        }
                     }
                 }
             } catch (error) {
-                output.removeChild(loadingDiv);
                 addToOutput(`Network error: ${error.message}`, 'error');
             }
             
+            // Remove loading
+            if (loadingDiv.parentNode) {
+                output.removeChild(loadingDiv);
+            }
+            
+            if (exited) return;
+            
             // Add command to history
             if (command.trim()) {
                 commandHistory.push(command);
@@ -588,12 +715,34 @@ def setup_templates():
     with open('templates/terminal.html', 'w') as f:
         f.write(TERMINAL_HTML)
 
-def run_web_server(host='127.0.0.1', port=5000, debug=True):
-    """Run the Flask web server"""
+def start_spawner():
+    """Start the spawn helper while this process is still small"""
+    global spawner
+    if spawner is None and SpawnServer.available():
+        spawner = SpawnServer().start()
+
+def stop_spawner():
+    global spawner
+    if spawner is not None:
+        spawner.stop()
+        spawner = None
+
+def run_web_server(host='127.0.0.1', port=5000, debug=True, limits=None):
+    """Run the Flask web server, optionally with ProcessLimits for every session"""
+    global session_limits
+    if limits is not None:
+        session_limits = limits
     setup_templates()
+    # The debug reloader's watcher process never serves requests; only the
+    # child it starts (marked by WERKZEUG_RUN_MAIN) needs a spawn helper
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_spawner()
     print(f"Starting Python Terminal Web Interface...")
     print(f"Open your browser and go to: http://{host}:{port}")
-    app.run(host=host, port=port, debug=debug)
+    try:
+        app.run(host=host, port=port, debug=debug, threaded=True)
+    finally:
+        stop_spawner()
 
 if __name__ == "__main__":
     run_web_server()
\ No newline at end of file